@@ -0,0 +1,240 @@
+"""Admission control with a bounded fair wait queue for Claude Code processes."""
+
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import AsyncGenerator
+
+from app.config import get_settings
+from app.users import users
+
+logger = logging.getLogger(__name__)
+
+# Seconds between queue position updates while waiting
+POSITION_INTERVAL = 1.0
+
+
+class AdmissionRejected(Exception):
+    """Request was not admitted: queue is full (429) or wait deadline passed (503)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def spread_retry_after(seconds: int) -> int:
+    """Randomize a Retry-After between seconds and twice that, so rejected clients do not all retry at once."""
+    return random.randint(seconds, seconds * 2)
+
+
+@dataclass
+class QueuePosition:
+    """Stream item reporting the queue position of a waiting request."""
+
+    position: int
+
+
+@dataclass
+class Ticket:
+    """Admission ticket for one request."""
+
+    user: str
+    cwd: str
+    enqueued_at: float
+    granted: asyncio.Future = field(repr=False)
+    active: bool = False
+
+
+class AdmissionController:
+    """
+    Global, per-user and per-cwd concurrency limits with a bounded FIFO queue.
+    Queued tickets are granted in arrival order, skipping tickets whose user or
+    cwd is at its limit, so one busy user cannot block everybody else.
+    """
+
+    def __init__(self):
+        self._queue: deque[Ticket] = deque()
+        self._active = 0
+        self._active_users: Counter[str] = Counter()
+        self._active_cwds: Counter[str] = Counter()
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def active(self) -> int:
+        """Get count of admitted requests."""
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """Get count of requests waiting for a slot."""
+        return len(self._queue)
+
+    def _fits(self, user: str, cwd: str) -> bool:
+        """Check if a request of user in cwd fits into all concurrency limits."""
+        settings = get_settings()
+        if settings.max_concurrent and self._active >= settings.max_concurrent:
+            return False
+        per_user = users.max_concurrent(user) or settings.max_concurrent_per_user
+        if per_user and self._active_users[user] >= per_user:
+            return False
+        if settings.max_concurrent_per_cwd and self._active_cwds[cwd] >= settings.max_concurrent_per_cwd:
+            return False
+        return True
+
+    def _can_run(self, ticket: Ticket) -> bool:
+        """Check if a ticket fits into all concurrency limits."""
+        return self._fits(ticket.user, ticket.cwd)
+
+    def _grant(self, ticket: Ticket) -> None:
+        """Mark ticket as admitted and count it against the limits."""
+        ticket.active = True
+        self._active += 1
+        self._active_users[ticket.user] += 1
+        self._active_cwds[ticket.cwd] += 1
+        if not ticket.granted.done():
+            ticket.granted.set_result(True)
+
+    def check(self, user: str, cwd: str) -> None:
+        """
+        Check without reserving anything that a request would be admitted or queued.
+        Raises AdmissionRejected (429) if it would have to queue and the queue is full.
+        """
+        if self._fits(user, cwd) or len(self._queue) < get_settings().queue_max_depth:
+            return
+        self._reject(user)
+
+    def _reject(self, user: str) -> None:
+        settings = get_settings()
+        self.rejected += 1
+        logger.warning(f"Admission queue full ({len(self._queue)}), rejecting request from {user}")
+        raise AdmissionRejected(
+            "Too many requests, queue is full",
+            status_code=429,
+            retry_after=settings.queue_retry_after,
+        )
+
+    def enter(self, user: str, cwd: str) -> Ticket:
+        """
+        Request a slot.
+        Returns a ticket that is either admitted immediately or queued.
+        Raises AdmissionRejected (429) if the queue is full.
+        """
+        settings = get_settings()
+        ticket = Ticket(
+            user=user,
+            cwd=cwd,
+            enqueued_at=time.monotonic(),
+            granted=asyncio.get_running_loop().create_future(),
+        )
+
+        # Queued tickets are always blocked by some limit (see _dispatch),
+        # so a ticket that fits now does not overtake anyone who could run
+        if self._can_run(ticket):
+            self._grant(ticket)
+            return ticket
+
+        if len(self._queue) >= settings.queue_max_depth:
+            self._reject(user)
+
+        self._queue.append(ticket)
+        logger.info(f"Request from {user} queued at position {len(self._queue)}")
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """Get 1-based queue position of a ticket (0 if not queued)."""
+        try:
+            return self._queue.index(ticket) + 1
+        except ValueError:
+            return 0
+
+    async def wait(self, ticket: Ticket) -> AsyncGenerator[int, None]:
+        """
+        Wait until the ticket is admitted.
+        Yields queue position whenever it changes.
+        Raises AdmissionRejected (503) if the queue deadline passes.
+        """
+        settings = get_settings()
+        deadline = ticket.enqueued_at + settings.queue_timeout
+        last_position = 0
+
+        try:
+            while not ticket.granted.done():
+                position = self.position(ticket)
+                if position != last_position:
+                    last_position = position
+                    yield position
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out += 1
+                    logger.warning(f"Request from {ticket.user} timed out in queue")
+                    raise AdmissionRejected(
+                        "Timed out waiting in queue",
+                        status_code=503,
+                        retry_after=settings.queue_retry_after,
+                    )
+
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(ticket.granted),
+                        timeout=min(POSITION_INTERVAL, remaining),
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            # Raises if the ticket was rejected (see close)
+            ticket.granted.result()
+        finally:
+            if not ticket.active:
+                self._remove(ticket)
+
+    def close(self, retry_after: int) -> None:
+        """Reject all queued requests with 503 (server is draining). Admitted requests keep running."""
+        for ticket in list(self._queue):
+            self._queue.remove(ticket)
+            if not ticket.granted.done():
+                ticket.granted.set_exception(AdmissionRejected(
+                    "Server is shutting down",
+                    status_code=503,
+                    retry_after=spread_retry_after(retry_after),
+                ))
+        logger.info("Admission closed, queue cleared")
+
+    def _remove(self, ticket: Ticket) -> None:
+        """Drop a waiting ticket from the queue."""
+        try:
+            self._queue.remove(ticket)
+        except ValueError:
+            pass
+        ticket.granted.cancel()
+        self._dispatch()
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot of an admitted ticket (or drop it from the queue) and admit waiters."""
+        if not ticket.active:
+            self._remove(ticket)
+            return
+
+        ticket.active = False
+        self._active -= 1
+        self._active_users[ticket.user] -= 1
+        if not self._active_users[ticket.user]:
+            del self._active_users[ticket.user]
+        self._active_cwds[ticket.cwd] -= 1
+        if not self._active_cwds[ticket.cwd]:
+            del self._active_cwds[ticket.cwd]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit queued tickets in order as long as limits allow."""
+        max_concurrent = get_settings().max_concurrent
+        for ticket in list(self._queue):
+            if max_concurrent and self._active >= max_concurrent:
+                break
+            if self._can_run(ticket):
+                self._queue.remove(ticket)
+                self._grant(ticket)
@@ -0,0 +1,65 @@
+"""Aggregation of a process stream into a single response."""
+
+import json
+import logging
+
+from app.events import event_type
+from app.line_reader import LongLine
+
+logger = logging.getLogger(__name__)
+
+
+class ResultAggregator:
+    """
+    Keeps only the state of a run needed for one JSON response: the result
+    event, the session id and optionally tool call counts. Works on raw
+    blocks, so lines are only parsed for the event types it needs and
+    oversized lines of other types are skipped without being read into memory.
+    """
+
+    def __init__(self, tool_summary: bool = False):
+        self.session_id: str | None = None
+        self.result: dict | None = None
+        self.tool_calls: dict[str, int] | None = {} if tool_summary else None
+        self.events = 0
+
+    def block(self, block: bytes) -> None:
+        """Process a block of newline-terminated lines."""
+        for line in block.split(b"\n"):
+            if line:
+                self._line(line, event_type(line))
+
+    async def long_line(self, line: LongLine) -> None:
+        """Process an oversized line, reading it only if it is needed."""
+        etype = event_type(line.head)
+        if etype == "result" or (etype == "assistant" and self.tool_calls is not None):
+            self._line(await line.read(), etype)
+        else:
+            self.events += 1
+            await line.discard()
+
+    def _line(self, line: bytes, etype: str | None) -> None:
+        self.events += 1
+        if etype not in ("system", "result", "assistant"):
+            return
+        if etype == "system" and self.session_id:
+            return
+        if etype == "assistant" and self.tool_calls is None:
+            return
+
+        try:
+            data = json.loads(line)
+        except ValueError:
+            logger.warning(f"Unparseable {etype} event ({len(line)} bytes)")
+            return
+
+        if etype == "system":
+            self.session_id = data.get("session_id")
+        elif etype == "result":
+            self.result = data
+            self.session_id = data.get("session_id") or self.session_id
+        else:
+            for block in (data.get("message") or {}).get("content") or []:
+                if block.get("type") == "tool_use":
+                    name = block.get("name", "unknown")
+                    self.tool_calls[name] = self.tool_calls.get(name, 0) + 1
@@ -1,44 +1,92 @@
-"""Basic authentication module."""
+"""Authentication: Basic Auth and bearer API keys, with per-key rate limits."""
 
+import base64
+import binascii
 import logging
-import secrets
 
-from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import Header, HTTPException, status
 
+from app import metrics
 from app.config import get_settings
+from app.users import RateLimited, users
 
 logger = logging.getLogger(__name__)
 
-security = HTTPBasic()
 
+def _unauthorized(detail: str, scheme: str) -> HTTPException:
+    metrics.auth_failures.inc()
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": scheme},
+    )
 
-def verify_credentials(
-    credentials: HTTPBasicCredentials = Depends(security),
-) -> str:
+
+def authenticate(authorization: str | None, challenge: str = "Basic") -> str:
     """
-    Verify Basic Auth credentials.
-    Returns username on success, raises 401 on failure.
+    Verify an Authorization header (Basic user:password, or Bearer API key
+    or user:password) and count the request against the key's limits.
+    Returns username on success, raises 401 on failure and 429 over a limit.
     """
-    settings = get_settings()
+    scheme, _, value = (authorization or "").partition(" ")
+    scheme = scheme.lower()
+    credential = value.strip()
+    if scheme == "basic":
+        try:
+            credential = base64.b64decode(credential).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            credential = ""
+    elif scheme != "bearer":
+        credential = ""
 
-    # Use secrets.compare_digest to prevent timing attacks
-    username_correct = secrets.compare_digest(
-        credentials.username.encode("utf-8"),
-        settings.auth_user.encode("utf-8")
-    )
-    password_correct = secrets.compare_digest(
-        credentials.password.encode("utf-8"),
-        settings.auth_password.encode("utf-8")
-    )
+    if not credential:
+        raise _unauthorized("Not authenticated", challenge)
 
-    if not (username_correct and password_correct):
-        logger.warning(f"Failed authentication attempt for user: {credentials.username}")
+    principal = users.authenticate(scheme, credential)
+    if principal is None:
+        logger.warning(f"Failed authentication attempt for user: {credential.partition(':')[0] if scheme == 'basic' else '<api key>'}")
+        raise _unauthorized("Invalid credentials", challenge)
+
+    try:
+        users.admit(principal)
+    except RateLimited as e:
+        logger.warning(f"{e} for key {principal.key_id} of user {principal.user}")
+        metrics.rate_limited.inc(principal.user)
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid credentials",
-            headers={"WWW-Authenticate": "Basic"},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
         )
 
-    logger.debug(f"Authenticated user: {credentials.username}")
-    return credentials.username
+    return principal.user
+
+
+def is_admin(username: str) -> bool:
+    """AUTH_USER sees and manages the entries of all users."""
+    return username == get_settings().auth_user
+
+
+def owns(username: str, owner: str | None) -> bool:
+    """Check if a user may see or change an entry (process, session, profile) of owner."""
+    return username == owner or is_admin(username)
+
+
+def verify_credentials(
+    authorization: str | None = Header(default=None),
+) -> str:
+    """
+    Verify Basic Auth credentials or a bearer API key.
+    Returns username on success, raises 401 on failure.
+    """
+    return authenticate(authorization)
+
+
+def verify_bearer_or_basic(
+    authorization: str | None = Header(default=None),
+) -> str:
+    """
+    Verify Basic Auth credentials, a bearer API key or a Bearer token of the
+    form user:password (the api_key of OpenAI clients).
+    Returns username on success, raises 401 on failure.
+    """
+    return authenticate(authorization, challenge="Bearer")
@@ -0,0 +1,255 @@
+"""
+Per-stream buffer between a process and its HTTP client, so a slow client
+does not stall the process.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+from app import metrics
+from app.broadcast import StreamGap
+from app.config import get_settings
+from app.line_reader import LongLine
+
+logger = logging.getLogger(__name__)
+
+# Partial message events (--include-partial-messages): the complete
+# assistant message follows, so they can be dropped for a slow client
+OPTIONAL_PREFIX = '{"type":"stream_event"'
+OPTIONAL_PREFIX_BYTES = OPTIONAL_PREFIX.encode("utf-8")
+
+
+class SlowConsumer(Exception):
+    """Raised to a client that fell too far behind the process (policy disconnect)."""
+
+
+@dataclass
+class _Spilled:
+    """A buffered item whose payload was written to the spill file."""
+
+    offset: int
+    length: int
+    text: bool
+    event_id: int | None
+
+
+def _size(payload) -> int:
+    if isinstance(payload, (str, bytes)):
+        return len(payload)
+    return 0
+
+
+def _drop_optional(payload: str | bytes) -> tuple[str | bytes | None, int]:
+    """Remove optional events from a line or block. Returns (rest or None, events dropped)."""
+    if isinstance(payload, str):
+        if payload.startswith(OPTIONAL_PREFIX):
+            return None, 1
+        return payload, 0
+    lines = payload.splitlines(keepends=True)
+    kept = [line for line in lines if not line.startswith(OPTIONAL_PREFIX_BYTES)]
+    if len(kept) == len(lines):
+        return payload, 0
+    return b"".join(kept) or None, len(lines) - len(kept)
+
+
+class StreamBuffer:
+    """
+    Reads a process stream at full speed into a buffer the client reads from.
+
+    Up to max_bytes of output are kept in memory. When the client falls
+    further behind, the policy decides:
+    - spill: further output goes to a temp file (up to spill_max_bytes,
+      then the client is disconnected), read back in order
+    - drop: partial message events are dropped and reported as a gap event;
+      other events are still buffered in memory
+    - disconnect: the stream ends with an error and the process is stopped,
+      like when the client goes away
+
+    Items stay in order; the spill file is reset whenever the client has
+    read everything written to it. An oversized line (LongLine) is passed
+    through as is and streamed from the pipe by the client, so reading
+    stops until the client got to it and read it.
+    """
+
+    def __init__(
+        self,
+        source: AsyncGenerator,
+        policy: str,
+        max_bytes: int,
+        spill_dir: str | None = None,
+        spill_max_bytes: int = 0,
+    ):
+        self._source = source
+        self._policy = policy
+        self._max_bytes = max_bytes
+        self._spill_dir = spill_dir
+        self._spill_max_bytes = spill_max_bytes
+        self._items: deque = deque()
+        self._memory_bytes = 0
+        self._spill_fd: int | None = None
+        self._spill_bytes = 0
+        self._spilled_items = 0
+        self._spill_lock = asyncio.Lock()
+        self._ready = asyncio.Event()
+        self._long_line_done = asyncio.Event()
+        self._finished = False
+        self._error: BaseException | None = None
+        self._task: asyncio.Task | None = None
+        self.overflowed = False
+
+    async def _pump(self) -> None:
+        """Read the source into the buffer."""
+        try:
+            async for item in self._source:
+                event_id = None
+                if isinstance(item, tuple):
+                    event_id, item = item
+                if isinstance(item, LongLine):
+                    # Must be read before the next item: wait for the client to stream it
+                    self._long_line_done.clear()
+                    self._append(event_id, item, 0)
+                    self._ready.set()
+                    await self._long_line_done.wait()
+                    continue
+                await self._put(event_id, item)
+                self._ready.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._error = e
+        finally:
+            self._finished = True
+            self._ready.set()
+
+    async def _put(self, event_id: int | None, payload) -> None:
+        size = _size(payload)
+        # An item that does not fit is still taken while the client has read everything
+        if not size or self._memory_bytes + size <= self._max_bytes or not self._items:
+            self._append(event_id, payload, size)
+            return
+
+        if not self.overflowed:
+            self.overflowed = True
+            metrics.slow_clients.inc(self._policy)
+            logger.info(f"Client fell {self._memory_bytes + size} bytes behind, applying slow client policy {self._policy}")
+
+        if self._policy == "drop":
+            payload, dropped = _drop_optional(payload)
+            if dropped:
+                metrics.slow_client_dropped.inc(amount=dropped)
+                self._add_gap(dropped)
+            if payload is not None:
+                self._append(event_id, payload, _size(payload))
+            return
+
+        if self._policy == "spill" and (not self._spill_max_bytes or self._spill_bytes + size <= self._spill_max_bytes):
+            await self._spill(event_id, payload)
+            return
+
+        self._disconnect(f"Client too slow: {self._memory_bytes + self._spill_bytes + size} bytes behind")
+
+    def _append(self, event_id: int | None, payload, size: int) -> None:
+        self._items.append((event_id, payload) if event_id is not None else payload)
+        self._memory_bytes += size
+
+    def _add_gap(self, dropped: int) -> None:
+        """Report dropped events at their position, merged with a gap right before."""
+        if self._items and isinstance(self._items[-1], StreamGap):
+            self._items[-1].missed += dropped
+        else:
+            self._items.append(StreamGap(missed=dropped))
+
+    def _open_spill_file(self) -> int:
+        fd, path = tempfile.mkstemp(prefix="claude-stream-", dir=self._spill_dir)
+        os.unlink(path)
+        return fd
+
+    async def _spill(self, event_id: int | None, payload: str | bytes) -> None:
+        """Write an item to the spill file (in a thread, the file may be on a slow disk)."""
+        text = isinstance(payload, str)
+        data = payload.encode("utf-8") if text else payload
+        async with self._spill_lock:
+            if self._spill_fd is None:
+                self._spill_fd = await asyncio.to_thread(self._open_spill_file)
+            offset = self._spill_bytes
+            await asyncio.to_thread(os.pwrite, self._spill_fd, data, offset)
+            self._spill_bytes += len(data)
+            self._spilled_items += 1
+            self._items.append(_Spilled(offset, len(data), text, event_id))
+
+    def _read_spill_file(self, entry: _Spilled, reset: bool) -> bytes:
+        data = os.pread(self._spill_fd, entry.length, entry.offset)
+        if reset:
+            os.ftruncate(self._spill_fd, 0)
+        return data
+
+    async def _read_spilled(self, entry: _Spilled):
+        async with self._spill_lock:
+            self._spilled_items -= 1
+            # Client caught up with the file: reuse it from the start
+            reset = not self._spilled_items
+            data = await asyncio.to_thread(self._read_spill_file, entry, reset)
+            if reset:
+                self._spill_bytes = 0
+        payload = data.decode("utf-8") if entry.text else data
+        return (entry.event_id, payload) if entry.event_id is not None else payload
+
+    def _disconnect(self, message: str) -> None:
+        """End the client's stream and stop reading (which terminates the process)."""
+        logger.warning(message)
+        self._error = SlowConsumer(message)
+        self._items.clear()
+        self._finished = True
+        self._ready.set()
+        self._task.cancel()
+
+    async def stream(self) -> AsyncGenerator:
+        """Yield buffered items in order until the source finishes."""
+        self._task = asyncio.create_task(self._pump())
+        try:
+            while True:
+                if self._items:
+                    entry = self._items.popleft()
+                    if isinstance(entry, _Spilled):
+                        yield await self._read_spilled(entry)
+                        continue
+                    payload = entry[1] if isinstance(entry, tuple) else entry
+                    self._memory_bytes -= _size(payload)
+                    yield entry
+                    if isinstance(payload, LongLine):
+                        self._long_line_done.set()
+                    continue
+                if self._finished:
+                    if self._error:
+                        raise self._error
+                    return
+                self._ready.clear()
+                await self._ready.wait()
+        finally:
+            if not self._task.done():
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            if self._spill_fd is not None:
+                os.close(self._spill_fd)
+
+
+def buffer_stream(stream: AsyncGenerator) -> AsyncGenerator:
+    """Put a slow-client buffer in front of a stream (unless SLOW_CLIENT_POLICY is block)."""
+    settings = get_settings()
+    if settings.slow_client_policy == "block":
+        return stream
+    return StreamBuffer(
+        stream,
+        policy=settings.slow_client_policy,
+        max_bytes=settings.stream_buffer_bytes,
+        spill_dir=settings.spill_dir,
+        spill_max_bytes=settings.slow_client_spill_max_bytes,
+    ).stream()
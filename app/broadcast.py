@@ -0,0 +1,178 @@
+"""Broadcast of one process output stream to several subscribers."""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncGenerator
+
+from app.line_reader import LongLine
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StreamGap:
+    """Stream item telling a resuming subscriber that older events were dropped."""
+
+    missed: int
+
+
+def _item_size(item) -> int:
+    """Approximate size of a stream item in bytes."""
+    if isinstance(item, (str, bytes)):
+        return len(item)
+    return 0
+
+
+class StreamBroadcast:
+    """
+    Output of one process shared by several subscribers.
+
+    A pump task reads the source stream into a buffer. Every subscriber reads
+    the buffer from its first retained item (so late joiners get a replay of
+    earlier events) and then follows new items. The pump waits while the
+    slowest subscriber is more than max_pending items behind.
+
+    Items are retained for replay up to replay_max_bytes; after that no new
+    subscribers can join and items read by everyone are dropped, except for
+    the last ring_bytes of output, which stay available for resuming by
+    event index.
+    """
+
+    def __init__(
+        self,
+        source: AsyncGenerator,
+        max_pending: int,
+        replay_max_bytes: int,
+        ring_bytes: int = 0,
+    ):
+        self._source = source
+        self._max_pending = max_pending
+        self._replay_max_bytes = replay_max_bytes
+        self._ring_bytes = ring_bytes
+        self._items: list = []
+        self._offset = 0  # absolute index of self._items[0]
+        self._buffer_bytes = 0
+        self._positions: dict[str, int] = {}
+        self._detached: set[str] = set()
+        self._changed = asyncio.Event()
+        self._advanced = asyncio.Event()
+        self.retain = True
+        self.finished = False
+        self.error: BaseException | None = None
+        self.task: asyncio.Task | None = None
+
+    @property
+    def joinable(self) -> bool:
+        """Check if a new subscriber still gets the complete output."""
+        return self.retain and not self.finished
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._positions)
+
+    def start(self) -> None:
+        """Start the pump task."""
+        self.task = asyncio.create_task(self._pump())
+
+    def _notify(self) -> None:
+        """Wake up subscribers waiting for new items."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _pump(self) -> None:
+        """Read source into the buffer."""
+        try:
+            async for item in self._source:
+                # Oversized lines cannot be streamed to several readers, keep them whole
+                if isinstance(item, LongLine):
+                    item = await item.read() + b"\n"
+
+                self._items.append(item)
+                self._buffer_bytes += _item_size(item)
+                if self.retain and self._buffer_bytes > self._replay_max_bytes:
+                    logger.debug("Broadcast replay buffer full, closing it to new subscribers")
+                    self.retain = False
+                self._notify()
+
+                while self._positions and self._offset + len(self._items) - self._slowest() > self._max_pending:
+                    self._advanced.clear()
+                    await self._advanced.wait()
+                self._trim()
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._notify()
+
+    def _slowest(self) -> int:
+        """Get absolute index of the slowest subscriber."""
+        return min(self._positions.values(), default=self._offset + len(self._items))
+
+    def _trim(self) -> None:
+        """Drop items every subscriber has read, unless they are kept for replay or the ring."""
+        if self.retain:
+            return
+        slowest = self._slowest()
+        drop = 0
+        while (
+            drop < len(self._items)
+            and self._offset + drop < slowest
+            and self._buffer_bytes > self._ring_bytes
+        ):
+            self._buffer_bytes -= _item_size(self._items[drop])
+            drop += 1
+        if drop:
+            del self._items[:drop]
+            self._offset += drop
+
+    async def subscribe(
+        self,
+        subscriber_id: str,
+        start: int | None = None,
+        with_ids: bool = False,
+    ) -> AsyncGenerator:
+        """
+        Yield retained items, then follow the stream until it finishes or detach() is called.
+        start is the absolute index to resume from; if those items were already
+        dropped, a StreamGap is yielded first. With with_ids, items are yielded
+        as (index, item) tuples.
+        """
+        index = self._offset
+        if start is not None and start > index:
+            index = min(start, self._offset + len(self._items))
+        self._positions[subscriber_id] = index
+        try:
+            if start is not None and start < self._offset:
+                yield StreamGap(missed=self._offset - start)
+
+            while True:
+                while index < self._offset + len(self._items) and subscriber_id not in self._detached:
+                    item = self._items[index - self._offset]
+                    index += 1
+                    self._positions[subscriber_id] = index
+                    self._advanced.set()
+                    yield (index - 1, item) if with_ids else item
+
+                if subscriber_id in self._detached:
+                    return
+                if self.finished:
+                    if self.error:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self._positions.pop(subscriber_id, None)
+            self._detached.discard(subscriber_id)
+            self._advanced.set()
+            if not self.finished:
+                self._trim()
+
+    def detach(self, subscriber_id: str) -> None:
+        """End one subscriber's stream after the item it is currently reading."""
+        if subscriber_id in self._positions:
+            self._detached.add(subscriber_id)
+            self._notify()
@@ -0,0 +1,287 @@
+"""Response cache for repeated prompts: in-memory LRU tier and disk tier with TTL."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncGenerator
+
+from app import metrics
+from app.claude import build_command
+from app.config import get_settings
+from app.line_reader import LongLine
+from app.models import CacheStats, ChatRequest
+
+logger = logging.getLogger(__name__)
+
+# Directories skipped by the cwd fingerprint
+FINGERPRINT_SKIP_DIRS = {".git", "__pycache__", "node_modules"}
+
+
+def fingerprint_cwd(path: str, max_files: int) -> str | None:
+    """
+    Hash names, sizes and mtimes of all files under path.
+    Returns None if the tree has more than max_files files.
+    """
+    digest = hashlib.sha256()
+    count = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in FINGERPRINT_SKIP_DIRS)
+        for name in sorted(files):
+            count += 1
+            if count > max_files:
+                return None
+            file_path = os.path.join(root, name)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(file_path, path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def request_key(request: ChatRequest, **extra) -> str:
+    """Hash of everything in a request that affects the output (CLI command and cwd) plus extra fields."""
+    parts = {"cwd": request.cwd, "cmd": build_command(request)[1:], **extra}
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Capture:
+    """Output of one run being recorded for the cache."""
+
+    __slots__ = ("key", "parts", "size", "max_size", "succeeded")
+
+    def __init__(self, key: str, max_size: int):
+        self.key = key
+        self.parts: list[bytes] = []
+        self.size = 0
+        self.max_size = max_size
+        self.succeeded = False
+
+    @property
+    def overflowed(self) -> bool:
+        return self.size > self.max_size
+
+    def _add(self, data: bytes) -> None:
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.parts.clear()
+        else:
+            self.parts.append(data)
+
+    def line(self, line: str) -> None:
+        """Record one decoded output line."""
+        if self.overflowed:
+            return
+        self._add(line.encode("utf-8") + b"\n")
+        if '"type":"result"' in line[:100] and '"subtype":"success"' in line[:200]:
+            self.succeeded = True
+
+    def block(self, block: bytes) -> None:
+        """Record a raw block of newline-terminated lines."""
+        if self.overflowed:
+            return
+        self._add(block)
+        start = block.find(b'{"type":"result"')
+        if start >= 0 and b'"subtype":"success"' in block[start:start + 200]:
+            self.succeeded = True
+
+    def long_line(self) -> None:
+        """Oversized lines are not cached."""
+        self.size = self.max_size + 1
+        self.parts.clear()
+
+
+class ResponseCache:
+    """
+    Cache of recorded output for requests that produce the same result.
+
+    Keyed by a hash of the CLI command (prompt, model, system prompt, tools,
+    json_schema, ...) and cwd, optionally with a cwd content fingerprint.
+    Entries live in a memory LRU bounded by bytes and, if configured, in a
+    disk directory; both expire after the TTL.
+    """
+
+    def __init__(self):
+        self._memory: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return get_settings().cache_enabled
+
+    async def make_key(self, request: ChatRequest, user: str) -> str | None:
+        """
+        Get cache key for a request of user, or None if it must not be cached.
+        Entries are per user; requests resuming a session are never cached.
+        """
+        if not self.enabled or not request.cache or request.session_id:
+            return None
+
+        settings = get_settings()
+        if not request.cache_fingerprint_cwd:
+            return request_key(request, user=user)
+
+        fingerprint = await asyncio.to_thread(
+            fingerprint_cwd, request.cwd, settings.cache_fingerprint_max_files
+        )
+        if fingerprint is None:
+            logger.debug(f"Cache skipped: too many files in {request.cwd}")
+            return None
+        return request_key(request, user=user, fingerprint=fingerprint)
+
+    def _disk_path(self, key: str) -> Path | None:
+        disk_dir = get_settings().cache_disk_dir
+        if not disk_dir:
+            return None
+        return Path(disk_dir) / f"{key}.jsonl"
+
+    async def get(self, key: str) -> bytes | None:
+        """Look up recorded output for a key (memory first, then disk)."""
+        ttl = get_settings().cache_ttl
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            stored_at, data = entry
+            if now - stored_at < ttl:
+                self._memory.move_to_end(key)
+                return self._hit(data)
+            self._evict(key)
+
+        path = self._disk_path(key)
+        if path is not None:
+            data = await asyncio.to_thread(self._read_disk, path, ttl)
+            if data is not None:
+                self._put_memory(key, data, path.stat().st_mtime)
+                return self._hit(data)
+
+        self.misses += 1
+        metrics.cache_lookups.inc("miss")
+        return None
+
+    def _hit(self, data: bytes) -> bytes:
+        self.hits += 1
+        self.bytes_saved += len(data)
+        metrics.cache_lookups.inc("hit")
+        metrics.cache_bytes_saved.inc(amount=len(data))
+        return data
+
+    @staticmethod
+    def _read_disk(path: Path, ttl: float) -> bytes | None:
+        """Read disk entry, removing it if expired."""
+        try:
+            if time.time() - path.stat().st_mtime >= ttl:
+                path.unlink()
+                return None
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def capture(self, key: str) -> Capture:
+        """Start recording output for a key."""
+        return Capture(key, get_settings().cache_max_entry_bytes)
+
+    async def store(self, capture: Capture) -> None:
+        """Store a recorded run if it succeeded and fits into the entry limit."""
+        if not capture.succeeded or capture.overflowed:
+            return
+
+        data = b"".join(capture.parts)
+        now = time.time()
+        self._put_memory(capture.key, data, now)
+
+        path = self._disk_path(capture.key)
+        if path is not None:
+            await asyncio.to_thread(self._write_disk, path, data)
+
+        logger.debug(f"Cached response {capture.key[:12]} ({len(data)} bytes)")
+
+    def _put_memory(self, key: str, data: bytes, stored_at: float) -> None:
+        """Insert into memory LRU and evict least recently used entries over budget."""
+        budget = get_settings().cache_memory_max_bytes
+        if len(data) > budget:
+            return
+        self._evict(key)
+        self._memory[key] = (stored_at, data)
+        self._memory_bytes += len(data)
+        while self._memory_bytes > budget:
+            oldest = next(iter(self._memory))
+            self._evict(oldest)
+
+    def _evict(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+
+    @staticmethod
+    def _write_disk(path: Path, data: bytes) -> None:
+        """Write disk entry atomically and trim the directory to its byte budget."""
+        settings = get_settings()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Unique temp file: concurrent stores of the same key do not write into each other
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+        entries = []
+        total = 0
+        for entry in path.parent.glob("*.jsonl"):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+        entries.sort()
+        now = time.time()
+        for mtime, size, entry in entries:
+            if total <= settings.cache_disk_max_bytes and now - mtime < settings.cache_ttl:
+                continue
+            entry.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Drop all memory and disk entries."""
+        self._memory.clear()
+        self._memory_bytes = 0
+        disk_dir = get_settings().cache_disk_dir
+        if disk_dir and os.path.isdir(disk_dir):
+            for entry in Path(disk_dir).glob("*.jsonl"):
+                entry.unlink(missing_ok=True)
+
+    def stats(self) -> CacheStats:
+        """Get cache counters."""
+        lookups = self.hits + self.misses
+        return CacheStats(
+            enabled=self.enabled,
+            entries=len(self._memory),
+            memory_bytes=self._memory_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / lookups if lookups else 0.0,
+            bytes_saved=self.bytes_saved,
+        )
+
+
+async def replay(data: bytes, raw: bool) -> AsyncGenerator[str | bytes | LongLine, None]:
+    """Replay recorded output as a stream, in the same shape run_claude yields."""
+    if raw:
+        yield data
+        return
+    for line in data.decode("utf-8", errors="ignore").split("\n"):
+        if line:
+            yield line
@@ -0,0 +1,87 @@
+"""Node capacity for load balancers: admission counters, memory, load and spawn failures."""
+
+import logging
+import os
+import time
+from collections import deque
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Seconds of spawn attempts counted in the failure rate
+SPAWN_WINDOW = 60.0
+# Spawn attempts needed in the window before the failure rate marks the node not ready
+SPAWN_MIN_SAMPLES = 5
+
+
+class SpawnTracker:
+    """Outcomes of recent CLI spawn attempts (sliding window)."""
+
+    def __init__(self):
+        self._attempts: deque[tuple[float, bool]] = deque(maxlen=10000)
+        self.total = 0
+        self.failures = 0
+
+    def record(self, ok: bool) -> None:
+        self._attempts.append((time.monotonic(), ok))
+        self.total += 1
+        if not ok:
+            self.failures += 1
+
+    def recent(self) -> tuple[int, int]:
+        """Get (attempts, failures) in the last SPAWN_WINDOW seconds."""
+        cutoff = time.monotonic() - SPAWN_WINDOW
+        while self._attempts and self._attempts[0][0] < cutoff:
+            self._attempts.popleft()
+        failures = sum(1 for _, ok in self._attempts if not ok)
+        return len(self._attempts), failures
+
+
+def memory_info() -> tuple[int | None, int | None]:
+    """Get (available, total) memory in bytes from /proc/meminfo, None where unknown."""
+    values = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("MemAvailable", "MemTotal"):
+                    values[name] = int(rest.split()[0]) * 1024
+                    if len(values) == 2:
+                        break
+    except (OSError, ValueError) as e:
+        logger.debug(f"Could not read /proc/meminfo: {e}")
+    return values.get("MemAvailable"), values.get("MemTotal")
+
+
+def load_average() -> float | None:
+    """Get the 1-minute load average."""
+    try:
+        return os.getloadavg()[0]
+    except OSError:
+        return None
+
+
+def available_slots(running: int, queue_depth: int, memory_available: int | None, load: float | None) -> int | None:
+    """
+    Get how many more processes the node can start right away: the free
+    admission slots, capped by the processes that fit in available memory,
+    zero when the load per CPU is over CAPACITY_MAX_LOAD_PER_CPU, less
+    the requests already queued. None if nothing limits it.
+    """
+    settings = get_settings()
+    limits = []
+    if settings.max_concurrent:
+        limits.append(settings.max_concurrent - running)
+    if memory_available is not None:
+        per_process = settings.limit_memory_bytes or settings.capacity_process_memory_bytes
+        limits.append((memory_available - settings.capacity_memory_reserve_bytes) // per_process)
+    if load is not None and load / (os.cpu_count() or 1) >= settings.capacity_max_load_per_cpu:
+        limits.append(0)
+    if not limits:
+        return None
+    return max(0, min(limits) - queue_depth)
+
+
+# Global spawn tracker instance
+spawns = SpawnTracker()
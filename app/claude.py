@@ -4,17 +4,36 @@ import asyncio
 import json
 import logging
 import os
-from typing import AsyncGenerator
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, Callable
 
+from app import metrics
+from app.capacity import spawns
 from app.config import get_claude_path, get_settings
+from app.events import event_type
+from app.line_reader import READ_CHUNK_SIZE, ChunkedLineReader, LongLine
+from app.logs import LineSampler
 from app.models import ChatRequest
+from app.profiles import profiles
+
+if TYPE_CHECKING:
+    from app.limits import ResourceMonitor
+    from app.warm_pool import WarmProcess
 
 logger = logging.getLogger(__name__)
 
+# Start of a result event line (type is always the first key in stream-json)
+RESULT_MARKER = b'{"type":"result"'
 
-def build_command(request: ChatRequest) -> list[str]:
+
+def json_arg(value) -> str:
+    """Serialize a JSON argument, reusing the serialization stored with a profile."""
+    return profiles.serialized(value) or json.dumps(value)
+
+
+def build_base_command(request: ChatRequest) -> list[str]:
     """
-    Build Claude Code CLI command from request parameters.
+    Build Claude Code CLI command from request parameters, without the prompt.
 
     Permission logic:
     - If tools or allowed_tools are set: runs in restricted mode (no --dangerously-skip-permissions)
@@ -93,28 +112,111 @@ def build_command(request: ChatRequest) -> list[str]:
 
     # JSON Schema
     if request.json_schema:
-        cmd.extend(["--json-schema", json.dumps(request.json_schema)])
+        cmd.extend(["--json-schema", json_arg(request.json_schema)])
 
     # Agents
     if request.agents:
-        cmd.extend(["--agents", json.dumps(request.agents)])
+        cmd.extend(["--agents", json_arg(request.agents)])
 
     # Plugin directories
     if request.plugin_dir:
         cmd.extend(["--plugin-dir"] + request.plugin_dir)
 
+    # Partial message events
+    if request.include_partial_messages:
+        cmd.append("--include-partial-messages")
+
+    return cmd
+
+
+def build_command(request: ChatRequest) -> list[str]:
+    """Build full Claude Code CLI command, prompt passed as -p argument."""
+    cmd = build_base_command(request)
+
     # Prompt (must be last with -p flag)
     cmd.extend(["-p", request.prompt])
 
     return cmd
 
 
-async def run_claude(request: ChatRequest) -> AsyncGenerator[str, None]:
+def build_warm_command(request: ChatRequest) -> list[str]:
+    """
+    Build Claude Code CLI command for a warm (pre-spawned) process.
+    The prompt is not known yet, it is sent later as a stream-json message on stdin.
+    """
+    cmd = build_base_command(request)
+    cmd.extend(["--input-format", "stream-json", "-p"])
+    return cmd
+
+
+def format_user_message(prompt: str) -> bytes:
+    """Encode prompt as a stream-json user message line for stdin."""
+    message = {
+        "type": "user",
+        "message": {
+            "role": "user",
+            "content": [{"type": "text", "text": prompt}],
+        },
+    }
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+async def spawn_claude(
+    cmd: list[str],
+    cwd: str,
+    stdin: bool = False,
+    preexec_fn: Callable[[], None] | None = None,
+) -> asyncio.subprocess.Process:
+    """
+    Start Claude Code subprocess with piped stdout/stderr (and stdin if requested).
+    Output is read in chunks, so the pipe buffer stays at READ_CHUNK_SIZE
+    regardless of line length (see ChunkedLineReader).
+    preexec_fn runs in the child before exec (see ResourceMonitor.prepare).
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=os.environ.copy(),
+            limit=READ_CHUNK_SIZE,
+            preexec_fn=preexec_fn,
+        )
+    except OSError:
+        spawns.record(ok=False)
+        metrics.spawn_failures.inc()
+        raise
+    spawns.record(ok=True)
+    return process
+
+
+async def run_claude(
+    request: ChatRequest,
+    warm: "WarmProcess | None" = None,
+    raw: bool = False,
+    monitor: "ResourceMonitor | None" = None,
+) -> AsyncGenerator[str | bytes | LongLine, None]:
     """
     Run Claude Code subprocess and yield output lines.
     Yields raw JSON lines from Claude Code stdout.
+
+    In raw mode, yields undecoded byte blocks of complete lines instead,
+    and LongLine items for lines over the buffer limit (see _read_blocks).
+
+    If a warm process is given, the prompt is written to its stdin instead of
+    spawning a new subprocess, and reading stops after the turn's result event.
+    The warm process is left running; the caller returns it to the pool.
+
+    A resource monitor, if given, is attached to the process; output stops and
+    the process is terminated when a limit is exceeded.
     """
-    settings = get_settings()
+    if warm is not None:
+        async for item in _run_warm(request, warm, raw, monitor):
+            yield item
+        return
+
     cmd = build_command(request)
 
     # Log command (hide prompt for brevity)
@@ -124,38 +226,29 @@ async def run_claude(request: ChatRequest) -> AsyncGenerator[str, None]:
     logger.info(f"Running Claude: {' '.join(cmd_display)}")
     logger.debug(f"Working directory: {request.cwd}")
 
-    # Start subprocess with large buffer
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        cwd=request.cwd,
-        env=os.environ.copy(),
-        limit=settings.buffer_limit,
-    )
+    # Start subprocess
+    spawn_started = time.monotonic()
+    process = await spawn_claude(cmd, request.cwd, preexec_fn=monitor.prepare() if monitor else None)
 
     logger.info(f"Claude subprocess started with PID: {process.pid}")
+    if monitor:
+        monitor.attach(process, lambda: terminate_process(process))
 
     # Read stdout line by line
     try:
-        while True:
-            line = await process.stdout.readline()
-            if not line:
-                break
-
-            decoded = line.decode("utf-8", errors="ignore").rstrip()
-            if decoded:
-                logger.debug(f"Claude output: {decoded[:200]}{'...' if len(decoded) > 200 else ''}")
-                yield decoded
+        first = True
+        async for item in _read_output(process, raw, until_result=False):
+            if first:
+                first = False
+                metrics.spawn_seconds.observe(time.monotonic() - spawn_started, request.model or "", "false")
+            if monitor and not monitor.output(output_size(item)):
+                await terminate_process(process)
+                return
+            yield item
 
     except asyncio.CancelledError:
         logger.warning(f"Claude subprocess cancelled, terminating PID: {process.pid}")
-        process.terminate()
-        try:
-            await asyncio.wait_for(process.wait(), timeout=5.0)
-        except asyncio.TimeoutError:
-            logger.warning(f"Force killing PID: {process.pid}")
-            process.kill()
+        await terminate_process(process)
         raise
 
     except Exception as e:
@@ -163,9 +256,14 @@ async def run_claude(request: ChatRequest) -> AsyncGenerator[str, None]:
         raise
 
     finally:
+        if monitor:
+            monitor.sample()
         # Wait for process to complete
         return_code = await process.wait()
         logger.info(f"Claude subprocess finished with code: {return_code}")
+        if monitor:
+            monitor.exit_code = return_code
+        metrics.exit_codes.inc(str(return_code))
 
         # Log stderr if any
         if process.stderr:
@@ -173,3 +271,148 @@ async def run_claude(request: ChatRequest) -> AsyncGenerator[str, None]:
             if stderr:
                 stderr_text = stderr.decode("utf-8", errors="ignore")
                 logger.warning(f"Claude stderr: {stderr_text[:500]}")
+
+
+async def _run_warm(
+    request: ChatRequest,
+    warm: "WarmProcess",
+    raw: bool,
+    monitor: "ResourceMonitor | None",
+) -> AsyncGenerator[str | bytes | LongLine, None]:
+    """Feed prompt to a warm process and yield its output until the result event."""
+    process = warm.process
+    logger.info(f"Using warm Claude process PID {process.pid} (<prompt: {len(request.prompt)} chars>)")
+    if monitor:
+        monitor.attach(process, lambda: terminate_process(process), fresh=False)
+
+    try:
+        prompt_sent = time.monotonic()
+        process.stdin.write(format_user_message(request.prompt))
+        await process.stdin.drain()
+
+        first = True
+        async for item in _read_output(process, raw, until_result=True):
+            if first:
+                first = False
+                metrics.spawn_seconds.observe(time.monotonic() - prompt_sent, request.model or "", "true")
+            if monitor and not monitor.output(output_size(item)):
+                await terminate_process(process)
+                return
+            yield item
+        if monitor:
+            monitor.sample()
+
+    except asyncio.CancelledError:
+        logger.warning(f"Warm Claude process cancelled, terminating PID: {process.pid}")
+        await terminate_process(process)
+        raise
+
+    except Exception as e:
+        logger.error(f"Error reading warm Claude output: {e}")
+        await terminate_process(process)
+        raise
+
+
+def _read_output(
+    process: asyncio.subprocess.Process,
+    raw: bool,
+    until_result: bool,
+) -> AsyncGenerator[str | bytes | LongLine, None]:
+    """Select stdout reader: decoded lines or raw byte blocks."""
+    if raw:
+        return _read_blocks(process, until_result)
+    return _read_lines(process, until_result)
+
+
+def _output_sampler() -> LineSampler | None:
+    """Rate limit for per-line output logs, None if DEBUG is off (nothing is formatted)."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return None
+    return LineSampler(get_settings().log_output_lines_per_second)
+
+
+def _skipped(sampler: LineSampler) -> str:
+    skipped = sampler.take_skipped()
+    return f" ({skipped} lines not logged)" if skipped else ""
+
+
+def _make_reader(process: asyncio.subprocess.Process) -> ChunkedLineReader:
+    """Create bounded stdout reader from settings."""
+    settings = get_settings()
+    return ChunkedLineReader(
+        process.stdout,
+        max_line=settings.buffer_limit,
+        policy=settings.oversized_line_policy,
+        spill_dir=settings.spill_dir,
+    )
+
+
+async def _read_lines(
+    process: asyncio.subprocess.Process,
+    until_result: bool,
+) -> AsyncGenerator[str, None]:
+    """Yield decoded, non-empty stdout lines."""
+    sampler = _output_sampler()
+    async for line in _make_reader(process).lines():
+        decoded = line.decode("utf-8", errors="ignore").rstrip()
+        if decoded:
+            if sampler and sampler.allow():
+                logger.debug(f"Claude output: {decoded[:200]}{'...' if len(decoded) > 200 else ''}{_skipped(sampler)}")
+            yield decoded
+            if until_result and is_result_line(decoded):
+                return
+
+    if until_result:
+        logger.warning(f"Claude process PID {process.pid} closed stdout before result")
+
+
+async def _read_blocks(
+    process: asyncio.subprocess.Process,
+    until_result: bool,
+) -> AsyncGenerator[bytes | LongLine, None]:
+    """
+    Yield stdout as byte blocks of complete newline-terminated lines.
+    Everything already in the pipe is returned as one block, so small lines
+    are coalesced and nothing is decoded or split per line.
+    Lines over the buffer limit are yielded as LongLine and streamed in chunks.
+    """
+    sampler = _output_sampler()
+    async for block in _make_reader(process).blocks():
+        if isinstance(block, LongLine):
+            if sampler:
+                logger.debug("Claude output: oversized line")
+            yield block
+            continue
+
+        if sampler and sampler.allow():
+            logger.debug(f"Claude output block: {len(block)} bytes{_skipped(sampler)}")
+        yield block
+        if until_result and RESULT_MARKER in block:
+            return
+
+    if until_result:
+        logger.warning(f"Claude process PID {process.pid} closed stdout before result")
+
+
+def output_size(item: str | bytes | LongLine) -> int:
+    """Size of an output item in bytes (as far as known for a LongLine)."""
+    if isinstance(item, LongLine):
+        return item.size
+    return len(item)
+
+
+def is_result_line(line: str) -> bool:
+    """Check if a stream-json line is the final result event of a turn."""
+    return event_type(line) == "result"
+
+
+async def terminate_process(process: asyncio.subprocess.Process, timeout: float = 5.0) -> None:
+    """Terminate subprocess, force killing it if it does not exit in time."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Force killing PID: {process.pid}")
+        process.kill()
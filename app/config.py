@@ -1,13 +1,16 @@
 """Configuration module with Claude Code auto-detection."""
 
+import asyncio
 import logging
-import subprocess
 import shutil
 import sys
 from functools import lru_cache
+from typing import Literal
 
 from pydantic_settings import BaseSettings
 
+from app.models import ResourceLimits
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,15 +24,175 @@ class Settings(BaseSettings):
     # Authentication
     auth_user: str
     auth_password: str
+    # JSON file with more users and hashed API keys (see python -m app.users)
+    auth_users_file: str | None = None
+    # Seconds a verified credential is cached (0 = verify every request) and max cached credentials
+    auth_cache_ttl: float = 60.0
+    auth_cache_size: int = 1024
+    # Default limits per API key or password login (0 = unlimited): requests per minute and per UTC day
+    auth_rate_per_minute: int = 0
+    auth_daily_requests: int = 0
 
     # Claude Code path (auto-detected if not set)
     claude_path: str | None = None
 
+    # Run history (GET /runs): SQLite database of finished runs ("" = disabled)
+    runs_path: str = "runs.db"
+    # Days runs are kept (0 = forever), and seconds between batched writes
+    runs_retention_days: int = 30
+    runs_flush_interval: float = 1.0
+
+    # Transcripts (GET /runs/{run_id}/events): output of every run in gzip segments (None = disabled)
+    transcripts_dir: str | None = None
+    # Uncompressed bytes per segment, and days transcripts are kept (0 = forever)
+    transcripts_segment_bytes: int = 262144
+    transcripts_retention_days: int = 7
+    # Segments waiting for the writer thread; when full, recordings lose output instead of blocking
+    transcripts_queue_size: int = 1000
+
+    # Diagnostics (GET /debug/*): event loop lag monitor, stall stacks, stream timings, profiles
+    diagnostics_enabled: bool = False
+    # Heartbeat interval of the lag monitor; loop stalls longer than slow_callback are logged with their stack
+    diagnostics_lag_interval: float = 0.25
+    diagnostics_slow_callback: float = 0.1
+    # Max duration of GET /debug/profile, and finished streams kept for GET /debug/streams
+    diagnostics_profile_max_seconds: float = 60.0
+    diagnostics_recent_streams: int = 100
+
     # Logging
     log_level: str = "DEBUG"
+    # text or json (one object per line, with process_id/user/session_id fields)
+    log_format: Literal["text", "json"] = "text"
+    # Records waiting for the writer thread; more are dropped (log_dropped_total)
+    log_queue_size: int = 10000
+    # Max per-line debug logs of Claude output per second and stream (0 = all)
+    log_output_lines_per_second: float = 10.0
+
+    # Max bytes of one output line held in memory (1MB)
+    buffer_limit: int = 1024 * 1024
+    # What to do with longer lines: truncate, spill (to a temp file) or passthrough
+    # (streamed in chunks). Memory stays flat for spill/passthrough in raw mode
+    # (POST /chat?raw=true); the default mode sends such a line as one event.
+    oversized_line_policy: Literal["truncate", "spill", "passthrough"] = "spill"
+    # Directory for spilled lines (system temp dir if not set)
+    spill_dir: str | None = None
+
+    # Admission control: max concurrent processes (0 = unlimited)
+    max_concurrent: int = 0
+    max_concurrent_per_user: int = 0
+    max_concurrent_per_cwd: int = 0
+    # Max requests waiting for a slot, more are rejected with 429
+    queue_max_depth: int = 100
+    # Seconds a request may wait in the queue before it fails with 503
+    queue_timeout: float = 300.0
+    # Retry-After seconds sent with 429/503
+    queue_retry_after: int = 5
+
+    # Process registry: memory (single worker) or sqlite (shared by all workers on one host)
+    registry_backend: Literal["memory", "sqlite"] = "memory"
+    registry_path: str = "registry.db"
+    # Seconds between heartbeats / cancel request checks of each worker
+    registry_poll_interval: float = 0.5
+
+    # Response cache, used by requests with "cache": true
+    cache_enabled: bool = False
+    # Seconds an entry stays valid
+    cache_ttl: float = 3600.0
+    # Memory LRU budget (64MB) and max size of one entry (8MB)
+    cache_memory_max_bytes: int = 64 * 1024 * 1024
+    cache_max_entry_bytes: int = 8 * 1024 * 1024
+    # Disk tier directory (disabled if not set) and its budget (1GB)
+    cache_disk_dir: str | None = None
+    cache_disk_max_bytes: int = 1024 * 1024 * 1024
+    # Max files walked for cache_fingerprint_cwd
+    cache_fingerprint_max_files: int = 10000
+
+    # Coalesce identical in-flight requests of the same user into one process
+    coalesce_requests: bool = False
+    # Output kept for replay to late joiners (16MB); later requests start their own process
+    coalesce_replay_max_bytes: int = 16 * 1024 * 1024
+    # Max items a stream reader may fall behind the process before output is paused
+    stream_buffer_items: int = 256
+    # Output buffered in memory per client stream (1MB), so the process is read at full speed
+    stream_buffer_bytes: int = 1024 * 1024
+    # When a client falls further behind: spill (to a temp file in SPILL_DIR), drop (partial
+    # message events, reported as a gap event), disconnect, or block (pause reading the process)
+    slow_client_policy: Literal["spill", "drop", "disconnect", "block"] = "spill"
+    # Max bytes spilled per stream (1GB); a client further behind is disconnected
+    slow_client_spill_max_bytes: int = 1024 * 1024 * 1024
+
+    # Detached streams (POST /chat?detach=true)
+    # Trailing output kept per process for GET /chat/{process_id}/stream (8MB)
+    detach_buffer_bytes: int = 8 * 1024 * 1024
+    # Seconds a detached process (or its finished output) is kept with no client attached
+    detach_idle_timeout: float = 300.0
+
+    # Resource limits per request (0 = unlimited)
+    limit_wall_seconds: float = 0
+    # CPU time and RSS of the CLI process and its children (tools)
+    limit_cpu_seconds: float = 0
+    limit_memory_bytes: int = 0
+    limit_output_bytes: int = 0
+    # Per-user limits replacing the ones above, JSON: {"alice": {"cpu_seconds": 600}}
+    user_limits: dict[str, ResourceLimits] = {}
+    # Delegated cgroup v2 directory for one cgroup per process; if not set,
+    # usage is sampled from /proc and limits are enforced by polling
+    cgroup_root: str | None = None
+    # Seconds between usage samples
+    limit_poll_interval: float = 1.0
+
+    # Max seconds a POST /chat/sync request may run (also the default timeout)
+    sync_timeout: float = 600.0
+
+    # POST /chat/batch limits
+    batch_max_items: int = 1000
+    batch_max_parallelism: int = 16
+
+    # OpenAI compatible /v1/chat/completions
+    # Working directory for requests that do not set "cwd"
+    openai_default_cwd: str | None = None
+    # Conversations remembered for resuming their Claude session
+    openai_session_map_size: int = 10000
+
+    # Session affinity: seconds the process of a finished turn is kept for the
+    # session's next turn, which then skips --resume (0 = disabled)
+    session_idle_window: float = 0
+    # Max processes kept for sessions
+    session_hot_max: int = 8
+    # Sessions remembered in GET /sessions
+    session_registry_max: int = 10000
+    # Claude Code config dir with session transcripts (CLAUDE_CONFIG_DIR or ~/.claude if not set)
+    claude_config_dir: str | None = None
+
+    # Capacity reported by /health/ready and /health/capacity
+    # Memory counted per process when LIMIT_MEMORY_BYTES is not set (512MB)
+    capacity_process_memory_bytes: int = 512 * 1024 * 1024
+    # Memory left for everything else (256MB)
+    capacity_memory_reserve_bytes: int = 256 * 1024 * 1024
+    # 1-minute load average per CPU at which no more slots are reported
+    capacity_max_load_per_cpu: float = 2.0
+    # Share of failed spawns in the last minute at which the node is not ready
+    capacity_max_spawn_failure_rate: float = 0.5
+
+    # Directory of server-side profiles (POST /profiles) and their config files
+    profiles_dir: str = "profiles"
+
+    # Graceful shutdown: on SIGTERM new requests get 503 while running processes
+    # may finish for up to this many seconds, then they are terminated (0 = no drain)
+    drain_timeout: float = 300.0
+    # Retry-After of requests rejected while draining, spread randomly up to twice this
+    drain_retry_after: int = 10
 
-    # Buffer limit for subprocess (100MB)
-    buffer_limit: int = 100 * 1024 * 1024
+    # Warm pool of pre-spawned Claude processes (0 = disabled)
+    # Idle processes kept ready per (cwd, command) key
+    warm_pool_size: int = 0
+    # Max idle processes across all keys
+    warm_pool_max_total: int = 16
+    # Prompts served by one process before it is retired.
+    # Values > 1 reuse the process, so later prompts share the conversation context.
+    warm_pool_max_uses: int = 1
+    # Seconds an idle process is kept before it is retired
+    warm_pool_idle_ttl: float = 300.0
 
     class Config:
         env_file = ".env"
@@ -65,23 +228,29 @@ def detect_claude_path() -> str:
     sys.exit(1)
 
 
-def get_claude_version(claude_path: str) -> str:
+async def get_claude_version(claude_path: str) -> str:
     """
-    Get Claude Code version.
+    Get Claude Code version, without blocking the event loop.
     Returns version string or 'unknown' on error.
     """
     try:
-        result = subprocess.run(
-            [claude_path, "--version"],
-            capture_output=True,
-            text=True,
-            timeout=10
+        process = await asyncio.create_subprocess_exec(
+            claude_path,
+            "--version",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
-        version = result.stdout.strip()
+        try:
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=10)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise
+        version = stdout.decode("utf-8", errors="ignore").strip()
         logger.info(f"Claude Code version: {version}")
         return version
     except Exception as e:
-        logger.warning(f"Failed to get Claude version: {e}")
+        logger.warning(f"Failed to get Claude version: {e!r}")
         return "unknown"
 
 
@@ -89,14 +258,14 @@ def get_claude_version(claude_path: str) -> str:
 _claude_info: dict = {"path": "", "version": ""}
 
 
-def init_claude() -> tuple[str, str]:
+async def init_claude() -> tuple[str, str]:
     """
     Initialize Claude Code path and version.
     Called at application startup.
     Returns (path, version) tuple.
     """
     _claude_info["path"] = detect_claude_path()
-    _claude_info["version"] = get_claude_version(_claude_info["path"])
+    _claude_info["version"] = await get_claude_version(_claude_info["path"])
 
     logger.info(f"Claude Code initialized: {_claude_info['path']} ({_claude_info['version']})")
 
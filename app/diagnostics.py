@@ -0,0 +1,272 @@
+"""
+Opt-in runtime diagnostics (DIAGNOSTICS_ENABLED): event loop lag, stalls
+with the stack that blocked the loop, per-stream timings and sampling
+profiles of the event loop thread.
+
+Nothing here runs on the event loop except a heartbeat task and a few
+additions per stream item; stacks are captured from a separate thread.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from app import metrics
+from app.config import get_settings
+from app.models import LoopDiagnostics, StallInfo, StreamTimingsInfo
+
+logger = logging.getLogger(__name__)
+
+RECENT_STALLS = 20
+
+
+class ProfileBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_stack(frame) -> list[str]:
+    """Format a frame and its callers as file:line function, outermost first."""
+    entries = []
+    while frame is not None:
+        entries.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return entries[::-1]
+
+
+def _folded(frame) -> str:
+    """Collapse a stack into one flamegraph line (module:function;...)."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.basename(code.co_filename)
+        names.append(f"{module.removesuffix('.py')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StreamTimings:
+    """
+    Where the time of one stream went: waiting in the admission queue,
+    until the first output byte (spawn and CLI startup), waiting for output
+    (read_wait) and sending events to the client (write).
+    """
+
+    __slots__ = (
+        "process_id", "user", "started_at", "created", "admitted_at", "first_output_at",
+        "finished_at", "read_wait", "write", "bytes_in", "bytes_out", "events",
+    )
+
+    def __init__(self, process_id: str, user: str):
+        self.process_id = process_id
+        self.user = user
+        self.started_at = datetime.utcnow()
+        self.created = time.monotonic()
+        self.admitted_at: float | None = None
+        self.first_output_at: float | None = None
+        self.finished_at: float | None = None
+        self.read_wait = 0.0
+        self.write = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.events = 0
+
+    def admitted(self) -> None:
+        self.admitted_at = time.monotonic()
+
+    def output(self, size: int) -> None:
+        """Record an output item read from the CLI."""
+        if self.first_output_at is None:
+            self.first_output_at = time.monotonic()
+        self.bytes_in += size
+
+    def received(self, mark: float) -> float:
+        """Record time the SSE writer waited for an item since mark. Returns the new mark."""
+        now = time.perf_counter()
+        self.read_wait += now - mark
+        return now
+
+    def written(self, mark: float, size: int) -> float:
+        """Record an event sent to the client since mark. Returns the new mark."""
+        now = time.perf_counter()
+        self.write += now - mark
+        self.bytes_out += size
+        self.events += 1
+        return now
+
+    def info(self) -> StreamTimingsInfo:
+        now = self.finished_at or time.monotonic()
+        admitted = self.admitted_at
+        return StreamTimingsInfo(
+            process_id=self.process_id,
+            user=self.user,
+            started_at=self.started_at,
+            finished=self.finished_at is not None,
+            duration_seconds=now - self.created,
+            queue_seconds=(admitted or now) - self.created,
+            first_output_seconds=self.first_output_at - admitted if admitted and self.first_output_at else None,
+            read_wait_seconds=self.read_wait,
+            write_seconds=self.write,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            events=self.events,
+        )
+
+
+class Diagnostics:
+    """
+    Event loop monitor and stream timing store.
+
+    A heartbeat task sleeps DIAGNOSTICS_LAG_INTERVAL and records how late it
+    wakes up. A watchdog thread checks the heartbeat; when the loop has not
+    run it for DIAGNOSTICS_SLOW_CALLBACK seconds, it captures the loop
+    thread's stack, which is logged with the stall duration once the loop
+    is back.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._streams: dict[str, StreamTimings] = {}
+        self._recent: deque[StreamTimings] = deque(maxlen=100)
+        self._stalls: deque[StallInfo] = deque(maxlen=RECENT_STALLS)
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._loop_thread: int | None = None
+        self._heartbeat = 0.0
+        self._stall_stack: list[str] | None = None
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._stall_count = 0
+        self._profiling = threading.Lock()
+
+    def start(self) -> None:
+        """Start the heartbeat and the watchdog (called on startup)."""
+        settings = get_settings()
+        self.enabled = True
+        self._recent = deque(maxlen=settings.diagnostics_recent_streams)
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run_heartbeat(settings.diagnostics_lag_interval))
+        self._watchdog = threading.Thread(
+            target=self._watch,
+            args=(settings.diagnostics_lag_interval, settings.diagnostics_slow_callback),
+            name="loop-watchdog",
+            daemon=True,
+        )
+        self._watchdog.start()
+        logger.info(
+            f"Diagnostics enabled: heartbeat every {settings.diagnostics_lag_interval}s, "
+            f"stalls over {settings.diagnostics_slow_callback}s are logged"
+        )
+
+    async def stop(self) -> None:
+        """Stop the heartbeat and the watchdog."""
+        self.enabled = False
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_heartbeat(self, interval: float) -> None:
+        threshold = get_settings().diagnostics_slow_callback
+        while True:
+            expected = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            metrics.loop_lag.observe(lag)
+            if lag >= threshold:
+                self._record_stall(lag)
+            else:
+                self._stall_stack = None
+
+    def _record_stall(self, seconds: float) -> None:
+        stack, self._stall_stack = self._stall_stack, None
+        self._stall_count += 1
+        metrics.loop_stalls.inc()
+        self._stalls.append(StallInfo(detected_at=datetime.utcnow(), seconds=seconds, stack=stack or []))
+        if stack:
+            logger.warning(f"Event loop blocked for {seconds:.3f}s in:\n  " + "\n  ".join(stack[-15:]))
+        else:
+            logger.warning(f"Event loop blocked for {seconds:.3f}s (stack not captured)")
+
+    def _watch(self, interval: float, threshold: float) -> None:
+        """Watchdog thread: capture the loop thread's stack while it is stalled."""
+        while not self._stop.wait(max(0.01, threshold / 2)):
+            behind = time.monotonic() - self._heartbeat - interval
+            if behind < threshold or self._stall_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._stall_stack = _frame_stack(frame)
+
+    def loop_info(self) -> LoopDiagnostics:
+        settings = get_settings()
+        return LoopDiagnostics(
+            lag_interval=settings.diagnostics_lag_interval,
+            slow_callback_seconds=settings.diagnostics_slow_callback,
+            last_lag_seconds=self._last_lag,
+            max_lag_seconds=self._max_lag,
+            stalls=self._stall_count,
+            recent_stalls=list(self._stalls),
+        )
+
+    def track(self, process_id: str, user: str) -> StreamTimings | None:
+        """Start timing a stream, None if diagnostics are disabled."""
+        if not self.enabled:
+            return None
+        timings = self._streams[process_id] = StreamTimings(process_id, user)
+        return timings
+
+    def timings(self, process_id: str) -> StreamTimings | None:
+        return self._streams.get(process_id)
+
+    def finish(self, timings: StreamTimings | None) -> None:
+        """Move a finished stream to the recent list."""
+        if timings is None:
+            return
+        timings.finished_at = time.monotonic()
+        self._streams.pop(timings.process_id, None)
+        self._recent.append(timings)
+
+    def streams(self) -> list[StreamTimingsInfo]:
+        """Get timings of active streams and of the most recent finished ones."""
+        return [t.info() for t in self._streams.values()] + [t.info() for t in reversed(self._recent)]
+
+    def profile(self, seconds: float, interval: float) -> dict[str, int]:
+        """
+        Sample the event loop thread's stack every interval for the given
+        seconds and count identical stacks. Blocking, run in a thread.
+        Raises ProfileBusy if another profile is running.
+        """
+        if not self._profiling.acquire(blocking=False):
+            raise ProfileBusy("A profile is already running")
+        try:
+            stacks: Counter[str] = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    stacks[_folded(frame)] += 1
+                del frame
+                time.sleep(interval)
+            return dict(stacks.most_common())
+        finally:
+            self._profiling.release()
+
+
+# Global diagnostics instance
+diagnostics = Diagnostics()
@@ -0,0 +1,194 @@
+"""Classification, filtering and projection of Claude stream-json events."""
+
+import json
+import logging
+from typing import AsyncGenerator
+
+from app.line_reader import LongLine
+
+logger = logging.getLogger(__name__)
+
+# The CLI writes "type" as the first key, so the type is read from the line head
+TYPE_PREFIX = '{"type":"'
+TYPE_PREFIX_BYTES = TYPE_PREFIX.encode()
+MAX_TYPE_LENGTH = 64
+# Lines not starting with the type are parsed only up to this size
+PARSE_FALLBACK_MAX = 64 * 1024
+
+
+def event_type(line: str | bytes) -> str | None:
+    """
+    Get the type of a stream-json line without parsing it.
+    Returns None if the line is not a JSON event.
+    """
+    prefix = TYPE_PREFIX if isinstance(line, str) else TYPE_PREFIX_BYTES
+    if line.startswith(prefix):
+        start = len(prefix)
+        end = line.find('"' if isinstance(line, str) else b'"', start, start + MAX_TYPE_LENGTH)
+        if end >= 0:
+            value = line[start:end]
+            return value if isinstance(value, str) else value.decode("utf-8", errors="ignore")
+
+    if len(line) > PARSE_FALLBACK_MAX:
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    return data.get("type") if isinstance(data, dict) else None
+
+
+def find_event(output: str | bytes | LongLine, etype: str) -> str | bytes | None:
+    """Find the first event of a type in a decoded line or a raw block of lines."""
+    if isinstance(output, str):
+        return output if event_type(output) == etype else None
+    if isinstance(output, LongLine):
+        return None
+
+    marker = (TYPE_PREFIX + etype + '"').encode()
+    if output.startswith(marker):
+        start = 0
+    else:
+        start = output.find(b"\n" + marker)
+        if start < 0:
+            return None
+        start += 1
+    end = output.find(b"\n", start)
+    return output[start:end if end >= 0 else None]
+
+
+def _build_tree(paths: list[str]) -> dict:
+    """Build a projection tree from dotted paths (None marks a subtree kept whole)."""
+    tree: dict = {}
+    for path in paths:
+        keys = path.split(".")
+        node = tree
+        for key in keys[:-1]:
+            child = node.setdefault(key, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[keys[-1]] = None
+    return tree
+
+
+def _project(value, tree: dict | None):
+    """Keep only the parts of value selected by tree. Lists are projected per element."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class EventFilter:
+    """
+    Per-client filter applied to a process stream before SSE encoding.
+
+    events: event types to keep (e.g. {"assistant", "result"}), None keeps all.
+    fields: dotted paths to keep in each event. A path may be limited to one
+    event type with a "type:" prefix (e.g. "user:message.content.tool_use_id").
+    Events with no applicable paths are passed through unparsed; "type" is always kept.
+    """
+
+    def __init__(self, events: set[str] | None = None, fields: list[str] | None = None):
+        self.events = events
+        self._generic: list[str] = []
+        self._by_type: dict[str, list[str]] = {}
+        for path in fields or []:
+            etype, sep, rest = path.partition(":")
+            if sep:
+                self._by_type.setdefault(etype, []).append(rest)
+            else:
+                self._generic.append(path)
+        self._trees: dict[str | None, dict | None] = {}
+
+    @classmethod
+    def from_query(cls, events: str | None, fields: str | None) -> "EventFilter | None":
+        """Build a filter from comma-separated query values, None if both are empty."""
+        event_set = {e.strip() for e in events.split(",") if e.strip()} if events else None
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        if not event_set and not field_list:
+            return None
+        return cls(event_set or None, field_list)
+
+    def _tree(self, etype: str | None) -> dict | None:
+        """Get the projection tree for an event type (None if the event is kept whole)."""
+        if etype not in self._trees:
+            paths = self._generic + self._by_type.get(etype, [])
+            self._trees[etype] = _build_tree(["type"] + paths) if paths else None
+        return self._trees[etype]
+
+    def _keep(self, etype: str | None) -> bool:
+        return self.events is None or etype in self.events
+
+    def line(self, line: str) -> str | None:
+        """Filter and project a decoded line, None if it is dropped."""
+        etype = event_type(line)
+        if not self._keep(etype):
+            return None
+        tree = self._tree(etype)
+        if tree is None:
+            return line
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return line
+        return json.dumps(_project(data, tree), ensure_ascii=False, separators=(",", ":"))
+
+    def block(self, block: bytes) -> bytes:
+        """Filter and project a raw block of newline-terminated lines."""
+        kept = []
+        for line in block.split(b"\n"):
+            if not line:
+                continue
+            etype = event_type(line)
+            if not self._keep(etype):
+                continue
+            tree = self._tree(etype)
+            if tree is not None:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    pass
+                else:
+                    line = json.dumps(_project(data, tree), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            kept.append(line)
+        if not kept:
+            return b""
+        kept.append(b"")
+        return b"\n".join(kept)
+
+    async def long_line(self, line: LongLine) -> bytes | LongLine | None:
+        """
+        Filter and project an oversized raw line, typed by its head.
+        A projected line has to be read into memory to be parsed.
+        """
+        etype = event_type(line.head)
+        if not self._keep(etype):
+            await line.discard()
+            return None
+        if self._tree(etype) is None:
+            return line
+        return self.block(await line.read() + b"\n")
+
+    async def apply(self, stream: AsyncGenerator) -> AsyncGenerator:
+        """Filter a process stream. Non-output items (and their event ids) pass through."""
+        async for item in stream:
+            event_id = None
+            if isinstance(item, tuple):
+                event_id, item = item
+
+            if isinstance(item, str):
+                item = self.line(item)
+            elif isinstance(item, bytes):
+                item = self.block(item) or None
+            elif isinstance(item, LongLine):
+                item = await self.long_line(item)
+
+            if item is None:
+                continue
+            yield item if event_id is None else (event_id, item)
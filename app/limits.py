@@ -0,0 +1,360 @@
+"""Resource limits and usage accounting for Claude Code subprocesses."""
+
+import asyncio
+import logging
+import os
+import resource
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from app import metrics
+from app.config import get_settings
+from app.models import ChatRequest, ResourceUsage
+
+logger = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+# Extra CPU seconds before the RLIMIT_CPU backstop of the main process kicks in
+RLIMIT_CPU_GRACE = 5
+
+# Set after a cgroup could not be created, to fall back to /proc for the rest of the run
+_cgroups_failed = False
+
+
+@dataclass
+class Limits:
+    """Effective limits of one process (0 = unlimited)."""
+
+    wall_seconds: float = 0
+    cpu_seconds: float = 0
+    memory_bytes: int = 0
+    output_bytes: int = 0
+
+
+def resolve_limits(request: ChatRequest, user: str) -> Limits:
+    """
+    Get limits for a request: server limits, replaced by the user's limits
+    if configured, lowered by the request's own limits.
+    """
+    settings = get_settings()
+    limits = Limits(
+        wall_seconds=settings.limit_wall_seconds,
+        cpu_seconds=settings.limit_cpu_seconds,
+        memory_bytes=settings.limit_memory_bytes,
+        output_bytes=settings.limit_output_bytes,
+    )
+
+    user_limits = settings.user_limits.get(user)
+    if user_limits:
+        for name, value in user_limits.model_dump(exclude_none=True).items():
+            setattr(limits, name, value)
+
+    if request.limits:
+        for name, value in request.limits.model_dump(exclude_none=True).items():
+            current = getattr(limits, name)
+            if not current or value < current:
+                setattr(limits, name, value)
+
+    return limits
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+def _write(path: str, value: str) -> None:
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _join_cgroup(path: str) -> Callable[[], None]:
+    """Get a preexec_fn that moves the child into a cgroup before it execs."""
+    procs = os.path.join(path, "cgroup.procs").encode()
+
+    def join() -> None:
+        # Runs in the forked child: no logging, a failure is detected by the parent (see attach)
+        try:
+            fd = os.open(procs, os.O_WRONLY)
+            try:
+                os.write(fd, b"0")
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    return join
+
+
+def _process_tree(pid: int) -> list[int]:
+    """Get pid and all its live descendants (via /proc/<pid>/task/<tid>/children)."""
+    pids = [pid]
+    i = 0
+    while i < len(pids):
+        try:
+            for tid in os.listdir(f"/proc/{pids[i]}/task"):
+                pids.extend(int(child) for child in _read(f"/proc/{pids[i]}/task/{tid}/children").split())
+        except OSError:
+            pass
+        i += 1
+    return pids
+
+
+def _proc_sample(pid: int) -> tuple[float, int] | None:
+    """
+    Get (CPU seconds, RSS bytes) of a process tree from /proc, or None if the process is gone.
+    CPU includes exited children already reaped by their parents.
+    """
+    cpu_ticks = 0
+    rss_pages = 0
+    found = False
+    for p in _process_tree(pid):
+        try:
+            stat = _read(f"/proc/{p}/stat")
+        except OSError:
+            continue
+        found = True
+        fields = stat[stat.rfind(")") + 2:].split()
+        # utime, stime, cutime, cstime and rss (fields 14-17 and 24 of proc(5))
+        cpu_ticks += int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])
+        rss_pages += int(fields[21])
+    if not found:
+        return None
+    return cpu_ticks / CLOCK_TICKS, rss_pages * PAGE_SIZE
+
+
+class ResourceMonitor:
+    """
+    Measures and limits the resources of one CLI process and its children.
+
+    With CGROUP_ROOT set, the process starts in its own cgroup v2: memory
+    is limited by the kernel (memory.max, OOM kills the whole group) and usage
+    comes from cpu.stat and memory.peak. Otherwise the process tree is sampled
+    from /proc and limits are enforced by polling, with RLIMIT_CPU on the main
+    process as a backstop.
+    Wall time, CPU time and output bytes are always enforced by the gateway.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limits: Limits,
+        on_sample: Callable[[ResourceUsage], Awaitable[None]] | None = None,
+    ):
+        self.name = name
+        self.limits = limits
+        self.usage = ResourceUsage()
+        # Exit code of a process that ran one request (not set for warm processes)
+        self.exit_code: int | None = None
+        self._on_sample = on_sample
+        self._cgroup: str | None = None
+        self._pid: int | None = None
+        self._started = 0.0
+        self._cpu_base = 0.0
+        self._task: asyncio.Task | None = None
+        self._on_exceeded: Callable[[], Awaitable[None]] | None = None
+        self._finished = False
+
+    @property
+    def uses_cgroup(self) -> bool:
+        """Check if processes will run in a cgroup (so they cannot be reused afterwards)."""
+        return bool(get_settings().cgroup_root) and not _cgroups_failed
+
+    def prepare(self) -> Callable[[], None] | None:
+        """
+        Create the cgroup for a process about to be spawned.
+        Returns the preexec_fn that starts the process inside it (so no
+        process of the tree runs outside its limits), None without cgroups.
+        """
+        if self.uses_cgroup and self._cgroup is None:
+            self._cgroup = self._create_cgroup()
+        return _join_cgroup(self._cgroup) if self._cgroup else None
+
+    def attach(
+        self,
+        process: asyncio.subprocess.Process,
+        on_exceeded: Callable[[], Awaitable[None]],
+        fresh: bool = True,
+    ) -> None:
+        """
+        Start measuring a process (spawned with the preexec_fn of prepare() for a cgroup).
+        on_exceeded is awaited when a limit is hit.
+        fresh is False for reused (warm) processes: usage is counted from now and no rlimit is set.
+        """
+        self._pid = process.pid
+        self._started = time.monotonic()
+        self._on_exceeded = on_exceeded
+
+        if self._cgroup and not self._contains(process.pid):
+            self._cgroup_failed(f"PID {process.pid} did not start in it")
+        if self._cgroup is None:
+            sample = _proc_sample(process.pid)
+            if sample:
+                self._cpu_base, self.usage.peak_rss_bytes = sample
+            if fresh and self.limits.cpu_seconds:
+                cpu = int(self.limits.cpu_seconds) + RLIMIT_CPU_GRACE
+                try:
+                    resource.prlimit(process.pid, resource.RLIMIT_CPU, (cpu, cpu + 1))
+                except (OSError, ValueError) as e:
+                    logger.debug(f"Could not set RLIMIT_CPU for PID {process.pid}: {e}")
+
+        self._task = asyncio.create_task(self._poll_loop())
+
+    def _create_cgroup(self) -> str | None:
+        """Create a cgroup with the process's memory limit, None on failure."""
+        root = get_settings().cgroup_root
+        path = os.path.join(root, f"claude-{self.name}")
+        try:
+            if not os.path.exists(os.path.join(root, "cgroup.controllers")):
+                raise OSError(f"{root} is not a cgroup v2 directory")
+            os.mkdir(path)
+            if self.limits.memory_bytes:
+                _write(os.path.join(path, "memory.max"), str(self.limits.memory_bytes))
+                _write(os.path.join(path, "memory.oom.group"), "1")
+            return path
+        except OSError as e:
+            self._cgroup = path
+            self._cgroup_failed(str(e))
+            return None
+
+    def _contains(self, pid: int) -> bool:
+        """Check if a process is in this monitor's cgroup."""
+        try:
+            cgroup = _read(f"/proc/{pid}/cgroup")
+        except OSError:
+            return False
+        name = os.path.basename(self._cgroup)
+        return any(line.startswith("0::") and line.endswith(f"/{name}") for line in cgroup.splitlines())
+
+    def _cgroup_failed(self, reason: str) -> None:
+        """Remove the (empty) cgroup and use /proc accounting from now on."""
+        global _cgroups_failed
+        logger.warning(f"cgroup v2 unavailable at {self._cgroup} ({reason}), falling back to /proc accounting")
+        _cgroups_failed = True
+        try:
+            os.rmdir(self._cgroup)
+        except OSError:
+            pass
+        self._cgroup = None
+
+    def output(self, size: int) -> bool:
+        """Count output bytes. Returns False if the output limit is exceeded."""
+        if not self.usage.output_bytes:
+            # Short runs can exit before the first poll; sample while the process is surely alive
+            self.sample()
+        self.usage.output_bytes += size
+        if self.limits.output_bytes and self.usage.output_bytes > self.limits.output_bytes:
+            self._exceeded("output")
+            return False
+        return True
+
+    def sample(self) -> None:
+        """Update usage from the cgroup or /proc."""
+        if self._pid is None:
+            return
+        self.usage.wall_seconds = round(time.monotonic() - self._started, 3)
+
+        if self._cgroup:
+            try:
+                for line in _read(os.path.join(self._cgroup, "cpu.stat")).splitlines():
+                    if line.startswith("usage_usec "):
+                        self.usage.cpu_seconds = int(line.split()[1]) / 1_000_000
+                try:
+                    peak = int(_read(os.path.join(self._cgroup, "memory.peak")))
+                except OSError:
+                    peak = int(_read(os.path.join(self._cgroup, "memory.current")))
+                self.usage.peak_rss_bytes = max(self.usage.peak_rss_bytes, peak)
+            except (OSError, ValueError) as e:
+                logger.debug(f"Could not read cgroup {self._cgroup}: {e}")
+            return
+
+        sample = _proc_sample(self._pid)
+        if sample:
+            cpu, rss = sample
+            self.usage.cpu_seconds = max(self.usage.cpu_seconds, round(cpu - self._cpu_base, 3))
+            self.usage.peak_rss_bytes = max(self.usage.peak_rss_bytes, rss)
+
+    def _check(self) -> str | None:
+        """Get the name of the first exceeded limit, if any."""
+        if self.limits.wall_seconds and self.usage.wall_seconds > self.limits.wall_seconds:
+            return "wall"
+        if self.limits.cpu_seconds and self.usage.cpu_seconds > self.limits.cpu_seconds:
+            return "cpu"
+        if self._cgroup:
+            if self._oom_killed():
+                return "memory"
+        elif self.limits.memory_bytes and self.usage.peak_rss_bytes > self.limits.memory_bytes:
+            return "memory"
+        return None
+
+    def _oom_killed(self) -> bool:
+        """Check if the kernel killed a process of the cgroup for exceeding memory.max."""
+        try:
+            for line in _read(os.path.join(self._cgroup, "memory.events")).splitlines():
+                if line.startswith("oom_kill "):
+                    return int(line.split()[1]) > 0
+        except (OSError, ValueError):
+            pass
+        return False
+
+    def _exceeded(self, limit: str) -> None:
+        """Record an exceeded limit (the caller terminates the process)."""
+        if self.usage.limit_exceeded:
+            return
+        self.usage.limit_exceeded = limit
+        metrics.limits_exceeded.inc(limit)
+        logger.warning(f"Process {self.name} exceeded {limit} limit: {self.usage.model_dump()}")
+
+    async def _poll_loop(self) -> None:
+        """Sample usage periodically and terminate the process when a limit is exceeded."""
+        interval = get_settings().limit_poll_interval
+        while True:
+            await asyncio.sleep(interval)
+            self.sample()
+            if self._on_sample:
+                await self._on_sample(self.usage)
+            limit = self._check()
+            if limit:
+                self._exceeded(limit)
+                await self._on_exceeded()
+                return
+
+    async def finish(self) -> ResourceUsage:
+        """Stop sampling, take a final sample and remove the cgroup (killing leftover processes)."""
+        if self._finished:
+            return self.usage
+        self._finished = True
+        if self._pid is None:
+            # The process never started (a cgroup prepared for it is still removed)
+            if self._cgroup:
+                await self._remove_cgroup()
+            return self.usage
+
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self.sample()
+        if self._cgroup and self._oom_killed():
+            self._exceeded("memory")
+        if self._cgroup:
+            await self._remove_cgroup()
+        return self.usage
+
+    async def _remove_cgroup(self) -> None:
+        """Kill processes left in the cgroup (e.g. background tool processes) and remove it."""
+        try:
+            _write(os.path.join(self._cgroup, "cgroup.kill"), "1")
+        except OSError:
+            pass
+        for _ in range(20):
+            try:
+                os.rmdir(self._cgroup)
+                return
+            except OSError:
+                await asyncio.sleep(0.05)
+        logger.warning(f"Could not remove cgroup {self._cgroup}")
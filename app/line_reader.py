@@ -0,0 +1,250 @@
+"""Bounded chunked line reader for Claude Code stdout."""
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import AsyncGenerator, Callable
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the pipe at once (also the StreamReader buffer limit)
+READ_CHUNK_SIZE = 256 * 1024
+
+# Bytes of an oversized line kept as preview when it is truncated
+TRUNCATED_PREVIEW_SIZE = 1024
+
+OVERSIZED_POLICIES = ("truncate", "spill", "passthrough")
+
+
+class LongLine:
+    """
+    Output line bigger than the line buffer.
+    Content is only available as a sequence of chunks, read once via chunks().
+    """
+
+    def __init__(self, reader: "ChunkedLineReader", head: bytes, spill_path: str | None = None, size: int = 0):
+        self._reader = reader
+        self._head = head
+        self._spill_path = spill_path
+        self._spilled = spill_path is not None
+        self._consumed = False
+        self._taps: list[Callable[[bytes | None], None]] = []
+        self.size = size
+
+    @property
+    def head(self) -> bytes:
+        """First bytes of the line (enough to tell its event type)."""
+        return self._head
+
+    def tap(self, callback: Callable[[bytes | None], None]) -> None:
+        """Also pass every chunk to callback while the line is read, then None when reading stops."""
+        self._taps.append(callback)
+
+    async def chunks(self) -> AsyncGenerator[bytes, None]:
+        """Yield line content (without trailing newline) in chunks."""
+        if self._consumed:
+            return
+        self._consumed = True
+
+        try:
+            async for chunk in self._read_chunks():
+                for tap in self._taps:
+                    tap(chunk)
+                yield chunk
+        finally:
+            for tap in self._taps:
+                tap(None)
+
+    async def _read_chunks(self) -> AsyncGenerator[bytes, None]:
+        if self._spilled:
+            if not self._spill_path:
+                return
+            try:
+                f = await asyncio.to_thread(open, self._spill_path, "rb")
+                with f:
+                    while chunk := await asyncio.to_thread(f.read, READ_CHUNK_SIZE):
+                        yield chunk
+            finally:
+                self.close()
+            return
+
+        # Passthrough: head first, then the rest straight from the pipe
+        self.size = len(self._head)
+        yield self._head
+        async for chunk in self._reader._read_until_newline():
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        """Remove the spill file, if any."""
+        if self._spill_path:
+            try:
+                os.unlink(self._spill_path)
+            except OSError:
+                pass
+            self._spill_path = None
+
+    async def read(self) -> bytes:
+        """Read the whole line into memory."""
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    async def discard(self) -> None:
+        """Skip the rest of the line if it was not consumed."""
+        async for _ in self.chunks():
+            pass
+
+
+class ChunkedLineReader:
+    """
+    Reads newline-delimited output in chunks with a bounded buffer.
+
+    Complete lines are returned in blocks (all lines available in the pipe at once).
+    A line bigger than max_line is handled by policy:
+    - truncate: replaced by a small JSON stub with the original type and size
+    - spill: written to a temp file, then returned as LongLine read back in chunks
+    - passthrough: returned as LongLine streamed from the pipe in chunks
+    """
+
+    def __init__(
+        self,
+        stream: asyncio.StreamReader,
+        max_line: int,
+        policy: str = "spill",
+        spill_dir: str | None = None,
+    ):
+        if policy not in OVERSIZED_POLICIES:
+            raise ValueError(f"Unknown oversized line policy: {policy}")
+        self._stream = stream
+        self._max_line = max(max_line, 1)
+        self._policy = policy
+        self._spill_dir = spill_dir
+        self._buf = bytearray()
+        self._eof = False
+        self.oversized = 0
+
+    async def blocks(self) -> AsyncGenerator[bytes | LongLine, None]:
+        """
+        Yield blocks of complete newline-terminated lines, or LongLine items.
+        A LongLine must be consumed before the next item; it is discarded otherwise.
+        """
+        while True:
+            end = self._buf.rfind(b"\n")
+            if end >= 0:
+                block = bytes(self._buf[:end + 1])
+                del self._buf[:end + 1]
+                yield block
+                continue
+
+            if len(self._buf) > self._max_line:
+                self.oversized += 1
+                item = await self._oversized()
+                if isinstance(item, LongLine):
+                    try:
+                        yield item
+                        await item.discard()
+                    finally:
+                        item.close()
+                else:
+                    yield item
+                continue
+
+            if self._eof:
+                if self._buf.strip():
+                    yield bytes(self._buf) + b"\n"
+                self._buf.clear()
+                return
+
+            chunk = await self._stream.read(READ_CHUNK_SIZE)
+            if chunk:
+                self._buf += chunk
+            else:
+                self._eof = True
+
+    async def lines(self) -> AsyncGenerator[bytes, None]:
+        """Yield single lines without newline; oversized lines are read whole."""
+        async for item in self.blocks():
+            if isinstance(item, LongLine):
+                yield await item.read()
+                continue
+            for line in item.split(b"\n")[:-1]:
+                yield line
+
+    async def _read_until_newline(self) -> AsyncGenerator[bytes, None]:
+        """Yield chunks up to (not including) the next newline, starting with the buffer."""
+        while True:
+            end = self._buf.find(b"\n")
+            if end >= 0:
+                chunk = bytes(self._buf[:end])
+                del self._buf[:end + 1]
+                if chunk:
+                    yield chunk
+                return
+
+            if self._buf:
+                chunk = bytes(self._buf)
+                self._buf.clear()
+                yield chunk
+
+            if self._eof:
+                return
+            data = await self._stream.read(READ_CHUNK_SIZE)
+            if data:
+                self._buf += data
+            else:
+                self._eof = True
+
+    async def _oversized(self) -> bytes | LongLine:
+        """Handle a partial line that outgrew the buffer according to policy."""
+        head = bytes(self._buf)
+        self._buf.clear()
+
+        if self._policy == "passthrough":
+            logger.debug(f"Passing through oversized line ({len(head)}+ bytes)")
+            return LongLine(self, head)
+
+        if self._policy == "spill":
+            # Disk I/O in a thread: a line can be many MB and the disk slow
+            fd, path = await asyncio.to_thread(
+                tempfile.mkstemp, prefix="claude-line-", suffix=".json", dir=self._spill_dir
+            )
+            size = len(head)
+            f = os.fdopen(fd, "wb")
+            try:
+                await asyncio.to_thread(f.write, head)
+                async for chunk in self._read_until_newline():
+                    await asyncio.to_thread(f.write, chunk)
+                    size += len(chunk)
+                await asyncio.to_thread(f.close)
+            except BaseException:
+                f.close()
+                os.unlink(path)
+                raise
+            logger.debug(f"Spilled oversized line ({size} bytes) to {path}")
+            return LongLine(self, head[:TRUNCATED_PREVIEW_SIZE], spill_path=path, size=size)
+
+        # Truncate: keep a preview, skip the rest
+        size = len(head)
+        async for chunk in self._read_until_newline():
+            size += len(chunk)
+        logger.warning(f"Truncated oversized output line ({size} bytes)")
+        return truncated_stub(head, size) + b"\n"
+
+
+def truncated_stub(head: bytes, size: int) -> bytes:
+    """Build a JSON event replacing a truncated line."""
+    original_type = None
+    start = head.find(b'"type":"')
+    if 0 <= start < 100:
+        end = head.find(b'"', start + 8)
+        if end > 0:
+            original_type = head[start + 8:end].decode("utf-8", errors="ignore")
+
+    stub = {
+        "type": "truncated",
+        "original_type": original_type,
+        "size": size,
+        "preview": head[:TRUNCATED_PREVIEW_SIZE].decode("utf-8", errors="ignore"),
+    }
+    return json.dumps(stub, separators=(",", ":")).encode("utf-8")
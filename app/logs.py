@@ -0,0 +1,161 @@
+"""
+Logging setup: records are queued by the calling thread and written by a
+listener thread, so stdout/journald writes never block the event loop.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from app import metrics
+
+# Correlation fields (process_id, user, session_id) of the current task
+log_context: ContextVar[dict[str, str]] = ContextVar("log_context", default={})
+
+CONTEXT_FIELDS = ("process_id", "user", "session_id")
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener: QueueListener | None = None
+
+
+def bind_log_context(**fields: str | None) -> None:
+    """Add correlation fields to the log records of the current task (and tasks it starts)."""
+    context = dict(log_context.get())
+    context.update((name, value) for name, value in fields.items() if value)
+    log_context.set(context)
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Queue handler that attaches correlation fields and defers formatting to
+    the listener thread. The caller only merges the message arguments; when
+    the queue is full the record is dropped and counted instead of blocking.
+    Time spent here is the event loop's share of logging (log_emit_seconds_total).
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames of the calling thread: render them here
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.context = log_context.get()
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        started = time.perf_counter()
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            metrics.log_dropped.inc()
+        except Exception:
+            self.handleError(record)
+        metrics.log_emit_seconds.inc(amount=time.perf_counter() - started)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text lines with correlation fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            line += " [" + " ".join(f"{name}={context[name]}" for name in CONTEXT_FIELDS if name in context) + "]"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with correlation fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(getattr(record, "context", None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class LineSampler:
+    """
+    Rate limit for per-line debug logs of one output stream: a token bucket
+    of `per_second` lines (burst of the same size). Lines logged after a gap
+    report how many were skipped.
+    """
+
+    __slots__ = ("per_second", "tokens", "updated", "skipped")
+
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.tokens = per_second
+        self.updated = time.monotonic()
+        self.skipped = 0
+
+    def allow(self) -> bool:
+        """Check whether the next line may be logged."""
+        if self.per_second <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.per_second, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+        if self.tokens < 1:
+            self.skipped += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def take_skipped(self) -> int:
+        """Get and reset the number of lines skipped since the last logged one."""
+        skipped, self.skipped = self.skipped, 0
+        return skipped
+
+
+def setup_logging(level: str, fmt: str = "text", queue_size: int = 10000) -> None:
+    """Route all records through a bounded queue to a stdout writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(records))
+    root.setLevel(level.upper())
+    # sse-starlette logs every chunk it sends at DEBUG
+    logging.getLogger("sse_starlette").setLevel(max(root.level, logging.INFO))
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    metrics.registry.gauge("log_queue_depth", "Log records waiting for the writer thread", records.qsize)
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
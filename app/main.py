@@ -1,25 +1,57 @@
 """FastAPI application entry point."""
 
+import asyncio
 import logging
-import sys
+import signal
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.config import get_settings, init_claude
-from app.routes import chat, health, processes
+from app.diagnostics import diagnostics
+from app.logs import setup_logging
+from app.process_manager import process_manager
+from app.profiles import profiles
+from app.runs import runs
+from app.transcripts import transcripts
+from app.routes import batch, cache, chat, debug, health, metrics, openai, processes, profiles as profile_routes, runs as run_routes, sessions, usage
 
 # Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
+_settings = get_settings()
+setup_logging(_settings.log_level, _settings.log_format, _settings.log_queue_size)
 
 logger = logging.getLogger(__name__)
 
 
+def install_drain_handler() -> None:
+    """
+    Drain before exiting on SIGTERM: new requests get 503 while running
+    processes finish (up to DRAIN_TIMEOUT), then the server's own SIGTERM
+    handler shuts it down. A second SIGTERM skips the rest of the drain.
+    Wraps the SIGTERM handler that uvicorn (0.29 or later) installs with signal.signal.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        logger.warning("No SIGTERM handler to wrap (uvicorn older than 0.29?), shutting down without draining")
+        return
+    loop = asyncio.get_running_loop()
+
+    async def drain_and_exit() -> None:
+        await process_manager.drain(get_settings().drain_timeout)
+        previous(signal.SIGTERM, None)
+
+    def handle_sigterm(sig, frame) -> None:
+        if process_manager.draining:
+            logger.warning("Second SIGTERM, shutting down without waiting for the drain")
+            previous(sig, frame)
+            return
+        logger.info("SIGTERM received, draining before shutdown")
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(drain_and_exit()))
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -30,7 +62,7 @@ async def lifespan(app: FastAPI):
 
     # Initialize Claude Code
     try:
-        claude_path, claude_version = init_claude()
+        claude_path, claude_version = await init_claude()
         logger.info(f"Claude Code ready: {claude_path} ({claude_version})")
     except SystemExit:
         logger.error("Failed to initialize Claude Code, exiting")
@@ -40,9 +72,28 @@ async def lifespan(app: FastAPI):
     logger.info(f"Server configured: {settings.host}:{settings.port}")
     logger.info(f"Log level: {settings.log_level}")
 
+    profiles.load()
+
+    # Start process registry and warm process pool
+    await process_manager.start()
+    await runs.start(process_manager.registry.worker_id)
+    transcripts.start()
+
+    if settings.drain_timeout > 0:
+        install_drain_handler()
+
+    if settings.diagnostics_enabled:
+        diagnostics.start()
+
     yield
 
     logger.info("Shutting down Claude Code API Gateway...")
+    # Already drained on SIGTERM; otherwise (e.g. Ctrl+C) terminate what is left right away
+    await process_manager.drain(0)
+    await process_manager.stop()
+    await runs.stop()
+    await transcripts.stop()
+    await diagnostics.stop()
 
 
 # Create FastAPI app
@@ -65,7 +116,16 @@ app.add_middleware(
 # Include routers
 app.include_router(health.router)
 app.include_router(chat.router)
+app.include_router(batch.router)
+app.include_router(openai.router)
 app.include_router(processes.router)
+app.include_router(sessions.router)
+app.include_router(run_routes.router)
+app.include_router(profile_routes.router)
+app.include_router(usage.router)
+app.include_router(metrics.router)
+app.include_router(debug.router)
+app.include_router(cache.router)
 
 
 @app.get("/", include_in_schema=False)
@@ -0,0 +1,316 @@
+"""Prometheus metrics in text exposition format."""
+
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "claudecode2api_"
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+BYTES_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1KB .. 1GB
+LINES_BUCKETS = (1.0, 10.0, 50.0, 100.0, 500.0, 1000.0, 5000.0, 10000.0, 50000.0)
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value) -> str:
+    """Escape label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    """Format label set as {a="x",b="y"}."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Format sample value (integers without decimal point)."""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        """Increase counter for the given label values."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        """Get current value for the given label values."""
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge read from a callback at scrape time, so nothing is recorded on the hot path."""
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.callback = callback
+
+    def render(self) -> list[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Failed to read gauge {self.name}: {e}")
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_value(value)}",
+        ]
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets.
+    observe() is a dict lookup, a bisect and three list increments; buckets
+    are stored per bucket and made cumulative only when rendered.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...],
+        labelnames: tuple[str, ...] = (),
+    ):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labelnames = labelnames
+        # Per label set: [count per bucket..., count over last bucket, sum, count]
+        self._series: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        """Record one observation for the given label values."""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 3)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {_format_value(cumulative)}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {_format_value(series[-1])}")
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{plain} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{plain} {_format_value(series[-1])}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: list[Counter | Gauge | Histogram] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        """Register a callback gauge (replaces an existing one with the same name)."""
+        gauge = Gauge(name, documentation, callback)
+        self._metrics = [m for m in self._metrics if m.name != gauge.name]
+        return self.register(gauge)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+spawn_seconds = registry.register(Histogram(
+    "spawn_seconds",
+    "Time from starting the CLI (or sending a prompt to a warm process) to the first stdout byte",
+    LATENCY_BUCKETS,
+    ("model", "warm"),
+))
+first_token_seconds = registry.register(Histogram(
+    "time_to_first_token_seconds",
+    "Time from request start to the first assistant event",
+    LATENCY_BUCKETS,
+    ("model", "user"),
+))
+result_seconds = registry.register(Histogram(
+    "time_to_result_seconds",
+    "Time from request start to the result event",
+    LATENCY_BUCKETS,
+    ("model", "user"),
+))
+session_turn_seconds = registry.register(Histogram(
+    "session_turn_seconds",
+    "Duration of completed session turns by mode (new, resume, hot)",
+    LATENCY_BUCKETS,
+    ("mode",),
+))
+stream_bytes = registry.register(Histogram(
+    "stream_bytes",
+    "Output bytes streamed per request (characters in the default decoded mode)",
+    BYTES_BUCKETS,
+    ("model", "user"),
+))
+stream_lines = registry.register(Histogram(
+    "stream_lines",
+    "Output lines streamed per request",
+    LINES_BUCKETS,
+    ("model", "user"),
+))
+exit_codes = registry.register(Counter(
+    "process_exits_total",
+    "Finished CLI processes by exit code",
+    ("code",),
+))
+cancellations = registry.register(Counter(
+    "cancellations_total",
+    "Requests cancelled by DELETE /chat or client disconnect",
+    ("model", "user"),
+))
+coalesced_requests = registry.register(Counter(
+    "coalesced_requests_total",
+    "Requests attached to an identical in-flight request instead of starting a process",
+))
+cache_lookups = registry.register(Counter(
+    "cache_lookups_total",
+    "Response cache lookups by result",
+    ("result",),
+))
+cache_bytes_saved = registry.register(Counter(
+    "cache_bytes_saved_total",
+    "Output bytes served from the response cache",
+))
+auth_failures = registry.register(Counter(
+    "auth_failures_total",
+    "Failed authentication attempts",
+))
+rate_limited = registry.register(Counter(
+    "rate_limited_total",
+    "Requests rejected by a per-key rate limit or daily quota",
+    ("user",),
+))
+spawn_failures = registry.register(Counter(
+    "spawn_failures_total",
+    "Claude Code processes that could not be started",
+))
+log_emit_seconds = registry.register(Counter(
+    "log_emit_seconds_total",
+    "Time spent queueing log records on the calling threads (mostly the event loop)",
+))
+log_dropped = registry.register(Counter(
+    "log_dropped_total",
+    "Log records dropped because the log queue was full",
+))
+slow_clients = registry.register(Counter(
+    "slow_clients_total",
+    "Streams whose client fell behind by more than STREAM_BUFFER_BYTES, by slow client policy",
+    ("policy",),
+))
+slow_client_dropped = registry.register(Counter(
+    "slow_client_dropped_events_total",
+    "Partial message events dropped for slow clients (SLOW_CLIENT_POLICY=drop)",
+))
+transcripts_dropped = registry.register(Counter(
+    "transcripts_dropped_total",
+    "Transcripts missing output because the transcript writer queue was full",
+))
+loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the diagnostics heartbeat behind its schedule (DIAGNOSTICS_ENABLED)",
+    LAG_BUCKETS,
+))
+loop_stalls = registry.register(Counter(
+    "event_loop_stalls_total",
+    "Times the event loop was blocked longer than DIAGNOSTICS_SLOW_CALLBACK",
+))
+limits_exceeded = registry.register(Counter(
+    "limits_exceeded_total",
+    "Processes terminated for exceeding a resource limit",
+    ("limit",),
+))
+
+
+class StreamRecorder:
+    """
+    Per-request stream measurements.
+    Counts are kept in plain attributes and written to the histograms once,
+    when the stream finishes; marker scans stop after the first match.
+    """
+
+    __slots__ = ("model", "user", "started", "bytes", "lines", "first_token", "result")
+
+    def __init__(self, model: str | None, user: str, started: float):
+        self.model = model or ""
+        self.user = user
+        self.started = started
+        self.bytes = 0
+        self.lines = 0
+        # Seconds from request start to the first assistant event
+        self.first_token: float | None = None
+        self.result = False
+
+    def line(self, line: str) -> None:
+        """Record one decoded output line."""
+        self.bytes += len(line) + 1
+        self.lines += 1
+        if self.first_token is None and line.startswith('{"type":"assistant"'):
+            self.first_token = time.monotonic() - self.started
+            first_token_seconds.observe(self.first_token, self.model, self.user)
+        if not self.result and '"type":"result"' in line[:100]:
+            self.result = True
+            result_seconds.observe(time.monotonic() - self.started, self.model, self.user)
+
+    def block(self, block: bytes) -> None:
+        """Record a raw block of newline-terminated output lines."""
+        self.bytes += len(block)
+        self.lines += block.count(b"\n")
+        if self.first_token is None and b'{"type":"assistant"' in block:
+            self.first_token = time.monotonic() - self.started
+            first_token_seconds.observe(self.first_token, self.model, self.user)
+        if not self.result and b'{"type":"result"' in block:
+            self.result = True
+            result_seconds.observe(time.monotonic() - self.started, self.model, self.user)
+
+    def long_line(self, size: int) -> None:
+        """Record an oversized line streamed in chunks."""
+        self.bytes += size
+        self.lines += 1
+
+    def cancelled(self) -> None:
+        """Record cancellation of the request."""
+        cancellations.inc(self.model, self.user)
+
+    def finish(self) -> None:
+        """Write per-request totals to the histograms."""
+        stream_bytes.observe(self.bytes, self.model, self.user)
+        stream_lines.observe(self.lines, self.model, self.user)
@@ -6,6 +6,25 @@ from typing import Any
 from pydantic import BaseModel, Field
 
 
+class ResourceLimits(BaseModel):
+    """Resource limits of one request (None = not limited at this level)."""
+
+    wall_seconds: float | None = Field(default=None, gt=0, description="Max run time")
+    cpu_seconds: float | None = Field(default=None, gt=0, description="Max CPU time of the process tree")
+    memory_bytes: int | None = Field(default=None, gt=0, description="Max RSS of the process tree")
+    output_bytes: int | None = Field(default=None, gt=0, description="Max stdout bytes")
+
+
+class ResourceUsage(BaseModel):
+    """Measured resource usage of a process (tree)."""
+
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    output_bytes: int = 0
+    limit_exceeded: str | None = None
+
+
 class ChatRequest(BaseModel):
     """Request model for POST /chat endpoint."""
 
@@ -53,6 +72,122 @@ class ChatRequest(BaseModel):
     # Advanced
     agents: dict[str, Any] | None = Field(default=None, description="Custom agents definition")
     plugin_dir: list[str] | None = Field(default=None, description="Plugin directories")
+    include_partial_messages: bool | None = Field(default=None, description="Also stream partial message events (stream_event) with token deltas")
+
+    # Gateway options
+    cache: bool | None = Field(default=None, description="Serve repeated identical requests from the response cache (if enabled on the server)")
+    cache_fingerprint_cwd: bool | None = Field(default=None, description="Include file names, sizes and mtimes of cwd in the cache key")
+    limits: ResourceLimits | None = Field(default=None, description="Resource limits, can only lower the server and user limits")
+    profile: str | None = Field(default=None, description="Server-side profile (POST /profiles) supplying the options not set in this request")
+
+
+class ChatCompletionMessage(BaseModel):
+    """One message of an OpenAI chat completion request."""
+
+    role: str
+    content: str | list[dict[str, Any]] | None = None
+
+
+class ChatCompletionRequest(BaseModel):
+    """Request model for POST /v1/chat/completions (OpenAI compatible, other OpenAI fields are ignored)."""
+
+    model: str = Field(default="sonnet", description="Model to use (sonnet, opus, haiku, or full name)")
+    messages: list[ChatCompletionMessage] = Field(..., min_length=1, description="Conversation, last message from the user")
+    stream: bool = Field(default=False, description="Stream chat.completion.chunk events")
+    stream_options: dict[str, Any] | None = Field(default=None, description="Set include_usage to get a final usage chunk")
+    response_format: dict[str, Any] | None = Field(default=None, description="json_schema format maps to structured output")
+
+    # Gateway extensions (extra_body in the OpenAI SDK)
+    cwd: str | None = Field(default=None, description="Working directory (OPENAI_DEFAULT_CWD if not set)")
+    session_id: str | None = Field(default=None, description="Session ID to resume instead of matching the history")
+    profile: str | None = Field(default=None, description="Server-side profile (POST /profiles)")
+
+
+class ProfileRequest(BaseModel):
+    """Request model for POST /profiles: CLI options stored once and referenced by name."""
+
+    name: str = Field(..., pattern=r"^[A-Za-z0-9_.-]{1,64}$", description="Profile name used in 'profile' of requests")
+
+    model: str | None = Field(default=None, description="Model to use")
+    fallback_model: str | None = Field(default=None, description="Fallback model when primary is overloaded")
+    system_prompt: str | None = Field(default=None, description="Replace default system prompt")
+    append_system_prompt: str | None = Field(default=None, description="Append to default system prompt")
+    tools: list[str] | None = Field(default=None, description="Whitelist of available tools")
+    allowed_tools: list[str] | None = Field(default=None, description="Tool/command patterns auto-approved without blocking")
+    disallowed_tools: list[str] | None = Field(default=None, description="Tools completely removed from AI context")
+    permission_mode: str | None = Field(default=None, description="Permission mode")
+    mcp_config: list[str | dict[str, Any]] | None = Field(default=None, description="MCP configs: JSON objects, JSON strings or file paths")
+    strict_mcp_config: bool | None = Field(default=None, description="Only use MCP servers from mcp_config")
+    settings: str | dict[str, Any] | None = Field(default=None, description="Settings: JSON object, JSON string or file path")
+    add_dir: list[str] | None = Field(default=None, description="Additional directories to allow access")
+    json_schema: dict[str, Any] | None = Field(default=None, description="JSON Schema for structured output")
+    agents: dict[str, Any] | None = Field(default=None, description="Custom agents definition")
+    plugin_dir: list[str] | None = Field(default=None, description="Plugin directories")
+
+
+class ProfileInfo(BaseModel):
+    """A stored profile."""
+
+    name: str
+    digest: str
+    created_at: datetime
+    created_by: str
+    options: dict[str, Any]
+    files: list[str]
+
+
+class ProfileListResponse(BaseModel):
+    """Response model for GET /profiles endpoint."""
+
+    profiles: list[ProfileInfo]
+    count: int
+
+
+class BatchRequest(BaseModel):
+    """Request model for POST /chat/batch endpoint."""
+
+    requests: list[ChatRequest] | None = Field(default=None, description="Requests to run")
+    template: ChatRequest | None = Field(default=None, description="Request used for every prompt in 'prompts' (its prompt is replaced)")
+    prompts: list[str] | None = Field(default=None, description="Prompts run with 'template'")
+    parallelism: int = Field(default=4, ge=1, description="Max requests running at once (capped by the server)")
+
+    def expand(self) -> list[ChatRequest]:
+        """Get the list of requests to run."""
+        items = list(self.requests or [])
+        if self.template is not None:
+            items.extend(self.template.model_copy(update={"prompt": prompt}) for prompt in self.prompts or [])
+        return items
+
+
+class BatchItemResult(BaseModel):
+    """One NDJSON line of the POST /chat/batch response."""
+
+    index: int
+    process_id: str | None = None
+    status: str
+    session_id: str | None = None
+    queued_ms: int | None = None
+    duration_ms: int | None = None
+    result: dict[str, Any] | None = None
+    resources: ResourceUsage | None = None
+    error: str | None = None
+
+
+class SyncChatResponse(BaseModel):
+    """Response model for POST /chat/sync (and POST /chat?stream=false)."""
+
+    process_id: str
+    status: str
+    session_id: str | None = None
+    result: str | None = None
+    structured_output: Any = None
+    usage: dict[str, Any] | None = None
+    total_cost_usd: float | None = None
+    duration_ms: int | None = None
+    num_turns: int | None = None
+    events: int = 0
+    tool_calls: dict[str, int] | None = None
+    resources: ResourceUsage | None = None
 
 
 class HealthResponse(BaseModel):
@@ -63,6 +198,50 @@ class HealthResponse(BaseModel):
     claude_version: str
 
 
+class KeyUsage(BaseModel):
+    """Request counters of one API key (or password login) on this worker."""
+
+    key_id: str
+    user: str
+    requests: int
+    requests_today: int
+    rejected: int
+    last_used_at: datetime | None = None
+
+
+class KeyUsageResponse(BaseModel):
+    """Response model for GET /auth/usage endpoint."""
+
+    keys: list[KeyUsage]
+    count: int
+
+
+class ReadinessResponse(BaseModel):
+    """Response model for GET /health/ready endpoint."""
+
+    ready: bool
+    reasons: list[str] = []
+    available_slots: int | None = None
+
+
+class CapacityResponse(ReadinessResponse):
+    """Response model for GET /health/capacity endpoint."""
+
+    draining: bool
+    active_processes: int
+    running: int
+    queue_depth: int
+    max_concurrent: int
+    warm_idle: int
+    memory_available_bytes: int | None = None
+    memory_total_bytes: int | None = None
+    load_1m: float | None = None
+    cpu_count: int
+    spawns_recent: int
+    spawn_failures_recent: int
+    spawn_failure_rate: float
+
+
 class ErrorResponse(BaseModel):
     """Error response model."""
 
@@ -77,6 +256,36 @@ class ProcessInfo(BaseModel):
     model: str | None
     started_at: datetime
     session_id: str | None = None
+    user: str | None = None
+    status: str = "running"
+    worker: str | None = None
+    resources: ResourceUsage | None = None
+
+
+class SessionInfo(BaseModel):
+    """A conversation session seen by the gateway."""
+
+    session_id: str
+    cwd: str
+    model: str | None
+    user: str
+    created_at: datetime
+    last_used_at: datetime
+    turns: int
+    hot_turns: int
+    hot: bool = False
+    transcript_bytes: int | None = None
+    last_turn_seconds: float
+    avg_turn_seconds: float
+    avg_hot_turn_seconds: float | None = None
+    avg_resume_turn_seconds: float | None = None
+
+
+class SessionListResponse(BaseModel):
+    """Response model for GET /sessions endpoint."""
+
+    sessions: list[SessionInfo]
+    count: int
 
 
 class ProcessListResponse(BaseModel):
@@ -91,3 +300,161 @@ class CancelResponse(BaseModel):
 
     status: str
     process_id: str
+
+
+class PoolStats(BaseModel):
+    """Warm process pool counters."""
+
+    enabled: bool
+    idle: int
+    keys: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    spawned: int
+    retired: int
+    hot_sessions: int = 0
+    session_hits: int = 0
+    session_misses: int = 0
+
+
+class CacheStats(BaseModel):
+    """Response cache counters."""
+
+    enabled: bool
+    entries: int
+    memory_bytes: int
+    hits: int
+    misses: int
+    hit_ratio: float
+    bytes_saved: int
+
+
+class StreamTimingsInfo(BaseModel):
+    """Where the time of one stream went (GET /debug/streams)."""
+
+    process_id: str
+    user: str
+    started_at: datetime
+    finished: bool
+    duration_seconds: float
+    # Waiting for an admission slot
+    queue_seconds: float
+    # From admission to the first output (spawn and CLI startup)
+    first_output_seconds: float | None = None
+    # Time the SSE writer waited for output, and spent sending events
+    read_wait_seconds: float
+    write_seconds: float
+    bytes_in: int
+    bytes_out: int
+    events: int
+
+
+class DebugStreamsResponse(BaseModel):
+    """Timings of active and recently finished streams."""
+
+    streams: list[StreamTimingsInfo]
+    count: int
+
+
+class StallInfo(BaseModel):
+    """A period the event loop was blocked, with the stack that blocked it."""
+
+    detected_at: datetime
+    seconds: float
+    stack: list[str]
+
+
+class LoopDiagnostics(BaseModel):
+    """Event loop lag and stalls (GET /debug/loop)."""
+
+    lag_interval: float
+    slow_callback_seconds: float
+    last_lag_seconds: float
+    max_lag_seconds: float
+    stalls: int
+    recent_stalls: list[StallInfo]
+
+
+class RunInfo(BaseModel):
+    """A finished run from the run history (GET /runs)."""
+
+    run_id: str
+    user: str
+    model: str | None = None
+    cwd: str
+    session_id: str | None = None
+    started_at: datetime
+    finished_at: datetime
+    # success, error (result with is_error), failed (no result), cancelled, limit_exceeded or rejected
+    status: str
+    exit_code: int | None = None
+    prompt_chars: int
+    duration_seconds: float
+    queue_seconds: float
+    first_token_seconds: float | None = None
+    num_turns: int | None = None
+    cost_usd: float | None = None
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    cache_read_tokens: int | None = None
+    cache_creation_tokens: int | None = None
+    output_bytes: int = 0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    worker: str | None = None
+
+
+class RunListResponse(BaseModel):
+    """A page of runs, newest first."""
+
+    runs: list[RunInfo]
+    count: int
+    # Pass as cursor= to get the next page (None on the last page)
+    next_cursor: str | None = None
+
+
+class RunStats(BaseModel):
+    """Aggregates of the runs of one model in one time bucket."""
+
+    model: str | None = None
+    bucket_start: datetime
+    runs: int
+    errors: int
+    p50_seconds: float
+    p95_seconds: float
+    p50_first_token_seconds: float | None = None
+    p95_first_token_seconds: float | None = None
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+
+
+class RunStatsResponse(BaseModel):
+    """Run aggregates per model and time bucket (GET /runs/stats)."""
+
+    since: datetime
+    until: datetime
+    bucket_seconds: int
+    stats: list[RunStats]
+
+
+class TranscriptEvent(BaseModel):
+    """One recorded output line of a run."""
+
+    index: int
+    data: str
+
+
+class TranscriptEventsResponse(BaseModel):
+    """A range of a run's transcript (GET /runs/{run_id}/events)."""
+
+    run_id: str
+    user: str
+    started_at: datetime
+    finished_at: datetime | None = None
+    status: str | None = None
+    complete: bool
+    total: int
+    next_from: int | None = None
+    events: list[TranscriptEvent]
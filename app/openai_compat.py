@@ -0,0 +1,256 @@
+"""Translation between OpenAI chat completions and Claude Code requests and events."""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.config import get_settings
+from app.events import event_type
+from app.models import ChatCompletionMessage, ChatCompletionRequest, ChatRequest
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_ROLES = ("system", "developer")
+
+
+def message_text(message: ChatCompletionMessage) -> str:
+    """Get the text of a message (string content or list of text parts)."""
+    if message.content is None:
+        return ""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") for part in message.content if part.get("type") == "text")
+
+
+def conversation_key(user: str, cwd: str, turns: list[tuple[str, str]]) -> str:
+    """Hash of a user's conversation (role, text pairs) in a working directory."""
+    return hashlib.sha256(json.dumps([user, cwd, turns]).encode("utf-8")).hexdigest()
+
+
+class SessionMap:
+    """
+    Maps conversation histories to Claude sessions (LRU).
+    When a client sends a history the gateway produced, the session is resumed
+    and only the new user message is sent as the prompt.
+    """
+
+    def __init__(self):
+        self._sessions: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        session_id = self._sessions.get(key)
+        if session_id:
+            self._sessions.move_to_end(key)
+        return session_id
+
+    def put(self, key: str, session_id: str) -> None:
+        self._sessions[key] = session_id
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > get_settings().openai_session_map_size:
+            self._sessions.popitem(last=False)
+
+
+sessions = SessionMap()
+
+
+def to_chat_request(body: ChatCompletionRequest, cwd: str, user: str) -> tuple[ChatRequest, list[tuple[str, str]]]:
+    """
+    Map an OpenAI chat completion request of user onto a ChatRequest.
+    Only sessions of the user's own earlier conversations are resumed.
+    Returns the request and the conversation turns (used to remember the session).
+    Raises ValueError if the last message is not a user message.
+    """
+    system = [message_text(m) for m in body.messages if m.role in SYSTEM_ROLES]
+    turns = [(m.role, message_text(m)) for m in body.messages if m.role not in SYSTEM_ROLES]
+    if not turns or turns[-1][0] != "user":
+        raise ValueError("Last message must be a user message")
+
+    history, prompt = turns[:-1], turns[-1][1]
+    session_id = body.session_id
+    if not session_id and history:
+        session_id = sessions.get(conversation_key(user, cwd, history))
+        if session_id:
+            logger.debug(f"Resuming session {session_id} for {len(history)} earlier messages")
+        else:
+            # Unknown history: send it along with the prompt
+            transcript = "\n\n".join(f"{role.capitalize()}: {text}" for role, text in history)
+            prompt = f"<conversation>\n{transcript}\n</conversation>\n\n{prompt}"
+
+    json_schema = None
+    if body.response_format and body.response_format.get("type") == "json_schema":
+        json_schema = (body.response_format.get("json_schema") or {}).get("schema")
+
+    request = ChatRequest(
+        prompt=prompt,
+        cwd=cwd,
+        model=body.model,
+        session_id=session_id,
+        system_prompt="\n\n".join(system) or None,
+        json_schema=json_schema,
+        include_partial_messages=body.stream and json_schema is None,
+        profile=body.profile,
+    )
+    return request, turns
+
+
+def usage_from_result(result: dict) -> dict[str, int]:
+    """Build OpenAI usage numbers from the usage of a result event."""
+    usage = result.get("usage") or {}
+    prompt_tokens = (
+        usage.get("input_tokens", 0)
+        + usage.get("cache_creation_input_tokens", 0)
+        + usage.get("cache_read_input_tokens", 0)
+    )
+    completion_tokens = usage.get("output_tokens", 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class CompletionTranslator:
+    """
+    Translates Claude stream-json lines into chat completion text deltas.
+
+    Text comes from partial message deltas when the CLI sends them, otherwise
+    from whole assistant messages. Texts of separate assistant messages (turns
+    around tool calls) are joined with a blank line. With a JSON schema the
+    content is the structured output of the result event.
+
+    After a gap (deltas dropped for a slow client, see gap()), the rest of a
+    message's text is taken from its whole assistant message instead.
+    """
+
+    def __init__(self, completion_id: str, model: str, structured: bool = False):
+        self.completion_id = completion_id
+        self.model = model
+        self.created = int(time.time())
+        self.structured = structured
+        self.session_id: str | None = None
+        self.result: dict | None = None
+        self.text_sent = False
+        self._partial = False
+        self._new_message = True
+        # Delta text sent since the last whole assistant message, and whether deltas were dropped since
+        self._streamed = ""
+        self._gap = False
+
+    def gap(self) -> None:
+        """Note that partial message events were dropped before the next line."""
+        self._gap = True
+
+    def feed(self, line: str) -> str | None:
+        """Process one output line, return the text delta it carries (if any)."""
+        etype = event_type(line)
+        if etype not in ("assistant", "stream_event", "result", "system"):
+            return None
+
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+
+        if etype == "system":
+            self.session_id = data.get("session_id") or self.session_id
+            return None
+
+        if etype == "result":
+            self.result = data
+            self.session_id = data.get("session_id") or self.session_id
+            if self.structured and data.get("structured_output") is not None:
+                return self._text(json.dumps(data["structured_output"]))
+            if not self.text_sent and isinstance(data.get("result"), str):
+                return self._text(data["result"])
+            return None
+
+        if self.structured:
+            return None
+
+        if etype == "stream_event":
+            event = data.get("event") or {}
+            if event.get("type") == "message_start":
+                self._new_message = True
+            elif event.get("type") == "content_block_delta":
+                delta = event.get("delta") or {}
+                if delta.get("type") == "text_delta":
+                    self._partial = True
+                    if self._gap:
+                        return None
+                    text = delta.get("text", "")
+                    self._streamed += text
+                    return self._text(text)
+            return None
+
+        # Whole assistant message (already sent as deltas with partial messages)
+        content = (data.get("message") or {}).get("content") or []
+        text = "".join(block.get("text", "") for block in content if block.get("type") == "text")
+        streamed, self._streamed = self._streamed, ""
+        gap, self._gap = self._gap, False
+        if gap and streamed:
+            # Continue the streamed text with what the gap left out
+            self._new_message = True
+            rest = text[len(streamed):] if text.startswith(streamed) else ""
+            return rest or None
+        self._new_message = True
+        if self._partial and not gap:
+            return None
+        return self._text(text) if text else None
+
+    def _text(self, text: str) -> str:
+        """Prefix the first text of a new assistant message with a separator."""
+        if self._new_message and self.text_sent and text:
+            text = "\n\n" + text
+        if text:
+            self._new_message = False
+            self.text_sent = True
+        return text
+
+    @property
+    def finish_reason(self) -> str:
+        if self.result and self.result.get("subtype") == "error_max_turns":
+            return "length"
+        return "stop"
+
+    @property
+    def usage(self) -> dict[str, int] | None:
+        return usage_from_result(self.result) if self.result else None
+
+    def chunk(self, delta: dict[str, Any], finish_reason: str | None = None) -> dict:
+        """Build a chat.completion.chunk object."""
+        return {
+            "id": self.completion_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def usage_chunk(self) -> dict:
+        """Build the final chunk with usage (stream_options.include_usage)."""
+        return {
+            "id": self.completion_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [],
+            "usage": self.usage,
+        }
+
+    def completion(self, content: str) -> dict:
+        """Build a chat.completion object."""
+        return {
+            "id": self.completion_id,
+            "object": "chat.completion",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": self.finish_reason,
+            }],
+            "usage": self.usage,
+        }
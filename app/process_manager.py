@@ -1,18 +1,54 @@
 """Process manager for tracking and controlling Claude Code subprocesses."""
 
 import asyncio
+import json
 import logging
+import time
 import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
 from typing import AsyncGenerator
 
-from app.claude import run_claude
-from app.models import ChatRequest, ProcessInfo
+from app import metrics
+from app.admission import AdmissionController, AdmissionRejected, QueuePosition, spread_retry_after
+from app.broadcast import StreamBroadcast
+from app.cache import ResponseCache, replay, request_key
+from app.claude import output_size, run_claude
+from app.config import get_settings
+from app.diagnostics import diagnostics
+from app.events import find_event
+from app.limits import ResourceMonitor, resolve_limits
+from app.line_reader import LongLine
+from app.logs import bind_log_context
+from app.models import ChatRequest, ProcessInfo, ResourceUsage, SessionInfo
+from app.registry import MemoryRegistry, SqliteRegistry, create_registry
+from app.runs import runs
+from app.sessions import SessionRegistry
+from app.transcripts import transcripts
+from app.warm_pool import WarmPool
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class Flight:
+    """
+    One process whose output is pumped by a background task, shared by
+    identical requests (single-flight) and/or kept for reattaching (detached).
+    """
+
+    key: str | None
+    broadcast: StreamBroadcast
+    subscribers: set[str] = field(default_factory=set)
+    # Subscribers whose stream has started (the others clean up when the process ends)
+    following: set[str] = field(default_factory=set)
+    detached: bool = False
+    raw: bool = False
+    # Clients currently reading a detached flight, and since when none has been
+    attached: int = 0
+    idle_since: float = field(default_factory=time.monotonic)
+
+
 @dataclass
 class ManagedProcess:
     """Internal representation of a managed process."""
@@ -23,6 +59,9 @@ class ManagedProcess:
     model: str | None
     started_at: datetime
     session_id: str | None = None
+    user: str = ""
+    status: str = "running"
+    flight: Flight | None = field(default=None, repr=False)
     _cancelled: bool = field(default=False, repr=False)
 
 
@@ -34,40 +73,254 @@ class ProcessManager:
 
     def __init__(self):
         self._processes: dict[str, ManagedProcess] = {}
+        self._flights: dict[str, Flight] = {}
+        self._detached: dict[str, Flight] = {}
+        self._reaper: asyncio.Task | None = None
         self._lock = asyncio.Lock()
+        self.warm_pool = WarmPool()
+        self.admission = AdmissionController()
+        self.registry: MemoryRegistry | SqliteRegistry = MemoryRegistry()
+        self.cache = ResponseCache()
+        self.sessions = SessionRegistry()
+        self.draining = False
+
+        metrics.registry.gauge("active_processes", "Requests admitted and running", lambda: self.admission.active)
+        metrics.registry.gauge("queue_depth", "Requests waiting for an admission slot", lambda: self.admission.queue_depth)
+        metrics.registry.gauge("warm_pool_idle", "Idle warm processes", lambda: self.warm_pool.idle_count)
+        metrics.registry.gauge("draining", "1 while the server drains before shutdown", lambda: int(self.draining))
+
+    async def start(self) -> None:
+        """Start registry backend, warm pool and detached process reaper (called at application startup)."""
+        self.registry = create_registry()
+        await self.registry.start(on_cancel=self.kill_process)
+        self.warm_pool.start()
+        self._reaper = asyncio.create_task(self._reap_detached_loop())
+
+    async def stop(self) -> None:
+        """Stop detached processes, warm pool and registry backend (called at application shutdown)."""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        for process_id, flight in list(self._detached.items()):
+            await self._drop_detached(flight, process_id)
+        await self.warm_pool.stop()
+        await self.registry.stop()
+
+    def _running_ids(self) -> list[str]:
+        """Get IDs of processes that are queued or running (not finished detached ones)."""
+        return [pid for pid, managed in self._processes.items() if managed.status != "finished"]
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Stop accepting requests and wait up to timeout seconds for running
+        processes (attached or detached) to finish, then terminate the rest.
+        """
+        if self.draining:
+            return
+        self.draining = True
+        self.admission.close(get_settings().drain_retry_after)
+
+        deadline = time.monotonic() + timeout
+        next_log = 0.0
+        while running := self._running_ids():
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now >= next_log:
+                logger.info(f"Draining: waiting for {len(running)} processes ({deadline - now:.0f}s left)")
+                next_log = now + 10
+            await asyncio.sleep(min(0.5, deadline - now))
+
+        running = self._running_ids()
+        if running:
+            logger.warning(f"Drain deadline passed, terminating {len(running)} processes")
+            await asyncio.gather(*(self.kill_process(pid) for pid in running))
+        logger.info("Drain complete")
 
     async def start_process(
         self,
         request: ChatRequest,
-    ) -> tuple[str, AsyncGenerator[str, None]]:
+        user: str = "",
+        raw: bool = False,
+        detach: bool = False,
+    ) -> tuple[str, AsyncGenerator[str | bytes | LongLine | QueuePosition | ResourceUsage, None]]:
         """
         Start a new Claude Code process.
         Returns (process_id, stream_generator).
+
+        The process waits in the admission queue if concurrency limits are reached;
+        the stream then yields QueuePosition items before the first output line.
+        Raises AdmissionRejected if the queue is full or the server is draining.
+        The slot is taken when the stream starts, so the stream itself raises
+        AdmissionRejected if the queue filled up in between.
+
+        In raw mode the stream yields byte blocks of output lines (or LongLine) instead of strings.
+        When the process ends, the stream yields its ResourceUsage as the last item.
+
+        With request coalescing enabled, a request identical to one in flight
+        (same user and mode) gets its own process_id but follows the output of
+        the running process, starting with a replay of what it already printed.
+
+        In detached mode the process runs in a background task that outlives the
+        client connection. The stream yields (event_id, item) tuples, and
+        attach() resumes it by event id until the process is reaped after
+        detach_idle_timeout with no client attached.
         """
         process_id = str(uuid.uuid4())
+        settings = get_settings()
+
+        if self.draining:
+            raise AdmissionRejected(
+                "Server is shutting down",
+                status_code=503,
+                retry_after=spread_retry_after(settings.drain_retry_after),
+            )
 
         logger.info(f"Starting process {process_id} in {request.cwd}")
 
+        coalesce_key = None
+        if settings.coalesce_requests and not detach:
+            coalesce_key = request_key(request, user=user, raw=raw)
+            flight = self._flights.get(coalesce_key)
+            if flight and flight.broadcast.joinable:
+                return process_id, await self._join_flight(flight, process_id, request, user)
+
+        # Serve identical cacheable requests without starting a process
+        cache_key = await self.cache.make_key(request, user)
+        if cache_key:
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Process {process_id} served from cache ({len(cached)} bytes)")
+                return process_id, replay(cached, raw)
+
+        # Reject with 429 before the response starts; the slot itself is taken by the stream
+        self.admission.check(user, request.cwd)
+        recorder = metrics.StreamRecorder(request.model, user, time.monotonic())
+        # A shared or detached process is registered now so identical requests and
+        # reattaches find it; a plain one only once its stream starts
+        shared = bool(coalesce_key or detach)
+        monitor = ResourceMonitor(
+            process_id,
+            resolve_limits(request, user),
+            on_sample=lambda usage: self._update_linked(process_id, resources=usage),
+        )
+
         # Create the stream generator
-        async def wrapped_stream() -> AsyncGenerator[str, None]:
+        async def wrapped_stream() -> AsyncGenerator[str | bytes | LongLine | QueuePosition | ResourceUsage, None]:
+            # Nothing is reserved until the stream starts: the generator of a client that
+            # disconnects before the response body never runs, so its finally would not either
+            ticket = self.admission.enter(user, request.cwd)
+            timings = diagnostics.track(process_id, user)
+            run = runs.track(process_id, request, user, datetime.utcnow())
+            transcript = transcripts.record(process_id, user)
+            if not shared:
+                managed.status = "running" if ticket.active else "queued"
+                async with self._lock:
+                    self._processes[process_id] = managed
+                await self.registry.add(self._process_info(managed))
+                logger.info(f"Process {process_id} registered, total active: {len(self._processes)}")
+            warm = None
+            completed = False
+            managed.task = asyncio.current_task()
+            bind_log_context(process_id=process_id, user=user, session_id=request.session_id)
+            run_status = "failed"
             try:
-                async for line in run_claude(request):
+                async for position in self.admission.wait(ticket):
+                    managed.status = "queued"
+                    yield QueuePosition(position=position)
+                if timings:
+                    timings.admitted()
+                if run:
+                    run.admitted = time.monotonic()
+                if managed.status != "running":
+                    for pid in self._linked_ids(process_id):
+                        self._processes[pid].status = "running"
+                        await self.registry.update(pid, status="running")
+
+                # A process started in a cgroup cannot go back to the pool
+                if not monitor.uses_cgroup:
+                    warm = await self.warm_pool.acquire(request, user)
+                if request.session_id:
+                    mode = "hot" if warm and warm.uses > 1 else "resume"
+                else:
+                    mode = "new"
+                turn_started = time.monotonic()
+                capture = self.cache.capture(cache_key) if cache_key else None
+                session_pending = True
+                async for line in run_claude(request, warm=warm, raw=raw, monitor=monitor):
+                    if timings:
+                        timings.output(output_size(line))
+                    if run:
+                        run.output(line)
+                    if transcript:
+                        transcript.add(line)
                     # Update session_id from first system message if available
-                    if '"type":"system"' in line and '"session_id"' in line:
-                        try:
-                            import json
-                            data = json.loads(line)
-                            if data.get("session_id"):
-                                async with self._lock:
-                                    if process_id in self._processes:
-                                        self._processes[process_id].session_id = data["session_id"]
-                                        logger.debug(f"Process {process_id} session_id: {data['session_id']}")
-                        except:
-                            pass
+                    if session_pending:
+                        system_line = find_event(line, "system")
+                        if system_line is not None:
+                            session_pending = False
+                            await self._update_session_id(process_id, system_line)
+
+                    if not raw:
+                        recorder.line(line)
+                        if capture:
+                            capture.line(line)
+                    elif isinstance(line, LongLine):
+                        yield line
+                        recorder.long_line(line.size)
+                        if capture:
+                            capture.long_line()
+                        continue
+                    else:
+                        recorder.block(line)
+                        if capture:
+                            capture.block(line)
                     yield line
+
+                turn_seconds = time.monotonic() - turn_started
+                usage = await monitor.finish()
+                await self._update_linked(process_id, resources=usage)
+                if managed.session_id and not usage.limit_exceeded:
+                    completed = True
+                    self.sessions.record_turn(managed.session_id, request, user, turn_seconds, mode)
+                if capture and not usage.limit_exceeded:
+                    await self.cache.store(capture)
+                run_status = "limit_exceeded" if usage.limit_exceeded else "completed"
+                yield usage
+            except AdmissionRejected:
+                run_status = "rejected"
+                raise
+            except (asyncio.CancelledError, GeneratorExit):
+                if run_status == "failed":
+                    run_status = "cancelled"
+                    recorder.cancelled()
+                raise
             finally:
-                # Cleanup when stream ends
-                await self._cleanup_process(process_id)
+                usage = await monitor.finish()
+                recorder.finish()
+                diagnostics.finish(timings)
+                transcripts.finish(transcript, run_status)
+                runs.finish(
+                    run,
+                    run_status,
+                    session_id=managed.session_id,
+                    exit_code=monitor.exit_code,
+                    first_token=recorder.first_token,
+                    output_bytes=recorder.bytes,
+                    cpu_seconds=usage.cpu_seconds,
+                    peak_rss_bytes=usage.peak_rss_bytes,
+                )
+                self.admission.release(ticket)
+                # Return warm process to the pool (retired if it was terminated)
+                if warm:
+                    await self.warm_pool.release(warm, session_id=managed.session_id if completed else None)
+                # Cleanup when stream ends (subscribers of a flight clean up themselves,
+                # detached processes are kept for reattaching until reaped)
+                if not managed.flight:
+                    await self._cleanup_process(process_id)
+                elif managed.flight.detached and process_id in self._processes:
+                    managed.status = "finished"
+                    await self.registry.update(process_id, status="finished")
 
         # Create task placeholder (will be set by caller)
         managed = ManagedProcess(
@@ -77,26 +330,243 @@ class ProcessManager:
             model=request.model,
             started_at=datetime.utcnow(),
             session_id=request.session_id,
+            user=user,
+            status="queued",
         )
 
+        if not shared:
+            return process_id, wrapped_stream()
+
         async with self._lock:
             self._processes[process_id] = managed
+        await self.registry.add(self._process_info(managed))
 
         logger.info(f"Process {process_id} registered, total active: {len(self._processes)}")
 
-        return process_id, wrapped_stream()
+        # Run the process in a pump task shared with identical requests or kept for reattaching
+        if detach:
+            broadcast = StreamBroadcast(
+                wrapped_stream(),
+                max_pending=settings.stream_buffer_items,
+                replay_max_bytes=0,
+                ring_bytes=settings.detach_buffer_bytes,
+            )
+        else:
+            broadcast = StreamBroadcast(
+                wrapped_stream(),
+                max_pending=settings.stream_buffer_items,
+                replay_max_bytes=settings.coalesce_replay_max_bytes,
+            )
+        flight = Flight(
+            key=coalesce_key,
+            broadcast=broadcast,
+            subscribers={process_id},
+            detached=detach,
+            raw=raw,
+        )
+        managed.flight = flight
+        if coalesce_key:
+            self._flights[coalesce_key] = flight
+        if detach:
+            self._detached[process_id] = flight
+        broadcast.start()
+        broadcast.task.add_done_callback(lambda _: self._finish_flight(flight))
+
+        return process_id, self._follow_flight(flight, process_id)
+
+    def attach(
+        self,
+        process_id: str,
+        last_event_id: int | None = None,
+    ) -> tuple[bool, AsyncGenerator] | None:
+        """
+        Reattach to a detached process.
+        Returns (raw, stream) where the stream resumes after last_event_id
+        (or starts with the oldest retained event), or None if there is no
+        such detached process on this worker.
+        """
+        flight = self._detached.get(process_id)
+        if not flight:
+            return None
+        start = last_event_id + 1 if last_event_id is not None else None
+        logger.info(f"Reattaching to process {process_id} from event {start}")
+        return flight.raw, self._follow_flight(flight, process_id, start=start)
+
+    async def _join_flight(
+        self,
+        flight: Flight,
+        process_id: str,
+        request: ChatRequest,
+        user: str,
+    ) -> AsyncGenerator[str | bytes | QueuePosition, None]:
+        """Register a request as another subscriber of a running flight."""
+        leader = next((self._processes[pid] for pid in flight.subscribers if pid in self._processes), None)
+        managed = ManagedProcess(
+            process_id=process_id,
+            task=None,  # type: ignore
+            cwd=request.cwd,
+            model=request.model,
+            started_at=datetime.utcnow(),
+            session_id=leader.session_id if leader else request.session_id,
+            user=user,
+            status=leader.status if leader else "running",
+            flight=flight,
+        )
+        flight.subscribers.add(process_id)
+
+        async with self._lock:
+            self._processes[process_id] = managed
+        await self.registry.add(self._process_info(managed))
+
+        logger.info(f"Process {process_id} joined in-flight identical request ({len(flight.subscribers)} subscribers)")
+        metrics.coalesced_requests.inc()
+
+        return self._follow_flight(flight, process_id)
+
+    async def _follow_flight(
+        self,
+        flight: Flight,
+        process_id: str,
+        start: int | None = None,
+    ) -> AsyncGenerator[str | bytes | QueuePosition, None]:
+        """Stream a flight's output to one subscriber."""
+        if flight.detached:
+            # Disconnecting does not stop a detached process, it only starts the idle timer
+            subscriber_id = f"{process_id}#{uuid.uuid4().hex[:8]}"
+            flight.attached += 1
+            try:
+                async for item in flight.broadcast.subscribe(subscriber_id, start=start, with_ids=True):
+                    yield item
+            finally:
+                flight.attached -= 1
+                flight.idle_since = time.monotonic()
+            return
+
+        flight.following.add(process_id)
+        try:
+            async for item in flight.broadcast.subscribe(process_id):
+                yield item
+        finally:
+            await self._leave_flight(flight, process_id)
+
+    async def _leave_flight(self, flight: Flight, process_id: str) -> None:
+        """Remove a subscriber; the shared process is cancelled when the last one leaves."""
+        if process_id in flight.subscribers:
+            flight.subscribers.discard(process_id)
+            flight.broadcast.detach(process_id)
+            if not flight.subscribers and not flight.broadcast.finished:
+                logger.info(f"Last subscriber left, cancelling shared process {process_id}")
+                self._end_flight(flight)
+                flight.broadcast.task.cancel()
+        await self._cleanup_process(process_id)
+
+    def _finish_flight(self, flight: Flight) -> None:
+        """
+        Close a flight whose process ended. Subscribers whose stream never
+        started (the client left before the response body) are removed here,
+        since their own cleanup only runs once the stream does. Detached
+        processes are kept for reattaching until reaped.
+        """
+        self._end_flight(flight)
+        if flight.detached:
+            return
+        for process_id in flight.subscribers - flight.following:
+            logger.info(f"Process {process_id} never read its shared output, cleaning up")
+            asyncio.create_task(self._leave_flight(flight, process_id))
+
+    def _end_flight(self, flight: Flight) -> None:
+        """Stop accepting new subscribers for a flight."""
+        if flight.key and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    async def _drop_detached(self, flight: Flight, process_id: str) -> None:
+        """Cancel a detached process if still running and forget its output."""
+        self._detached.pop(process_id, None)
+        if not flight.broadcast.finished:
+            flight.broadcast.task.cancel()
+            try:
+                await asyncio.wait_for(asyncio.shield(flight.broadcast.task), timeout=5.0)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                pass
+        await self._cleanup_process(process_id)
+
+    async def _reap_detached_loop(self) -> None:
+        """Drop detached processes nobody has been attached to for detach_idle_timeout."""
+        timeout = get_settings().detach_idle_timeout
+        interval = min(5.0, timeout / 2)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for process_id, flight in list(self._detached.items()):
+                if flight.attached or now - flight.idle_since < timeout:
+                    continue
+                state = "finished" if flight.broadcast.finished else "running"
+                logger.info(f"Reaping {state} detached process {process_id}, idle for {now - flight.idle_since:.0f}s")
+                try:
+                    await self._drop_detached(flight, process_id)
+                except Exception as e:
+                    logger.error(f"Error reaping detached process {process_id}: {e}")
+
+    async def _update_session_id(self, process_id: str, line: str | bytes) -> None:
+        """Store session_id from the system init message."""
+        try:
+            session_id = json.loads(line).get("session_id")
+        except (ValueError, AttributeError):
+            logger.warning(f"Process {process_id}: unparseable system message")
+            return
+        if not session_id:
+            return
+        bind_log_context(session_id=session_id)
+
+        # Subscribers of a shared process get the same session
+        ids = self._linked_ids(process_id)
+        async with self._lock:
+            for pid in ids:
+                self._processes[pid].session_id = session_id
+                logger.debug(f"Process {pid} session_id: {session_id}")
+        for pid in ids:
+            await self.registry.update(pid, session_id=session_id)
+
+    async def _update_linked(self, process_id: str, **fields) -> None:
+        """Update registry fields of a process and of requests sharing it."""
+        for pid in self._linked_ids(process_id):
+            await self.registry.update(pid, **fields)
+
+    def _linked_ids(self, process_id: str) -> list[str]:
+        """Get ids of all requests sharing the process of process_id (itself included)."""
+        managed = self._processes.get(process_id)
+        if not managed:
+            return []
+        if not managed.flight:
+            return [process_id]
+        return [pid for pid in managed.flight.subscribers if pid in self._processes]
 
     async def kill_process(self, process_id: str) -> bool:
         """
         Kill a process by its ID.
+        Processes of other workers are cancelled through the registry.
         Returns True if process was found and killed, False otherwise.
         """
         async with self._lock:
             managed = self._processes.get(process_id)
-            if not managed:
-                logger.warning(f"Process {process_id} not found")
-                return False
 
+        if not managed:
+            if await self.registry.request_cancel(process_id):
+                return True
+            logger.warning(f"Process {process_id} not found")
+            return False
+
+        if managed.flight and managed.flight.detached:
+            logger.info(f"Cancelling detached process {process_id}")
+            await self._drop_detached(managed.flight, process_id)
+            return True
+
+        if managed.flight:
+            logger.info(f"Cancelling subscriber {process_id} of shared process")
+            await self._leave_flight(managed.flight, process_id)
+            return True
+
+        async with self._lock:
             if managed._cancelled:
                 logger.debug(f"Process {process_id} already cancelled")
                 return True
@@ -118,24 +588,47 @@ class ProcessManager:
     async def _cleanup_process(self, process_id: str) -> None:
         """Remove process from tracking."""
         async with self._lock:
-            if process_id in self._processes:
-                del self._processes[process_id]
-                logger.info(f"Process {process_id} cleaned up, remaining: {len(self._processes)}")
-
-    def get_active_processes(self) -> list[ProcessInfo]:
-        """Get list of all active processes."""
-        processes = []
-        for managed in self._processes.values():
-            processes.append(
-                ProcessInfo(
-                    process_id=managed.process_id,
-                    cwd=managed.cwd,
-                    model=managed.model,
-                    started_at=managed.started_at,
-                    session_id=managed.session_id,
-                )
-            )
-        return processes
+            if process_id not in self._processes:
+                return
+            del self._processes[process_id]
+            logger.info(f"Process {process_id} cleaned up, remaining: {len(self._processes)}")
+        await self.registry.remove(process_id)
+
+    def _process_info(self, managed: ManagedProcess) -> ProcessInfo:
+        """Build public process info."""
+        return ProcessInfo(
+            process_id=managed.process_id,
+            cwd=managed.cwd,
+            model=managed.model,
+            started_at=managed.started_at,
+            session_id=managed.session_id,
+            user=managed.user,
+            status=managed.status,
+            worker=self.registry.worker_id,
+        )
+
+    async def describe_sessions(self, session_id: str | None = None, user: str | None = None) -> list[SessionInfo]:
+        """Get info on all known sessions (or those of user), or on one."""
+        if session_id:
+            record = self.sessions.get(session_id)
+            records = [record] if record else []
+        else:
+            records = self.sessions.records()
+        if user is not None:
+            records = [r for r in records if r.user == user]
+        hot = {r.session_id for r in records if self.warm_pool.is_hot(r.session_id)}
+        return await self.sessions.describe(records, hot)
+
+    async def get_process(self, process_id: str) -> ProcessInfo | None:
+        """Get an active process of any worker, None if there is none."""
+        managed = self._processes.get(process_id)
+        if managed:
+            return self._process_info(managed)
+        return next((info for info in await self.registry.list() if info.process_id == process_id), None)
+
+    async def get_active_processes(self) -> list[ProcessInfo]:
+        """Get list of all active processes (of all workers with a shared registry)."""
+        return await self.registry.list()
 
     @property
     def active_count(self) -> int:
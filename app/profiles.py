@@ -0,0 +1,245 @@
+"""Server-side profiles: CLI options registered once and referenced by name."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from app.config import get_settings
+from app.models import ChatRequest, ProfileInfo, ProfileRequest
+
+logger = logging.getLogger(__name__)
+
+# Options passed to the CLI as inline JSON, serialized once per profile
+JSON_OPTIONS = ("agents", "json_schema")
+
+
+class ProfileNotFound(Exception):
+    """Raised when a request references an unknown profile."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Profile not found: {name}")
+        self.name = name
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _write_atomic(path: Path, data: str) -> None:
+    """Write a file via a temp file and rename, so readers never see it half written."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@dataclass
+class Profile:
+    """A stored profile. Options are ChatRequest fields, inline configs replaced by file paths."""
+
+    name: str
+    digest: str
+    created_at: datetime
+    created_by: str
+    options: dict[str, Any]
+    files: list[str]
+    # Pre-serialized JSON_OPTIONS values
+    serialized: dict[str, str]
+
+    def info(self) -> ProfileInfo:
+        return ProfileInfo(
+            name=self.name,
+            digest=self.digest,
+            created_at=self.created_at,
+            created_by=self.created_by,
+            options=self.options,
+            files=self.files,
+        )
+
+
+class ProfileStore:
+    """
+    Profiles kept in memory and in PROFILES_DIR.
+
+    Inline MCP configs and settings are written once to content-addressed
+    files (objects/<sha256>.json) and passed to the CLI by path, so requests
+    do not resend them and the CLI reads the same file for every spawn.
+    Each profile is stored as <name>.json.
+    """
+
+    def __init__(self):
+        self._profiles: dict[str, Profile] = {}
+        # id of a profile's JSON option value -> (value, serialized)
+        self._serialized: dict[int, tuple[Any, str]] = {}
+
+    @property
+    def directory(self) -> Path:
+        return Path(get_settings().profiles_dir).expanduser().resolve()
+
+    def load(self) -> None:
+        """Load stored profiles (at startup)."""
+        directory = self.directory
+        if not directory.is_dir():
+            return
+        for path in sorted(directory.glob("*.json")):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                self._add(Profile(
+                    name=data["name"],
+                    digest=data["digest"],
+                    created_at=datetime.fromisoformat(data["created_at"]),
+                    created_by=data["created_by"],
+                    options=data["options"],
+                    files=data["files"],
+                    serialized={},
+                ))
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Could not load profile {path}: {e}")
+        logger.info(f"Loaded {len(self._profiles)} profiles from {directory}")
+
+    def _store_object(self, value: Any) -> str:
+        """Write a JSON value to its content-addressed file, return the path."""
+        data = canonical_json(value)
+        objects = self.directory / "objects"
+        objects.mkdir(parents=True, exist_ok=True)
+        path = objects / f"{hashlib.sha256(data.encode('utf-8')).hexdigest()}.json"
+        if not path.exists():
+            _write_atomic(path, data)
+        return str(path)
+
+    def _config_file(self, value: str | dict[str, Any], files: list[str]) -> str:
+        """Get a file path for a config given as object, JSON string or path."""
+        if isinstance(value, str):
+            if not value.lstrip().startswith("{"):
+                return value
+            try:
+                value = json.loads(value)
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON config: {e}")
+        path = self._store_object(value)
+        files.append(path)
+        return path
+
+    def put(self, body: ProfileRequest, user: str) -> Profile:
+        """
+        Store a profile, replacing one with the same name.
+        Raises ValueError for invalid inline JSON configs. Blocking file I/O.
+        """
+        options = body.model_dump(exclude={"name"}, exclude_none=True)
+        files: list[str] = []
+        if "mcp_config" in options:
+            options["mcp_config"] = [self._config_file(value, files) for value in options["mcp_config"]]
+        if "settings" in options:
+            options["settings"] = self._config_file(options["settings"], files)
+
+        profile = Profile(
+            name=body.name,
+            digest=hashlib.sha256(canonical_json(options).encode("utf-8")).hexdigest(),
+            created_at=datetime.utcnow(),
+            created_by=user,
+            options=options,
+            files=files,
+            serialized={},
+        )
+        directory = self.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        _write_atomic(directory / f"{profile.name}.json", json.dumps({
+            "name": profile.name,
+            "digest": profile.digest,
+            "created_at": profile.created_at.isoformat(),
+            "created_by": profile.created_by,
+            "options": profile.options,
+            "files": profile.files,
+        }, indent=2))
+
+        self._drop(self._profiles.get(profile.name))
+        self._add(profile)
+        self._remove_unused_objects()
+        logger.info(f"Profile {profile.name} stored by {user} ({profile.digest[:12]}, {len(files)} files)")
+        return profile
+
+    def delete(self, name: str) -> bool:
+        """Delete a profile. Blocking file I/O."""
+        profile = self._profiles.pop(name, None)
+        if profile is None:
+            return False
+        self._drop(profile)
+        try:
+            (self.directory / f"{name}.json").unlink()
+        except FileNotFoundError:
+            pass
+        self._remove_unused_objects()
+        logger.info(f"Profile {name} deleted")
+        return True
+
+    def _add(self, profile: Profile) -> None:
+        for option in JSON_OPTIONS:
+            if option in profile.options:
+                value = profile.options[option]
+                profile.serialized[option] = json.dumps(value)
+                self._serialized[id(value)] = (value, profile.serialized[option])
+        self._profiles[profile.name] = profile
+
+    def _drop(self, profile: Profile | None) -> None:
+        if profile is None:
+            return
+        for option in JSON_OPTIONS:
+            self._serialized.pop(id(profile.options.get(option)), None)
+
+    def _remove_unused_objects(self) -> None:
+        """Delete object files no profile refers to any more."""
+        used = {path for profile in self._profiles.values() for path in profile.files}
+        objects = self.directory / "objects"
+        if not objects.is_dir():
+            return
+        for path in objects.glob("*.json"):
+            if str(path) not in used:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"Could not remove unused profile file {path}: {e}")
+
+    def get(self, name: str) -> Profile | None:
+        return self._profiles.get(name)
+
+    def list(self) -> list[Profile]:
+        return sorted(self._profiles.values(), key=lambda p: p.name)
+
+    def apply(self, request: ChatRequest) -> ChatRequest:
+        """
+        Fill in the options a request does not set (or sets to null) from its profile.
+        Raises ProfileNotFound for an unknown profile.
+        """
+        if not request.profile:
+            return request
+        profile = self._profiles.get(request.profile)
+        if profile is None:
+            raise ProfileNotFound(request.profile)
+
+        update = {
+            option: value
+            for option, value in profile.options.items()
+            if option not in request.model_fields_set or getattr(request, option) is None
+        }
+        return request.model_copy(update=update)
+
+    def serialized(self, value: Any) -> str | None:
+        """Get the stored serialization of a profile's JSON option value, None if value is not one."""
+        entry = self._serialized.get(id(value))
+        if entry is not None and entry[0] is value:
+            return entry[1]
+        return None
+
+
+# Global profile store instance
+profiles = ProfileStore()
@@ -0,0 +1,271 @@
+"""Process registry backends: which processes exist and which worker owns them."""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from pydantic import BaseModel
+
+from app.config import get_settings
+from app.models import ProcessInfo, ResourceUsage
+
+logger = logging.getLogger(__name__)
+
+# Callback used by the owning worker to cancel a process
+CancelCallback = Callable[[str], Awaitable[bool]]
+
+# Seconds to wait for the owning worker to cancel a process
+REMOTE_CANCEL_TIMEOUT = 5.0
+
+
+def get_worker_id() -> str:
+    """Identify this worker process across hosts."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class MemoryRegistry:
+    """
+    Default in-memory registry.
+    Only processes started by this worker are visible, which is correct
+    for a single uvicorn worker.
+    """
+
+    def __init__(self):
+        self.worker_id = get_worker_id()
+        self._records: dict[str, ProcessInfo] = {}
+
+    async def start(self, on_cancel: CancelCallback) -> None:
+        """Start background work (nothing to do in memory)."""
+
+    async def stop(self) -> None:
+        """Stop background work (nothing to do in memory)."""
+
+    async def add(self, info: ProcessInfo) -> None:
+        """Register a process owned by this worker."""
+        self._records[info.process_id] = info
+
+    async def update(self, process_id: str, **fields) -> None:
+        """Update fields of a registered process."""
+        info = self._records.get(process_id)
+        if info:
+            for name, value in fields.items():
+                setattr(info, name, value)
+
+    async def remove(self, process_id: str) -> None:
+        """Unregister a process."""
+        self._records.pop(process_id, None)
+
+    async def list(self) -> list[ProcessInfo]:
+        """Get all registered processes."""
+        return list(self._records.values())
+
+    async def request_cancel(self, process_id: str) -> bool:
+        """Ask the owning worker to cancel a process not owned by this worker."""
+        return False
+
+
+class SqliteRegistry:
+    """
+    Registry shared by all workers on one host through a SQLite database (WAL mode).
+
+    Each worker heartbeats and polls for cancel requests of its own processes;
+    rows of workers that stopped heartbeating are removed.
+    """
+
+    def __init__(self, path: str, poll_interval: float):
+        self.worker_id = get_worker_id()
+        self._path = path
+        self._poll_interval = poll_interval
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._on_cancel: CancelCallback | None = None
+        self._poller: asyncio.Task | None = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Run one statement under the connection lock (called in a thread)."""
+        with self._db_lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        """Run a query under the connection lock (called in a thread)."""
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _open(self) -> None:
+        """Open database and create tables."""
+        self._conn = sqlite3.connect(self._path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS processes (
+                process_id TEXT PRIMARY KEY,
+                worker_id TEXT NOT NULL,
+                cwd TEXT NOT NULL,
+                model TEXT,
+                started_at TEXT NOT NULL,
+                session_id TEXT,
+                user TEXT,
+                status TEXT NOT NULL,
+                resources TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS processes_worker ON processes (worker_id);
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                last_seen REAL NOT NULL
+            );
+            """
+        )
+        # Databases created before resource accounting
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(processes)")]
+        if "resources" not in columns:
+            self._conn.execute("ALTER TABLE processes ADD COLUMN resources TEXT")
+        # Databases created before process owners
+        if "user" not in columns:
+            self._conn.execute("ALTER TABLE processes ADD COLUMN user TEXT")
+        self._conn.commit()
+
+    async def start(self, on_cancel: CancelCallback) -> None:
+        """Open database, register this worker and start the cancel poller."""
+        self._on_cancel = on_cancel
+        await asyncio.to_thread(self._open)
+        await asyncio.to_thread(self._heartbeat)
+        self._poller = asyncio.create_task(self._poll_loop())
+        logger.info(f"SQLite process registry at {self._path} (worker {self.worker_id})")
+
+    async def stop(self) -> None:
+        """Stop poller and remove this worker and its processes."""
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+        if self._conn:
+            await asyncio.to_thread(self._execute, "DELETE FROM processes WHERE worker_id = ?", (self.worker_id,))
+            await asyncio.to_thread(self._execute, "DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+            self._conn.close()
+            self._conn = None
+
+    async def add(self, info: ProcessInfo) -> None:
+        """Register a process owned by this worker."""
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO processes (process_id, worker_id, cwd, model, started_at, session_id, user, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                info.process_id,
+                self.worker_id,
+                info.cwd,
+                info.model,
+                info.started_at.isoformat(),
+                info.session_id,
+                info.user,
+                info.status,
+            ),
+        )
+
+    async def update(self, process_id: str, **fields) -> None:
+        """Update fields of a registered process."""
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = [value.model_dump_json() if isinstance(value, BaseModel) else value for value in fields.values()]
+        await asyncio.to_thread(
+            self._execute,
+            f"UPDATE processes SET {columns} WHERE process_id = ?",
+            (*values, process_id),
+        )
+
+    async def remove(self, process_id: str) -> None:
+        """Unregister a process."""
+        await asyncio.to_thread(self._execute, "DELETE FROM processes WHERE process_id = ?", (process_id,))
+
+    async def list(self) -> list[ProcessInfo]:
+        """Get processes of all workers."""
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT process_id, worker_id, cwd, model, started_at, session_id, user, status, resources "
+            "FROM processes ORDER BY started_at",
+        )
+        return [
+            ProcessInfo(
+                process_id=process_id,
+                worker=worker_id,
+                cwd=cwd,
+                model=model,
+                started_at=datetime.fromisoformat(started_at),
+                session_id=session_id,
+                user=user,
+                status=status,
+                resources=ResourceUsage.model_validate_json(resources) if resources else None,
+            )
+            for process_id, worker_id, cwd, model, started_at, session_id, user, status, resources in rows
+        ]
+
+    async def request_cancel(self, process_id: str) -> bool:
+        """
+        Flag a process of another worker for cancellation and wait for the owner to remove it.
+        Returns False if no such process exists.
+        """
+        cursor = await asyncio.to_thread(
+            self._execute,
+            "UPDATE processes SET cancel_requested = 1 WHERE process_id = ?",
+            (process_id,),
+        )
+        if cursor.rowcount == 0:
+            return False
+
+        logger.info(f"Cancel of process {process_id} routed to its owning worker")
+        deadline = time.monotonic() + REMOTE_CANCEL_TIMEOUT
+        while time.monotonic() < deadline:
+            rows = await asyncio.to_thread(self._query, "SELECT 1 FROM processes WHERE process_id = ?", (process_id,))
+            if not rows:
+                break
+            await asyncio.sleep(min(self._poll_interval, 0.1))
+        else:
+            logger.warning(f"Owning worker did not cancel process {process_id} in time")
+        return True
+
+    def _heartbeat(self) -> None:
+        """Refresh this worker's heartbeat and remove processes of dead workers."""
+        now = time.time()
+        stale = now - max(self._poll_interval * 10, 30.0)
+        self._execute("INSERT OR REPLACE INTO workers (worker_id, last_seen) VALUES (?, ?)", (self.worker_id, now))
+        self._execute(
+            "DELETE FROM processes WHERE worker_id NOT IN (SELECT worker_id FROM workers WHERE last_seen >= ?)",
+            (stale,),
+        )
+        self._execute("DELETE FROM workers WHERE last_seen < ?", (stale,))
+
+    async def _poll_loop(self) -> None:
+        """Heartbeat and execute cancel requests for processes owned by this worker."""
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            try:
+                await asyncio.to_thread(self._heartbeat)
+                rows = await asyncio.to_thread(
+                    self._query,
+                    "SELECT process_id FROM processes WHERE worker_id = ? AND cancel_requested = 1",
+                    (self.worker_id,),
+                )
+                for (process_id,) in rows:
+                    logger.info(f"Cancel request for process {process_id} from another worker")
+                    if not await self._on_cancel(process_id):
+                        await self.remove(process_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Process registry poll failed: {e}")
+
+
+def create_registry() -> MemoryRegistry | SqliteRegistry:
+    """Create registry backend from settings."""
+    settings = get_settings()
+    if settings.registry_backend == "sqlite":
+        return SqliteRegistry(settings.registry_path, settings.registry_poll_interval)
+    return MemoryRegistry()
@@ -0,0 +1,133 @@
+"""Batch endpoint running many prompts with bounded parallelism."""
+
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncGenerator
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.admission import AdmissionRejected, QueuePosition
+from app.auth import verify_credentials
+from app.claude import is_result_line
+from app.config import get_settings
+from app.models import BatchItemResult, BatchRequest, ChatRequest, ResourceUsage
+from app.process_manager import process_manager
+from app.routes.chat import apply_profile, validate_cwd
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["chat"])
+
+
+async def run_batch_item(
+    index: int,
+    request: ChatRequest,
+    username: str,
+    submitted: float,
+    semaphore: asyncio.Semaphore,
+) -> BatchItemResult:
+    """Run one request to completion, keeping only the result event."""
+    async with semaphore:
+        started = time.monotonic()
+        process_id = None
+        session_id = None
+        result = None
+        resources = None
+        try:
+            process_id, stream = await process_manager.start_process(request, user=username)
+            async for line in stream:
+                if isinstance(line, QueuePosition):
+                    continue
+                if isinstance(line, ResourceUsage):
+                    resources = line
+                    continue
+                if is_result_line(line):
+                    result = json.loads(line)
+                    session_id = result.get("session_id")
+        except AdmissionRejected as e:
+            return BatchItemResult(index=index, status="rejected", error=str(e))
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}")
+            return BatchItemResult(index=index, process_id=process_id, status="error", error=str(e))
+
+        if result is None:
+            status = "error"
+        else:
+            status = "error" if result.get("is_error") else "success"
+
+        return BatchItemResult(
+            index=index,
+            process_id=process_id,
+            status=status,
+            session_id=session_id,
+            queued_ms=int((started - submitted) * 1000),
+            duration_ms=int((time.monotonic() - started) * 1000),
+            result=result,
+            resources=resources,
+            error=None if result else "No result event",
+        )
+
+
+async def generate_ndjson(
+    requests: list[ChatRequest],
+    parallelism: int,
+    username: str,
+) -> AsyncGenerator[bytes, None]:
+    """Run all requests and yield one NDJSON line per item, in completion order."""
+    submitted = time.monotonic()
+    semaphore = asyncio.Semaphore(parallelism)
+    tasks = [
+        asyncio.create_task(run_batch_item(index, request, username, submitted, semaphore))
+        for index, request in enumerate(requests)
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            item = await finished
+            yield (item.model_dump_json() + "\n").encode("utf-8")
+    finally:
+        # Client went away: cancel what is still running
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/chat/batch")
+async def chat_batch(
+    batch: BatchRequest,
+    username: str = Depends(verify_credentials),
+):
+    """
+    Run many requests with bounded parallelism.
+
+    - **requests**: list of chat requests, and/or
+    - **template** + **prompts**: one request run once per prompt
+    - **parallelism**: max requests running at once
+
+    Returns NDJSON, one line per request in completion order, with status,
+    timings and the final result event.
+    """
+    settings = get_settings()
+    requests = batch.expand()
+
+    if not requests:
+        raise HTTPException(status_code=400, detail="No requests in batch")
+    if len(requests) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many requests in batch: {len(requests)} > {settings.batch_max_items}",
+        )
+
+    for cwd in {request.cwd for request in requests}:
+        await validate_cwd(cwd)
+    requests = [apply_profile(request) for request in requests]
+
+    parallelism = min(batch.parallelism, settings.batch_max_parallelism)
+    logger.info(f"Batch of {len(requests)} requests from user {username}, parallelism {parallelism}")
+
+    return StreamingResponse(
+        generate_ndjson(requests, parallelism, username),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,42 @@
+"""Response cache endpoints."""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth import is_admin, verify_credentials
+from app.models import CacheStats
+from app.process_manager import process_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["cache"])
+
+
+@router.get("/cache", response_model=CacheStats)
+async def cache_stats(
+    username: str = Depends(verify_credentials),
+) -> CacheStats:
+    """
+    Get response cache hit ratio and bytes saved.
+    Requires authentication.
+    """
+    logger.debug(f"User {username} requested cache stats")
+
+    return process_manager.cache.stats()
+
+
+@router.delete("/cache", response_model=CacheStats)
+async def clear_cache(
+    username: str = Depends(verify_credentials),
+) -> CacheStats:
+    """
+    Drop all cached responses (AUTH_USER only).
+    Requires authentication.
+    """
+    if not is_admin(username):
+        raise HTTPException(status_code=403, detail="Only AUTH_USER can clear the cache")
+    logger.info(f"User {username} cleared the response cache")
+
+    process_manager.cache.clear()
+    return process_manager.cache.stats()
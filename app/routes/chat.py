@@ -1,41 +1,104 @@
 """Chat endpoint with SSE streaming."""
 
+import asyncio
 import json
 import logging
-from pathlib import Path
+import os
+import stat
+import time
 from typing import AsyncGenerator
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 
-from app.auth import verify_credentials
-from app.models import ChatRequest, CancelResponse, ErrorResponse
+from app.admission import AdmissionRejected, QueuePosition
+from app.aggregate import ResultAggregator
+from app.auth import owns, verify_credentials
+from app.backpressure import buffer_stream
+from app.broadcast import StreamGap
+from app.config import get_settings
+from app.diagnostics import diagnostics
+from app.events import EventFilter
+from app.line_reader import LongLine
+from app.models import ChatRequest, CancelResponse, ErrorResponse, ResourceUsage, SyncChatResponse
 from app.process_manager import process_manager
+from app.profiles import ProfileNotFound, profiles
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["chat"])
 
+# SSE framing for raw passthrough mode (same wire format as sse-starlette)
+SSE_SEPARATOR = b"\r\n\r\n"
+SSE_MESSAGE_PREFIX = b"event: message\r\ndata: "
+SSE_LINE_BREAK = SSE_SEPARATOR + SSE_MESSAGE_PREFIX
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable buffering in nginx/traefik
+}
+
 
 async def generate_sse(
-    stream: AsyncGenerator[str, None],
+    stream: AsyncGenerator[str | QueuePosition, None],
     process_id: str,
 ) -> AsyncGenerator[dict, None]:
     """
     Generate SSE events from Claude Code stream.
-    Yields raw JSON lines as 'message' events.
+    Yields raw JSON lines as 'message' events,
+    and 'queued' events while the request waits for a slot.
+    Items of detached streams come as (event_id, item) and are sent with an id.
+    The done event carries the process resource usage.
     """
+    resources = None
+    timings = diagnostics.timings(process_id)
+    mark = time.perf_counter()
     try:
         async for line in stream:
-            yield {
-                "event": "message",
-                "data": line,
-            }
+            if timings:
+                mark = timings.received(mark)
+            event_id = None
+            if isinstance(line, tuple):
+                event_id, line = line
+
+            if isinstance(line, ResourceUsage):
+                resources = line
+                continue
+
+            if isinstance(line, StreamGap):
+                event = {
+                    "event": "gap",
+                    "data": json.dumps({"process_id": process_id, "missed": line.missed}),
+                }
+            elif isinstance(line, QueuePosition):
+                event = {
+                    "event": "queued",
+                    "data": json.dumps({"process_id": process_id, "position": line.position}),
+                }
+            else:
+                event = {
+                    "event": "message",
+                    "data": line,
+                }
+
+            if event_id is not None:
+                event["id"] = str(event_id)
+            yield event
+            if timings:
+                mark = timings.written(mark, len(event["data"]))
 
         # Send done event
         yield {
             "event": "done",
-            "data": json.dumps({"process_id": process_id}),
+            "data": done_data(process_id, resources),
+        }
+
+    except AdmissionRejected as e:
+        yield {
+            "event": "error",
+            "data": json.dumps({"error": str(e), "status": e.status_code, "retry_after": e.retry_after}),
         }
 
     except Exception as e:
@@ -46,9 +109,206 @@ async def generate_sse(
         }
 
 
+def done_data(process_id: str, resources: ResourceUsage | None) -> str:
+    """Encode data of the done event."""
+    data = {"process_id": process_id}
+    if resources:
+        data["resources"] = resources.model_dump()
+    return json.dumps(data)
+
+
+def sse_event(event: str, data: str, event_id: int | None = None) -> bytes:
+    """Encode a single SSE event."""
+    if event_id is not None:
+        return f"event: {event}\r\ndata: {data}\r\nid: {event_id}\r\n\r\n".encode("utf-8")
+    return f"event: {event}\r\ndata: {data}\r\n\r\n".encode("utf-8")
+
+
+def frame_block(block: bytes, event_id: int | None = None) -> bytes:
+    """
+    Frame a block of newline-terminated JSON lines as SSE 'message' events.
+    Done with a single bytes.replace, without splitting the block into lines.
+    With event_id, the id is set on the last event of the block.
+    """
+    if b"\n\n" in block:
+        while b"\n\n" in block:
+            block = block.replace(b"\n\n", b"\n")
+    block = block.lstrip(b"\n")
+    if not block:
+        return b""
+    framed = SSE_MESSAGE_PREFIX + block[:-1].replace(b"\n", SSE_LINE_BREAK)
+    if event_id is not None:
+        return framed + b"\r\nid: %d" % event_id + SSE_SEPARATOR
+    return framed + SSE_SEPARATOR
+
+
+async def generate_raw_sse(
+    stream: AsyncGenerator[bytes | LongLine | QueuePosition, None],
+    process_id: str,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Generate SSE bytes from a raw Claude Code stream.
+    Same events as generate_sse, but output lines are passed through
+    without decoding, and one write is made per block read from the pipe.
+    Oversized lines are sent as one event written in chunks.
+    """
+    resources = None
+    timings = diagnostics.timings(process_id)
+    mark = time.perf_counter()
+    try:
+        async for block in stream:
+            if timings:
+                mark = timings.received(mark)
+            event_id = None
+            if isinstance(block, tuple):
+                event_id, block = block
+
+            if isinstance(block, ResourceUsage):
+                resources = block
+                continue
+
+            if isinstance(block, StreamGap):
+                yield sse_event("gap", json.dumps({"process_id": process_id, "missed": block.missed}))
+                continue
+
+            if isinstance(block, QueuePosition):
+                yield sse_event("queued", json.dumps({"process_id": process_id, "position": block.position}), event_id)
+                continue
+
+            if isinstance(block, LongLine):
+                yield SSE_MESSAGE_PREFIX
+                async for chunk in block.chunks():
+                    yield chunk
+                yield SSE_SEPARATOR
+                if timings:
+                    mark = timings.written(mark, block.size)
+                continue
+
+            framed = frame_block(block, event_id)
+            yield framed
+            if timings:
+                mark = timings.written(mark, len(framed))
+
+        yield sse_event("done", done_data(process_id, resources))
+
+    except AdmissionRejected as e:
+        yield sse_event("error", json.dumps({"error": str(e), "status": e.status_code, "retry_after": e.retry_after}))
+
+    except Exception as e:
+        logger.error(f"Error in raw SSE stream: {e}")
+        yield sse_event("error", json.dumps({"error": str(e)}))
+
+
+def apply_profile(request: ChatRequest) -> ChatRequest:
+    """Fill in options from the request's profile, raise 400 if it does not exist."""
+    try:
+        return profiles.apply(request)
+    except ProfileNotFound as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _cwd_error(cwd: str) -> str | None:
+    """Check cwd with one stat call, return the error message if it is not a directory."""
+    try:
+        mode = os.stat(cwd).st_mode
+    except OSError:
+        return f"Directory does not exist: {cwd}"
+    if not stat.S_ISDIR(mode):
+        return f"Path is not a directory: {cwd}"
+    return None
+
+
+async def validate_cwd(cwd: str) -> None:
+    """
+    Check that cwd is an existing directory, raise 400 otherwise.
+    The stat runs in a thread, so a slow filesystem does not block the event loop.
+    """
+    error = await asyncio.to_thread(_cwd_error, cwd)
+    if error:
+        logger.error(error)
+        raise HTTPException(status_code=400, detail=error)
+
+
+async def run_sync(
+    request: ChatRequest,
+    username: str,
+    timeout: float | None,
+    tool_summary: bool,
+) -> SyncChatResponse:
+    """Run a request to completion and aggregate its output into one response."""
+    settings = get_settings()
+    limit = min(timeout, settings.sync_timeout) if timeout else settings.sync_timeout
+
+    try:
+        process_id, stream = await process_manager.start_process(request, user=username, raw=True)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    aggregator = ResultAggregator(tool_summary=tool_summary)
+
+    async def collect() -> ResourceUsage | None:
+        resources = None
+        async for block in stream:
+            if isinstance(block, QueuePosition):
+                continue
+            if isinstance(block, ResourceUsage):
+                resources = block
+                continue
+            if isinstance(block, LongLine):
+                await aggregator.long_line(block)
+            else:
+                aggregator.block(block)
+        return resources
+
+    try:
+        resources = await asyncio.wait_for(collect(), timeout=limit)
+    except asyncio.TimeoutError:
+        logger.warning(f"Process {process_id} timed out after {limit}s")
+        raise HTTPException(status_code=504, detail=f"Timed out after {limit}s")
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    result = aggregator.result
+    if result is None:
+        if resources and resources.limit_exceeded:
+            raise HTTPException(status_code=422, detail=f"Process exceeded its {resources.limit_exceeded} limit")
+        raise HTTPException(status_code=502, detail="Claude Code exited without a result")
+
+    return SyncChatResponse(
+        process_id=process_id,
+        status="error" if result.get("is_error") else "success",
+        session_id=aggregator.session_id,
+        result=result.get("result") if isinstance(result.get("result"), str) else None,
+        structured_output=result.get("structured_output"),
+        usage=result.get("usage"),
+        total_cost_usd=result.get("total_cost_usd"),
+        duration_ms=result.get("duration_ms"),
+        num_turns=result.get("num_turns"),
+        events=aggregator.events,
+        tool_calls=aggregator.tool_calls,
+        resources=resources,
+    )
+
+
 @router.post("/chat")
 async def chat(
     request: ChatRequest,
+    raw: bool = Query(default=False, description="Pass output bytes through without per-line decoding"),
+    detach: bool = Query(default=False, description="Keep the process running when the client disconnects"),
+    events: str | None = Query(default=None, description="Comma-separated event types to send"),
+    fields: str | None = Query(default=None, description="Comma-separated dotted paths to keep in events"),
+    stream: bool = Query(default=True, description="Set to false for one JSON response (same as POST /chat/sync)"),
+    timeout: float | None = Query(default=None, gt=0, description="Max seconds for stream=false"),
+    tool_summary: bool = Query(default=False, description="Count tool calls for stream=false"),
     username: str = Depends(verify_credentials),
 ):
     """
@@ -58,6 +318,12 @@ async def chat(
     - **cwd**: Working directory for Claude Code (required)
     - **model**: Model to use (default: sonnet)
     - **session_id**: Session ID to resume conversation
+    - **raw** (query): zero-copy passthrough mode, same events without keep-alive pings
+    - **detach** (query): run the process independently of this connection,
+      resume it with GET /chat/{process_id}/stream
+    - **events** (query): only send these event types, e.g. `assistant,result`
+    - **fields** (query): only keep these fields of events, e.g. `user:message.content.tool_use_id`
+    - **stream** (query): false returns one JSON body, see POST /chat/sync
 
     Returns SSE stream with raw JSON from Claude Code.
     Header X-Process-ID contains the process ID for cancellation.
@@ -67,39 +333,111 @@ async def chat(
     logger.debug(f"Prompt length: {len(request.prompt)} chars")
 
     # Validate cwd
-    cwd_path = Path(request.cwd)
+    await validate_cwd(request.cwd)
+    request = apply_profile(request)
 
-    if not cwd_path.exists():
-        logger.error(f"Directory does not exist: {request.cwd}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Directory does not exist: {request.cwd}",
-        )
+    if not stream:
+        return await run_sync(request, username, timeout, tool_summary)
 
-    if not cwd_path.is_dir():
-        logger.error(f"Path is not a directory: {request.cwd}")
+    # Start process (may be queued by admission control)
+    try:
+        process_id, stream = await process_manager.start_process(request, user=username, raw=raw, detach=detach)
+    except AdmissionRejected as e:
         raise HTTPException(
-            status_code=400,
-            detail=f"Path is not a directory: {request.cwd}",
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
         )
 
-    # Start process
-    process_id, stream = await process_manager.start_process(request)
-
     logger.info(f"Started process {process_id} for user {username}")
 
+    return stream_response(stream, process_id, raw, EventFilter.from_query(events, fields))
+
+
+def stream_response(
+    stream: AsyncGenerator,
+    process_id: str,
+    raw: bool,
+    event_filter: EventFilter | None = None,
+):
+    """Wrap a process stream in an SSE response, buffered for slow clients and filtered if requested."""
+    stream = buffer_stream(stream)
+    if event_filter:
+        stream = event_filter.apply(stream)
+
+    headers = {"X-Process-ID": process_id, **SSE_HEADERS}
+
+    if raw:
+        return StreamingResponse(
+            generate_raw_sse(stream, process_id),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+
     # Return SSE response
     return EventSourceResponse(
         generate_sse(stream, process_id),
-        headers={
-            "X-Process-ID": process_id,
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable buffering in nginx/traefik
-        },
+        headers=headers,
     )
 
 
+@router.post("/chat/sync", response_model=SyncChatResponse)
+async def chat_sync(
+    request: ChatRequest,
+    timeout: float | None = Query(default=None, gt=0, description="Max seconds (capped by SYNC_TIMEOUT)"),
+    tool_summary: bool = Query(default=False, description="Count tool calls by tool name"),
+    username: str = Depends(verify_credentials),
+):
+    """
+    Run Claude Code to completion and return the final result as one JSON body.
+    Only the result, usage, session_id and (optionally) tool call counts are kept,
+    so memory does not grow with the transcript.
+    Returns 504 if the run exceeds the timeout (the process is terminated).
+    Requires authentication.
+    """
+    logger.info(f"Sync chat request from user {username}")
+    await validate_cwd(request.cwd)
+    request = apply_profile(request)
+    return await run_sync(request, username, timeout, tool_summary)
+
+
+@router.get(
+    "/chat/{process_id}/stream",
+    responses={404: {"model": ErrorResponse}},
+)
+async def reattach_chat(
+    process_id: str,
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+    from_id: int | None = Query(default=None, alias="last_event_id", description="Same as the Last-Event-ID header"),
+    events: str | None = Query(default=None, description="Comma-separated event types to send"),
+    fields: str | None = Query(default=None, description="Comma-separated dotted paths to keep in events"),
+    username: str = Depends(verify_credentials),
+):
+    """
+    Reattach to a process started with ?detach=true.
+    Resumes after the event in the Last-Event-ID header, or replays all retained events.
+    Requires authentication.
+    """
+    if last_event_id is not None:
+        try:
+            from_id = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid Last-Event-ID: {last_event_id}")
+
+    info = await process_manager.get_process(process_id)
+    attached = process_manager.attach(process_id, from_id) if info and owns(username, info.user) else None
+    if attached is None:
+        logger.warning(f"Detached process not found: {process_id}")
+        raise HTTPException(
+            status_code=404,
+            detail=f"Detached process not found: {process_id}",
+        )
+
+    logger.info(f"User {username} reattached to process {process_id}")
+    raw, stream = attached
+    return stream_response(stream, process_id, raw, EventFilter.from_query(events, fields))
+
+
 @router.delete(
     "/chat/{process_id}",
     response_model=CancelResponse,
@@ -110,13 +448,15 @@ async def cancel_chat(
     username: str = Depends(verify_credentials),
 ):
     """
-    Cancel a running Claude Code process.
+    Cancel a running Claude Code process (any process for AUTH_USER, otherwise the caller's).
 
     - **process_id**: Process ID from X-Process-ID header
     """
     logger.info(f"Cancel request from user {username} for process {process_id}")
 
-    success = await process_manager.kill_process(process_id)
+    info = await process_manager.get_process(process_id)
+    # Other users' processes are reported as missing
+    success = info is not None and owns(username, info.user) and await process_manager.kill_process(process_id)
 
     if not success:
         logger.warning(f"Process not found: {process_id}")
@@ -0,0 +1,73 @@
+"""Diagnostics endpoints (enabled with DIAGNOSTICS_ENABLED)."""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.auth import is_admin, verify_credentials
+from app.config import get_settings
+from app.diagnostics import ProfileBusy, diagnostics
+from app.models import DebugStreamsResponse, LoopDiagnostics
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+def require_diagnostics(username: str = Depends(verify_credentials)) -> str:
+    """Allow AUTH_USER only, and only with diagnostics enabled."""
+    if not diagnostics.enabled:
+        raise HTTPException(status_code=404, detail="Diagnostics are disabled (DIAGNOSTICS_ENABLED)")
+    if not is_admin(username):
+        raise HTTPException(status_code=403, detail="Diagnostics are only available to AUTH_USER")
+    return username
+
+
+@router.get("/loop", response_model=LoopDiagnostics)
+async def loop_diagnostics(
+    username: str = Depends(require_diagnostics),
+) -> LoopDiagnostics:
+    """
+    Get event loop lag and recent stalls with the stack that blocked the loop.
+    Requires authentication.
+    """
+    return diagnostics.loop_info()
+
+
+@router.get("/streams", response_model=DebugStreamsResponse)
+async def stream_timings(
+    username: str = Depends(require_diagnostics),
+) -> DebugStreamsResponse:
+    """
+    Get timing breakdowns of active and recently finished streams.
+    Requires authentication.
+    """
+    streams = diagnostics.streams()
+    return DebugStreamsResponse(streams=streams, count=len(streams))
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=5.0, gt=0, description="Profile duration"),
+    interval: float = Query(default=0.005, ge=0.001, le=1.0, description="Sampling interval"),
+    username: str = Depends(require_diagnostics),
+) -> PlainTextResponse:
+    """
+    Sample the event loop thread's stack for the given seconds.
+    Returns folded stacks ("module:function;... count", most frequent first)
+    for flamegraph.pl or speedscope.
+    Requires authentication.
+    """
+    max_seconds = get_settings().diagnostics_profile_max_seconds
+    if seconds > max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds must be at most {max_seconds}")
+
+    logger.info(f"User {username} started a {seconds}s profile")
+    try:
+        stacks = await asyncio.to_thread(diagnostics.profile, seconds, interval)
+    except ProfileBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse("".join(f"{stack} {count}\n" for stack, count in stacks.items()))
@@ -1,27 +1,96 @@
 """Health check endpoint."""
 
 import logging
+import os
 
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 
-from app.config import get_claude_path, get_claude_version_str
-from app.models import HealthResponse
+from app.capacity import SPAWN_MIN_SAMPLES, available_slots, load_average, memory_info, spawns
+from app.config import get_claude_path, get_claude_version_str, get_settings
+from app.models import CapacityResponse, HealthResponse, ReadinessResponse
+from app.process_manager import process_manager
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["health"])
 
 
-@router.get("/health", response_model=HealthResponse)
-async def health_check() -> HealthResponse:
+@router.get("/health", response_model=HealthResponse, responses={503: {"model": HealthResponse}})
+async def health_check():
     """
     Health check endpoint.
-    Returns service status and Claude Code information.
+    Returns service status and Claude Code information,
+    with status "draining" and HTTP 503 while the server shuts down.
     """
     logger.debug("Health check requested")
 
-    return HealthResponse(
-        status="ok",
+    health = HealthResponse(
+        status="draining" if process_manager.draining else "ok",
         claude_path=get_claude_path(),
         claude_version=get_claude_version_str(),
     )
+    if process_manager.draining:
+        return JSONResponse(status_code=503, content=health.model_dump())
+    return health
+
+
+def capacity() -> CapacityResponse:
+    """Collect capacity from counters the gateway keeps, /proc/meminfo and the load average."""
+    settings = get_settings()
+    admission = process_manager.admission
+    memory_available, memory_total = memory_info()
+    load = load_average()
+    recent, failures = spawns.recent()
+    failure_rate = failures / recent if recent else 0.0
+    slots = available_slots(admission.active, admission.queue_depth, memory_available, load)
+
+    reasons = []
+    if process_manager.draining:
+        reasons.append("draining")
+    if slots == 0:
+        reasons.append("no available slots")
+    if recent >= SPAWN_MIN_SAMPLES and failure_rate >= settings.capacity_max_spawn_failure_rate:
+        reasons.append(f"spawn failure rate {failure_rate:.0%}")
+
+    return CapacityResponse(
+        ready=not reasons,
+        reasons=reasons,
+        available_slots=slots,
+        draining=process_manager.draining,
+        active_processes=process_manager.active_count,
+        running=admission.active,
+        queue_depth=admission.queue_depth,
+        max_concurrent=settings.max_concurrent,
+        warm_idle=process_manager.warm_pool.idle_count,
+        memory_available_bytes=memory_available,
+        memory_total_bytes=memory_total,
+        load_1m=round(load, 2) if load is not None else None,
+        cpu_count=os.cpu_count() or 1,
+        spawns_recent=recent,
+        spawn_failures_recent=failures,
+        spawn_failure_rate=round(failure_rate, 3),
+    )
+
+
+@router.get("/health/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness():
+    """
+    Readiness probe for load balancers (no auth).
+    Returns 503 while draining, with no available slots, or when most recent spawns failed.
+    Cheap enough to poll every second.
+    """
+    current = capacity()
+    ready = ReadinessResponse(ready=current.ready, reasons=current.reasons, available_slots=current.available_slots)
+    if not current.ready:
+        return JSONResponse(status_code=503, content=ready.model_dump())
+    return ready
+
+
+@router.get("/health/capacity", response_model=CapacityResponse)
+async def capacity_check() -> CapacityResponse:
+    """
+    Node capacity for least-loaded balancing (no auth): running and queued
+    processes, free memory, load, spawn failures and available_slots.
+    """
+    return capacity()
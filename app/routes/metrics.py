@@ -0,0 +1,27 @@
+"""Prometheus metrics endpoint."""
+
+import logging
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.auth import verify_credentials
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(
+    username: str = Depends(verify_credentials),
+) -> PlainTextResponse:
+    """
+    Export gateway metrics in Prometheus text format.
+    Requires authentication (use basic_auth in the scrape config).
+    """
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
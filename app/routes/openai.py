@@ -0,0 +1,153 @@
+"""OpenAI compatible chat completions endpoint."""
+
+import json
+import logging
+from typing import AsyncGenerator
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.admission import AdmissionRejected, QueuePosition
+from app.auth import verify_bearer_or_basic
+from app.backpressure import buffer_stream
+from app.broadcast import StreamGap
+from app.config import get_settings
+from app.models import ChatCompletionRequest
+from app.openai_compat import CompletionTranslator, conversation_key, sessions, to_chat_request
+from app.process_manager import process_manager
+from app.routes.chat import SSE_HEADERS, apply_profile, validate_cwd
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["openai"])
+
+
+def sse_data(data: dict | str) -> bytes:
+    """Encode an OpenAI style SSE event (data only)."""
+    if isinstance(data, dict):
+        data = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"data: {data}\n\n".encode("utf-8")
+
+
+def remember_session(
+    user: str,
+    cwd: str,
+    turns: list[tuple[str, str]],
+    content: str,
+    translator: CompletionTranslator,
+) -> None:
+    """Remember the session of a completed conversation, so the user's next request resumes it."""
+    if translator.session_id and translator.result and not translator.result.get("is_error"):
+        sessions.put(conversation_key(user, cwd, turns + [("assistant", content)]), translator.session_id)
+
+
+async def generate_chunks(
+    stream: AsyncGenerator,
+    translator: CompletionTranslator,
+    user: str,
+    cwd: str,
+    turns: list[tuple[str, str]],
+    include_usage: bool,
+) -> AsyncGenerator[bytes, None]:
+    """Translate a process stream into chat.completion.chunk events as output arrives."""
+    content = []
+    try:
+        yield sse_data(translator.chunk({"role": "assistant", "content": ""}))
+
+        async for line in stream:
+            if isinstance(line, QueuePosition):
+                yield f": queued {line.position}\n\n".encode("utf-8")
+                continue
+            if isinstance(line, StreamGap):
+                translator.gap()
+                continue
+            if not isinstance(line, str):
+                continue
+            text = translator.feed(line)
+            if text:
+                content.append(text)
+                yield sse_data(translator.chunk({"content": text}))
+
+        if translator.result is None:
+            yield sse_data({"error": {"message": "Claude Code exited without a result", "type": "server_error"}})
+        else:
+            yield sse_data(translator.chunk({}, translator.finish_reason))
+            if include_usage:
+                yield sse_data(translator.usage_chunk())
+            remember_session(user, cwd, turns, "".join(content), translator)
+
+    except AdmissionRejected as e:
+        yield sse_data({"error": {"message": str(e), "type": "rate_limit_error", "code": e.status_code}})
+
+    except Exception as e:
+        logger.error(f"Error in chat completion stream: {e}")
+        yield sse_data({"error": {"message": str(e), "type": "server_error"}})
+
+    yield sse_data("[DONE]")
+
+
+@router.post("/v1/chat/completions")
+async def chat_completions(
+    body: ChatCompletionRequest,
+    username: str = Depends(verify_bearer_or_basic),
+):
+    """
+    OpenAI compatible chat completions, streaming and non-streaming.
+
+    System messages become the system prompt and the last user message the prompt.
+    A history previously answered by this gateway resumes its Claude session.
+    Authenticate with Basic Auth or with api_key "user:password".
+    """
+    cwd = body.cwd or get_settings().openai_default_cwd
+    if not cwd:
+        raise HTTPException(status_code=400, detail="cwd is required (or set OPENAI_DEFAULT_CWD)")
+    await validate_cwd(cwd)
+
+    try:
+        request, turns = to_chat_request(body, cwd, username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    request = apply_profile(request)
+
+    logger.info(f"Chat completion request from user {username} (stream={body.stream})")
+
+    try:
+        process_id, stream = await process_manager.start_process(request, user=username)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    translator = CompletionTranslator(f"chatcmpl-{process_id}", body.model, structured=request.json_schema is not None)
+    headers = {"X-Process-ID": process_id}
+
+    if body.stream:
+        include_usage = bool((body.stream_options or {}).get("include_usage"))
+        return StreamingResponse(
+            generate_chunks(buffer_stream(stream), translator, username, cwd, turns, include_usage),
+            media_type="text/event-stream",
+            headers={**headers, **SSE_HEADERS},
+        )
+
+    content = []
+    try:
+        async for line in stream:
+            if not isinstance(line, str):
+                continue
+            text = translator.feed(line)
+            if text:
+                content.append(text)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    if translator.result is None:
+        raise HTTPException(status_code=502, detail="Claude Code exited without a result")
+
+    remember_session(username, cwd, turns, "".join(content), translator)
+    return translator.completion("".join(content))
@@ -4,8 +4,8 @@ import logging
 
 from fastapi import APIRouter, Depends
 
-from app.auth import verify_credentials
-from app.models import ProcessListResponse
+from app.auth import owns, verify_credentials
+from app.models import PoolStats, ProcessListResponse
 from app.process_manager import process_manager
 
 logger = logging.getLogger(__name__)
@@ -18,12 +18,12 @@ async def list_processes(
     username: str = Depends(verify_credentials),
 ) -> ProcessListResponse:
     """
-    Get list of active Claude Code processes.
+    Get list of active Claude Code processes (of all users for AUTH_USER, otherwise the caller's).
     Requires authentication.
     """
     logger.info(f"User {username} requested process list")
 
-    processes = process_manager.get_active_processes()
+    processes = [p for p in await process_manager.get_active_processes() if owns(username, p.user)]
 
     logger.debug(f"Returning {len(processes)} active processes")
 
@@ -31,3 +31,16 @@ async def list_processes(
         processes=processes,
         count=len(processes),
     )
+
+
+@router.get("/processes/pool", response_model=PoolStats)
+async def pool_stats(
+    username: str = Depends(verify_credentials),
+) -> PoolStats:
+    """
+    Get warm process pool hit/miss counters.
+    Requires authentication.
+    """
+    logger.debug(f"User {username} requested pool stats")
+
+    return process_manager.warm_pool.stats()
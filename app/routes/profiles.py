@@ -0,0 +1,86 @@
+"""Server-side profile endpoints."""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth import owns, verify_credentials
+from app.models import ErrorResponse, ProfileInfo, ProfileListResponse, ProfileRequest
+from app.profiles import profiles
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["profiles"])
+
+
+def check_owner(name: str, username: str) -> None:
+    """Profiles are shared for use, but only their creator and AUTH_USER may change them."""
+    profile = profiles.get(name)
+    if profile is not None and not owns(username, profile.created_by):
+        raise HTTPException(status_code=403, detail=f"Profile {name} was created by another user")
+
+
+@router.post("/profiles", response_model=ProfileInfo, responses={400: {"model": ErrorResponse}})
+async def put_profile(
+    body: ProfileRequest,
+    username: str = Depends(verify_credentials),
+) -> ProfileInfo:
+    """
+    Store a profile (replacing one with the same name, if the caller created it).
+    Requests reference it with "profile": "<name>" and get its options
+    for every option they do not set themselves.
+    Requires authentication.
+    """
+    check_owner(body.name, username)
+    try:
+        profile = await asyncio.to_thread(profiles.put, body, username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profile.info()
+
+
+@router.get("/profiles", response_model=ProfileListResponse)
+async def list_profiles(
+    username: str = Depends(verify_credentials),
+) -> ProfileListResponse:
+    """
+    Get all stored profiles.
+    Requires authentication.
+    """
+    logger.debug(f"User {username} requested profile list")
+
+    items = [profile.info() for profile in profiles.list()]
+    return ProfileListResponse(profiles=items, count=len(items))
+
+
+@router.get("/profiles/{name}", response_model=ProfileInfo, responses={404: {"model": ErrorResponse}})
+async def get_profile(
+    name: str,
+    username: str = Depends(verify_credentials),
+) -> ProfileInfo:
+    """
+    Get one profile.
+    Requires authentication.
+    """
+    profile = profiles.get(name)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"Profile not found: {name}")
+    return profile.info()
+
+
+@router.delete("/profiles/{name}", responses={404: {"model": ErrorResponse}})
+async def delete_profile(
+    name: str,
+    username: str = Depends(verify_credentials),
+):
+    """
+    Delete a profile and its unused config files (if the caller created it).
+    Requires authentication.
+    """
+    check_owner(name, username)
+    if not await asyncio.to_thread(profiles.delete, name):
+        raise HTTPException(status_code=404, detail=f"Profile not found: {name}")
+
+    logger.info(f"User {username} deleted profile {name}")
+    return {"status": "deleted", "name": name}
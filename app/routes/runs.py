@@ -0,0 +1,121 @@
+"""Run history endpoints."""
+
+import logging
+from datetime import datetime, timedelta
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.auth import is_admin, owns, verify_credentials
+from app.models import RunListResponse, RunStatsResponse, TranscriptEvent, TranscriptEventsResponse
+from app.runs import runs
+from app.transcripts import transcripts
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["runs"])
+
+
+def run_user(username: str, user: str | None) -> str | None:
+    """Users other than AUTH_USER only see their own runs."""
+    return user if is_admin(username) else username
+
+
+def require_runs() -> None:
+    if not runs.enabled:
+        raise HTTPException(status_code=404, detail="Run history is disabled (RUNS_PATH)")
+
+
+@router.get("/runs", response_model=RunListResponse)
+async def list_runs(
+    user: str | None = Query(default=None, description="Only runs of this user (AUTH_USER only)"),
+    session_id: str | None = Query(default=None),
+    model: str | None = Query(default=None),
+    status: str | None = Query(default=None, description="success, error, failed, cancelled, limit_exceeded or rejected"),
+    since: datetime | None = Query(default=None, description="Started at or after (UTC)"),
+    until: datetime | None = Query(default=None, description="Started before (UTC)"),
+    min_duration: float | None = Query(default=None, ge=0, description="Only runs that took at least this many seconds"),
+    limit: int = Query(default=50, ge=1, le=1000),
+    cursor: str | None = Query(default=None, description="next_cursor of the previous page"),
+    username: str = Depends(verify_credentials),
+) -> RunListResponse:
+    """
+    Get finished runs, newest first, with duration, tokens, cost and exit code.
+    Requires authentication.
+    """
+    require_runs()
+    try:
+        found, next_cursor = await runs.search(
+            user=run_user(username, user),
+            session_id=session_id,
+            model=model,
+            status=status,
+            since=since,
+            until=until,
+            min_duration=min_duration,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+    return RunListResponse(runs=found, count=len(found), next_cursor=next_cursor)
+
+
+@router.get("/runs/stats", response_model=RunStatsResponse)
+async def run_stats(
+    since: datetime | None = Query(default=None, description="Window start (UTC, default: 24 hours ago)"),
+    until: datetime | None = Query(default=None, description="Window end (UTC, default: now)"),
+    bucket: int = Query(default=0, ge=0, description="Bucket size in seconds (0 = whole window)"),
+    user: str | None = Query(default=None, description="Only runs of this user (AUTH_USER only)"),
+    model: str | None = Query(default=None),
+    username: str = Depends(verify_credentials),
+) -> RunStatsResponse:
+    """
+    Get p50/p95 run duration and time to first token, error count, tokens
+    and cost per model and time bucket.
+    Requires authentication.
+    """
+    require_runs()
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=1)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if bucket and (until - since).total_seconds() / bucket > 10000:
+        raise HTTPException(status_code=400, detail="Too many buckets (max 10000)")
+
+    stats = await runs.stats(since, until, bucket, user=run_user(username, user), model=model)
+    return RunStatsResponse(since=since, until=until, bucket_seconds=bucket, stats=stats)
+
+
+@router.get("/runs/{run_id}/events", response_model=TranscriptEventsResponse)
+async def run_events(
+    run_id: str,
+    start: int = Query(default=0, ge=0, alias="from", description="Index of the first event"),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    username: str = Depends(verify_credentials),
+) -> TranscriptEventsResponse:
+    """
+    Get a range of a run's recorded output lines (the data of its message events).
+    Only output written by the transcript writer is returned while the run is active.
+    Requires authentication.
+    """
+    if not transcripts.enabled:
+        raise HTTPException(status_code=404, detail="Transcripts are disabled (TRANSCRIPTS_DIR)")
+
+    found = await transcripts.read(run_id, start, limit)
+    # Other users' transcripts are reported as missing, except to AUTH_USER
+    if found is None or not owns(username, found[0]["user"]):
+        raise HTTPException(status_code=404, detail=f"Transcript not found: {run_id}")
+
+    meta, total, events = found
+    end = start + len(events)
+    return TranscriptEventsResponse(
+        run_id=run_id,
+        user=meta["user"],
+        started_at=meta["started_at"],
+        finished_at=meta["finished_at"],
+        status=meta["status"],
+        complete=meta["complete"],
+        total=total,
+        next_from=end if end < total else None,
+        events=[TranscriptEvent(index=index, data=data) for index, data in events],
+    )
@@ -0,0 +1,51 @@
+"""Sessions list endpoint."""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.auth import is_admin, owns, verify_credentials
+from app.models import ErrorResponse, SessionInfo, SessionListResponse
+from app.process_manager import process_manager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["sessions"])
+
+
+@router.get("/sessions", response_model=SessionListResponse)
+async def list_sessions(
+    username: str = Depends(verify_credentials),
+) -> SessionListResponse:
+    """
+    Get sessions seen by this worker, most recently used first,
+    with turn latency and transcript size (of all users for AUTH_USER, otherwise the caller's).
+    Requires authentication.
+    """
+    logger.debug(f"User {username} requested session list")
+
+    sessions = await process_manager.describe_sessions(user=None if is_admin(username) else username)
+    return SessionListResponse(
+        sessions=sessions,
+        count=len(sessions),
+    )
+
+
+@router.get(
+    "/sessions/{session_id}",
+    response_model=SessionInfo,
+    responses={404: {"model": ErrorResponse}},
+)
+async def get_session(
+    session_id: str,
+    username: str = Depends(verify_credentials),
+) -> SessionInfo:
+    """
+    Get one session.
+    Requires authentication.
+    """
+    sessions = await process_manager.describe_sessions(session_id)
+    # Session IDs are resume tokens: other users' sessions are reported as missing
+    if not sessions or not owns(username, sessions[0].user):
+        raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
+    return sessions[0]
@@ -0,0 +1,28 @@
+"""API key usage endpoint."""
+
+import logging
+
+from fastapi import APIRouter, Depends
+
+from app.auth import is_admin, verify_credentials
+from app.models import KeyUsageResponse
+from app.users import users
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["auth"])
+
+
+@router.get("/auth/usage", response_model=KeyUsageResponse)
+async def key_usage(
+    username: str = Depends(verify_credentials),
+) -> KeyUsageResponse:
+    """
+    Get request counters of the caller's API keys on this worker
+    (of all users for AUTH_USER).
+    Requires authentication.
+    """
+    logger.debug(f"User {username} requested key usage")
+
+    keys = users.usage(None if is_admin(username) else username)
+    return KeyUsageResponse(keys=keys, count=len(keys))
@@ -0,0 +1,385 @@
+"""Run history: finished runs stored in SQLite for GET /runs and /runs/stats."""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any
+
+from app.config import get_settings
+from app.events import find_event
+from app.models import RunInfo, RunStats
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = (
+    "run_id", "user", "model", "cwd", "session_id", "started_at", "finished_at", "status", "exit_code",
+    "prompt_chars", "duration_seconds", "queue_seconds", "first_token_seconds", "num_turns", "cost_usd",
+    "input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens", "output_bytes",
+    "cpu_seconds", "peak_rss_bytes", "worker",
+)
+# Runs buffered before a flush is forced
+FLUSH_BATCH = 500
+# Seconds between deletions of runs past RUNS_RETENTION_DAYS
+PRUNE_INTERVAL = 3600.0
+
+
+def _timestamp(value: datetime) -> float:
+    """Unix time of a naive UTC (or aware) datetime."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _datetime(timestamp: float) -> datetime:
+    """Naive UTC datetime, like the rest of the API."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(p * len(values) + 0.5) - 1))]
+
+
+@dataclass
+class RunTracker:
+    """Collects what a run record needs while the stream is running."""
+
+    run_id: str
+    user: str
+    model: str | None
+    cwd: str
+    prompt_chars: int
+    started_at: datetime
+    created: float = field(default_factory=time.monotonic)
+    admitted: float | None = None
+    result: str | bytes | None = None
+
+    def output(self, item) -> None:
+        """Keep the result event (scanned for until found)."""
+        if self.result is None:
+            self.result = find_event(item, "result")
+
+
+class RunStore:
+    """
+    Finished runs in a SQLite database (WAL mode, shared by workers).
+
+    finish() only appends the record to a list; a writer task inserts
+    batches in a thread every RUNS_FLUSH_INTERVAL seconds, so the request
+    path never waits for the database.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._pending: list[tuple] = []
+        self._flushed = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._pruned = 0.0
+        self._worker_id = ""
+
+    def _open(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                user TEXT NOT NULL,
+                model TEXT,
+                cwd TEXT NOT NULL,
+                session_id TEXT,
+                started_at REAL NOT NULL,
+                finished_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                exit_code INTEGER,
+                prompt_chars INTEGER NOT NULL,
+                duration_seconds REAL NOT NULL,
+                queue_seconds REAL NOT NULL,
+                first_token_seconds REAL,
+                num_turns INTEGER,
+                cost_usd REAL,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                cache_read_tokens INTEGER,
+                cache_creation_tokens INTEGER,
+                output_bytes INTEGER NOT NULL,
+                cpu_seconds REAL NOT NULL,
+                peak_rss_bytes INTEGER NOT NULL,
+                worker TEXT
+            );
+            CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at, run_id);
+            CREATE INDEX IF NOT EXISTS runs_user ON runs (user, started_at);
+            CREATE INDEX IF NOT EXISTS runs_session ON runs (session_id, started_at);
+            CREATE INDEX IF NOT EXISTS runs_model ON runs (model, started_at);
+            """
+        )
+        self._conn.commit()
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        """Run a query under the connection lock (called in a thread)."""
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _insert(self, rows: list[tuple]) -> None:
+        """Insert a batch of runs and delete expired ones (called in a thread)."""
+        retention_days = get_settings().runs_retention_days
+        with self._db_lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO runs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+            now = time.time()
+            if retention_days > 0 and now - self._pruned > PRUNE_INTERVAL:
+                self._pruned = now
+                self._conn.execute("DELETE FROM runs WHERE started_at < ?", (now - retention_days * 86400,))
+            self._conn.commit()
+
+    async def start(self, worker_id: str) -> None:
+        """Open the database and start the writer task (if RUNS_PATH is set)."""
+        path = get_settings().runs_path
+        if not path:
+            return
+        self._worker_id = worker_id
+        await asyncio.to_thread(self._open, path)
+        self.enabled = True
+        self._writer = asyncio.create_task(self._write_loop())
+        logger.info(f"Run history at {path}")
+
+    async def stop(self) -> None:
+        """Write pending runs and close the database."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        if self._writer:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        await self._flush()
+        await asyncio.to_thread(self._close)
+
+    def _close(self) -> None:
+        with self._db_lock:
+            self._conn.close()
+            self._conn = None
+
+    async def _write_loop(self) -> None:
+        interval = get_settings().runs_flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._flushed.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flushed.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        try:
+            await asyncio.to_thread(self._insert, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Could not write {len(rows)} runs to the run history: {e}")
+
+    def track(self, run_id: str, request, user: str, started_at: datetime) -> RunTracker | None:
+        """Start collecting a run, None if the run history is disabled."""
+        if not self.enabled:
+            return None
+        return RunTracker(
+            run_id=run_id,
+            user=user,
+            model=request.model,
+            cwd=request.cwd,
+            prompt_chars=len(request.prompt),
+            started_at=started_at,
+        )
+
+    def finish(
+        self,
+        run: RunTracker | None,
+        status: str,
+        session_id: str | None,
+        exit_code: int | None,
+        first_token: float | None,
+        output_bytes: int,
+        cpu_seconds: float,
+        peak_rss_bytes: int,
+    ) -> None:
+        """Queue the record of a finished run for writing."""
+        if run is None or not self.enabled:
+            return
+
+        result: dict[str, Any] = {}
+        if run.result is not None:
+            try:
+                result = json.loads(run.result)
+            except ValueError:
+                logger.warning(f"Run {run.run_id}: unparseable result event")
+        if status == "completed":
+            if not result:
+                status = "failed"
+            else:
+                status = "error" if result.get("is_error") or result.get("subtype") != "success" else "success"
+        usage = result.get("usage") or {}
+
+        now = time.monotonic()
+        started = _timestamp(run.started_at)
+        self._pending.append((
+            run.run_id,
+            run.user,
+            run.model,
+            run.cwd,
+            session_id,
+            started,
+            started + (now - run.created),
+            status,
+            exit_code,
+            run.prompt_chars,
+            now - run.created,
+            (run.admitted or now) - run.created,
+            first_token,
+            result.get("num_turns"),
+            result.get("total_cost_usd"),
+            usage.get("input_tokens"),
+            usage.get("output_tokens"),
+            usage.get("cache_read_input_tokens"),
+            usage.get("cache_creation_input_tokens"),
+            output_bytes,
+            cpu_seconds,
+            peak_rss_bytes,
+            self._worker_id,
+        ))
+        if len(self._pending) >= FLUSH_BATCH:
+            self._flushed.set()
+
+    async def search(
+        self,
+        user: str | None = None,
+        session_id: str | None = None,
+        model: str | None = None,
+        status: str | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        min_duration: float | None = None,
+        limit: int = 50,
+        cursor: str | None = None,
+    ) -> tuple[list[RunInfo], str | None]:
+        """
+        Get runs matching the filters, newest first, and the cursor of the next page.
+        Raises ValueError for an invalid cursor.
+        """
+        conditions, params = self._filters(user, session_id, model, since, until)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if min_duration is not None:
+            conditions.append("duration_seconds >= ?")
+            params.append(min_duration)
+        if cursor:
+            started, _, run_id = cursor.partition(":")
+            conditions.append("(started_at, run_id) < (?, ?)")
+            params.extend((float(started), run_id))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = await asyncio.to_thread(
+            self._query,
+            f"SELECT {', '.join(COLUMNS)} FROM runs {where} ORDER BY started_at DESC, run_id DESC LIMIT ?",
+            (*params, limit + 1),
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][5]!r}:{rows[-1][0]}"
+        runs = []
+        for row in rows:
+            data = dict(zip(COLUMNS, row))
+            data["started_at"] = _datetime(data["started_at"])
+            data["finished_at"] = _datetime(data["finished_at"])
+            runs.append(RunInfo(**data))
+        return runs, next_cursor
+
+    def _filters(
+        self,
+        user: str | None,
+        session_id: str | None,
+        model: str | None,
+        since: datetime | None,
+        until: datetime | None,
+    ) -> tuple[list[str], list]:
+        conditions: list[str] = []
+        params: list = []
+        for column, value in (("user", user), ("session_id", session_id), ("model", model)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("started_at >= ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            conditions.append("started_at < ?")
+            params.append(_timestamp(until))
+        return conditions, params
+
+    async def stats(
+        self,
+        since: datetime,
+        until: datetime,
+        bucket_seconds: int,
+        user: str | None = None,
+        model: str | None = None,
+    ) -> list[RunStats]:
+        """
+        Get p50/p95 duration and time to first token, errors, tokens and cost
+        per model and time bucket (buckets start at multiples of bucket_seconds;
+        one bucket for the whole window if bucket_seconds is 0).
+        """
+        conditions, params = self._filters(user, None, model, since, until)
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT model, started_at, status, duration_seconds, first_token_seconds, "
+            "input_tokens, output_tokens, cost_usd "
+            f"FROM runs WHERE {' AND '.join(conditions)} AND status != 'rejected'",
+            tuple(params),
+        )
+
+        start = _timestamp(since)
+        groups: dict[tuple[str | None, float], list[tuple]] = {}
+        for row in rows:
+            bucket = row[1] // bucket_seconds * bucket_seconds if bucket_seconds else start
+            groups.setdefault((row[0], bucket), []).append(row)
+
+        stats = []
+        for (group_model, bucket), group in sorted(groups.items(), key=lambda item: (item[0][1], item[0][0] or "")):
+            durations = sorted(row[3] for row in group)
+            first_tokens = sorted(row[4] for row in group if row[4] is not None)
+            stats.append(RunStats(
+                model=group_model,
+                bucket_start=_datetime(bucket),
+                runs=len(group),
+                errors=sum(1 for row in group if row[2] not in ("success", "cancelled")),
+                p50_seconds=percentile(durations, 0.5),
+                p95_seconds=percentile(durations, 0.95),
+                p50_first_token_seconds=percentile(first_tokens, 0.5),
+                p95_first_token_seconds=percentile(first_tokens, 0.95),
+                input_tokens=sum(row[5] or 0 for row in group),
+                output_tokens=sum(row[6] or 0 for row in group),
+                cost_usd=sum(row[7] or 0.0 for row in group),
+            ))
+        return stats
+
+
+# Global run store instance
+runs = RunStore()
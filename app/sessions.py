@@ -0,0 +1,124 @@
+"""Registry of conversation sessions and their turn latency."""
+
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from app import metrics
+from app.config import get_settings
+from app.models import ChatRequest, SessionInfo
+
+logger = logging.getLogger(__name__)
+
+
+def transcript_path(cwd: str, session_id: str) -> Path:
+    """Get the path of the CLI transcript of a session (~/.claude/projects/<cwd>/<session>.jsonl)."""
+    config_dir = get_settings().claude_config_dir or os.environ.get("CLAUDE_CONFIG_DIR") or "~/.claude"
+    project = re.sub(r"[^a-zA-Z0-9]", "-", cwd)
+    return Path(config_dir).expanduser() / "projects" / project / f"{session_id}.jsonl"
+
+
+def transcript_size(cwd: str, session_id: str) -> int | None:
+    """Get the transcript size in bytes, None if it is not found."""
+    try:
+        return transcript_path(cwd, session_id).stat().st_size
+    except OSError:
+        return None
+
+
+@dataclass
+class SessionRecord:
+    """Gateway-side state of one session."""
+
+    session_id: str
+    cwd: str
+    model: str | None
+    user: str
+    created_at: datetime
+    last_used_at: datetime
+    turns: int = 0
+    hot_turns: int = 0
+    resume_turns: int = 0
+    total_seconds: float = 0.0
+    hot_seconds: float = 0.0
+    resume_seconds: float = 0.0
+    last_turn_seconds: float = 0.0
+
+
+class SessionRegistry:
+    """
+    Sessions seen by the gateway (LRU, up to SESSION_REGISTRY_MAX).
+    Turns are timed by how they ran: "new" (first turn), "resume" (CLI
+    started with --resume) or "hot" (written to the session's kept process).
+    """
+
+    def __init__(self):
+        self._sessions: OrderedDict[str, SessionRecord] = OrderedDict()
+
+    def record_turn(self, session_id: str, request: ChatRequest, user: str, seconds: float, mode: str) -> None:
+        """Record a completed turn of a session."""
+        now = datetime.utcnow()
+        record = self._sessions.get(session_id)
+        if record is None:
+            record = SessionRecord(
+                session_id=session_id,
+                cwd=request.cwd,
+                model=request.model,
+                user=user,
+                created_at=now,
+                last_used_at=now,
+            )
+            self._sessions[session_id] = record
+            while len(self._sessions) > get_settings().session_registry_max:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+
+        record.last_used_at = now
+        record.model = request.model
+        record.turns += 1
+        record.total_seconds += seconds
+        record.last_turn_seconds = seconds
+        if mode == "hot":
+            record.hot_turns += 1
+            record.hot_seconds += seconds
+        elif mode == "resume":
+            record.resume_turns += 1
+            record.resume_seconds += seconds
+
+        metrics.session_turn_seconds.observe(seconds, mode)
+        logger.debug(f"Session {session_id} turn {record.turns} ({mode}) took {seconds:.2f}s")
+
+    def get(self, session_id: str) -> SessionRecord | None:
+        return self._sessions.get(session_id)
+
+    def records(self) -> list[SessionRecord]:
+        """Get all sessions, most recently used first."""
+        return list(reversed(self._sessions.values()))
+
+    async def describe(self, records: list[SessionRecord], hot: set[str]) -> list[SessionInfo]:
+        """Build public session info, with transcript sizes read off the event loop."""
+        sizes = await asyncio.to_thread(lambda: [transcript_size(r.cwd, r.session_id) for r in records])
+        return [
+            SessionInfo(
+                session_id=r.session_id,
+                cwd=r.cwd,
+                model=r.model,
+                user=r.user,
+                created_at=r.created_at,
+                last_used_at=r.last_used_at,
+                turns=r.turns,
+                hot_turns=r.hot_turns,
+                hot=r.session_id in hot,
+                transcript_bytes=size,
+                last_turn_seconds=round(r.last_turn_seconds, 3),
+                avg_turn_seconds=round(r.total_seconds / r.turns, 3),
+                avg_hot_turn_seconds=round(r.hot_seconds / r.hot_turns, 3) if r.hot_turns else None,
+                avg_resume_turn_seconds=round(r.resume_seconds / r.resume_turns, 3) if r.resume_turns else None,
+            )
+            for r, size in zip(records, sizes)
+        ]
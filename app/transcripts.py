@@ -0,0 +1,383 @@
+"""
+Transcripts: the output lines of every run in gzip-compressed segments,
+with an index for reading any range of events (GET /runs/{run_id}/events).
+
+Per run, TRANSCRIPTS_DIR holds:
+- <run_id>.seg: gzip members of TRANSCRIPTS_SEGMENT_BYTES of output lines each,
+  and one member per oversized line, compressed while the client reads it
+  (the file as a whole is valid gzip, so zcat prints the full transcript)
+- <run_id>.idx: one fixed-size record per event (segment offset and length,
+  event offset and length inside the decompressed segment)
+- <run_id>.json: user, timestamps and status
+
+The event loop only collects lines; a writer thread compresses and writes
+segments. Readers map both files and decompress only the segments of the
+requested range.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from app import metrics
+from app.config import get_settings
+from app.line_reader import LongLine
+
+logger = logging.getLogger(__name__)
+
+# Index record: segment offset, compressed segment length, event offset and length in the segment
+RECORD = struct.Struct("<QIII")
+# Fastest gzip level: the writer thread shares the CPU with streaming (output is still about 4x smaller)
+COMPRESS_LEVEL = 1
+# Seconds between deletions of transcripts past TRANSCRIPTS_RETENTION_DAYS
+PRUNE_INTERVAL = 3600.0
+RUN_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class Recording:
+    """Output of one run being collected for its transcript."""
+
+    __slots__ = (
+        "run_id", "user", "started_at", "lines", "size", "opened", "dropped", "long_line",
+        "_store", "_segment_bytes",
+    )
+
+    def __init__(self, store: "TranscriptStore", run_id: str, user: str, segment_bytes: int):
+        self.run_id = run_id
+        self.user = user
+        self.started_at = datetime.utcnow()
+        self.lines: list[bytes] = []
+        self.size = 0
+        self.opened = False
+        self.dropped = False
+        # An oversized line is being read by the client
+        self.long_line = False
+        self._store = store
+        self._segment_bytes = segment_bytes
+
+    def add(self, item: str | bytes | LongLine) -> None:
+        """Record a decoded line, a raw block of lines or an oversized line."""
+        self._end_long_line()
+        if self.dropped:
+            return
+        if isinstance(item, str):
+            self._append(item.encode("utf-8"))
+        elif isinstance(item, LongLine):
+            # Read once by the client: its chunks are recorded as they pass
+            self.flush()
+            if self._submit(("long_start", self.run_id)):
+                self.long_line = True
+                item.tap(self._long_chunk)
+            return
+        else:
+            lines = item.split(b"\n")
+            if not lines[-1]:
+                lines.pop()
+            for line in lines:
+                self._append(line)
+        if self.size >= self._segment_bytes:
+            self.flush()
+
+    def _append(self, line: bytes) -> None:
+        self.lines.append(line)
+        self.size += len(line) + 1
+
+    def _long_chunk(self, chunk: bytes | None) -> None:
+        """Hand a chunk of the oversized line (None at its end) to the writer thread."""
+        if not self.long_line:
+            return
+        if chunk is None:
+            self._end_long_line()
+        elif not self._submit(("long_chunk", self.run_id, chunk)):
+            self.long_line = False
+
+    def _end_long_line(self) -> None:
+        if self.long_line:
+            self.long_line = False
+            self._submit(("long_end", self.run_id))
+
+    def _submit(self, job: tuple) -> bool:
+        """Queue a job (opening the transcript first), dropping the recording if the queue is full."""
+        if self.dropped:
+            return False
+        if not self.opened:
+            self.opened = self._store.submit(("open", self.run_id, self.user, self.started_at))
+        if not self.opened or not self._store.submit(job):
+            self.drop()
+            return False
+        return True
+
+    def flush(self) -> None:
+        """Hand the collected lines to the writer thread as one segment."""
+        self._end_long_line()
+        if not self.lines or self.dropped:
+            return
+        self._submit(("segment", self.run_id, self.lines))
+        self.lines = []
+        self.size = 0
+
+    def drop(self) -> None:
+        """Stop recording; the transcript keeps what was written and is marked incomplete."""
+        self.dropped = True
+        self.lines = []
+        metrics.transcripts_dropped.inc()
+        logger.warning(f"Transcript of run {self.run_id} dropped: writer queue full")
+
+
+@dataclass
+class _OpenTranscript:
+    """Files of a transcript being written (writer thread only)."""
+
+    meta: dict
+    segments: object
+    index: object
+    offset: int = 0
+    events: int = 0
+    # Compressor, line length and compressed length of an oversized line being written
+    long: object = None
+    long_size: int = 0
+    long_written: int = 0
+
+
+class TranscriptStore:
+    """
+    Transcripts of all runs in TRANSCRIPTS_DIR.
+
+    Recordings submit jobs to a bounded queue; a writer thread compresses
+    and appends them. When the queue is full, the recording is dropped
+    instead of blocking the stream.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._dir: Path | None = None
+        self._jobs: queue.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self._files: dict[str, _OpenTranscript] = {}
+        self._pruned = 0.0
+
+    def start(self) -> None:
+        """Start the writer thread (if TRANSCRIPTS_DIR is set)."""
+        settings = get_settings()
+        if not settings.transcripts_dir:
+            return
+        self._dir = Path(settings.transcripts_dir)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._jobs = queue.Queue(maxsize=settings.transcripts_queue_size)
+        self._thread = threading.Thread(target=self._write_loop, name="transcript-writer", daemon=True)
+        self._thread.start()
+        self.enabled = True
+        metrics.registry.gauge(
+            "transcript_queue_depth", "Transcript jobs waiting for the writer thread", self._jobs.qsize
+        )
+        logger.info(f"Transcripts in {self._dir}")
+
+    async def stop(self) -> None:
+        """Write queued segments and stop the writer thread."""
+        if not self.enabled:
+            return
+        self.enabled = False
+        await asyncio.to_thread(self._jobs.put, None)
+        await asyncio.to_thread(self._thread.join)
+
+    def submit(self, job: tuple) -> bool:
+        """Queue a job for the writer thread. Returns False if the queue is full."""
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            return False
+        return True
+
+    def record(self, run_id: str, user: str) -> Recording | None:
+        """Start recording a run, None if transcripts are disabled."""
+        if not self.enabled:
+            return None
+        return Recording(self, run_id, user, get_settings().transcripts_segment_bytes)
+
+    def finish(self, recording: Recording | None, status: str) -> None:
+        """Write the rest of a run's output and its final status."""
+        if recording is None or not self.enabled:
+            return
+        recording.flush()
+        if recording.opened:
+            self.submit(("close", recording.run_id, status, not recording.dropped))
+
+    def _path(self, run_id: str, suffix: str) -> Path:
+        return self._dir / f"{run_id}{suffix}"
+
+    def _write_meta(self, run_id: str, meta: dict) -> None:
+        path = self._path(run_id, ".json")
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, path)
+
+    def _write_loop(self) -> None:
+        """Writer thread: handle jobs until the stop sentinel."""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            try:
+                handler = {
+                    "open": self._open,
+                    "segment": self._segment,
+                    "long_start": self._long_start,
+                    "long_chunk": self._long_chunk,
+                    "long_end": self._long_end,
+                    "close": self._close,
+                }[job[0]]
+                handler(*job[1:])
+            except Exception as e:
+                logger.error(f"Could not write transcript of run {job[1]}: {e}")
+            if time.time() - self._pruned > PRUNE_INTERVAL:
+                self._prune()
+        for run_id in list(self._files):
+            self._close(run_id, None, False)
+
+    def _open(self, run_id: str, user: str, started_at: datetime) -> None:
+        meta = {
+            "run_id": run_id,
+            "user": user,
+            "started_at": started_at.isoformat(),
+            "finished_at": None,
+            "status": None,
+            "complete": False,
+        }
+        self._write_meta(run_id, meta)
+        self._files[run_id] = _OpenTranscript(
+            meta=meta,
+            segments=open(self._path(run_id, ".seg"), "ab"),
+            index=open(self._path(run_id, ".idx"), "ab"),
+        )
+
+    def _segment(self, run_id: str, lines: list[bytes]) -> None:
+        transcript = self._files.get(run_id)
+        if transcript is None:
+            return
+        compressed = gzip.compress(b"\n".join(lines) + b"\n", compresslevel=COMPRESS_LEVEL, mtime=0)
+        records = []
+        position = 0
+        for line in lines:
+            records.append(RECORD.pack(transcript.offset, len(compressed), position, len(line)))
+            position += len(line) + 1
+        # The segment is on disk before index records point to it
+        transcript.segments.write(compressed)
+        transcript.segments.flush()
+        transcript.index.write(b"".join(records))
+        transcript.index.flush()
+        transcript.offset += len(compressed)
+        transcript.events += len(lines)
+
+    def _long_start(self, run_id: str) -> None:
+        transcript = self._files.get(run_id)
+        if transcript is None:
+            return
+        # A gzip member of its own, so no more than a chunk is held in memory
+        transcript.long = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        transcript.long_size = 0
+        transcript.long_written = 0
+
+    def _long_chunk(self, run_id: str, chunk: bytes) -> None:
+        transcript = self._files.get(run_id)
+        if transcript is None or transcript.long is None:
+            return
+        transcript.long_size += len(chunk)
+        self._write_long(transcript, transcript.long.compress(chunk))
+
+    def _long_end(self, run_id: str) -> None:
+        transcript = self._files.get(run_id)
+        if transcript is None or transcript.long is None:
+            return
+        self._write_long(transcript, transcript.long.compress(b"\n") + transcript.long.flush())
+        transcript.long = None
+        transcript.segments.flush()
+        transcript.index.write(RECORD.pack(transcript.offset, transcript.long_written, 0, transcript.long_size))
+        transcript.index.flush()
+        transcript.offset += transcript.long_written
+        transcript.events += 1
+
+    @staticmethod
+    def _write_long(transcript: _OpenTranscript, data: bytes) -> None:
+        transcript.segments.write(data)
+        transcript.long_written += len(data)
+
+    def _close(self, run_id: str, status: str | None, complete: bool) -> None:
+        transcript = self._files.get(run_id)
+        if transcript is None:
+            return
+        # An oversized line cut off by a dropped recording keeps what was read
+        self._long_end(run_id)
+        del self._files[run_id]
+        transcript.segments.close()
+        transcript.index.close()
+        transcript.meta.update(
+            finished_at=datetime.utcnow().isoformat(),
+            status=status,
+            complete=complete,
+            events=transcript.events,
+        )
+        self._write_meta(run_id, transcript.meta)
+
+    def _prune(self) -> None:
+        """Delete transcripts of finished runs past the retention (writer thread)."""
+        self._pruned = time.time()
+        retention_days = get_settings().transcripts_retention_days
+        if retention_days <= 0:
+            return
+        cutoff = self._pruned - retention_days * 86400
+        for path in self._dir.iterdir():
+            try:
+                if path.stem not in self._files and path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+    async def read(self, run_id: str, start: int, limit: int) -> tuple[dict, int, list[tuple[int, str]]] | None:
+        """
+        Get a run's transcript metadata, its number of written events and the
+        events from index start (at most limit). None if there is no transcript.
+        """
+        if self._dir is None or not RUN_ID.match(run_id):
+            return None
+        return await asyncio.to_thread(self._read, run_id, start, limit)
+
+    def _read(self, run_id: str, start: int, limit: int) -> tuple[dict, int, list[tuple[int, str]]] | None:
+        try:
+            meta = json.loads(self._path(run_id, ".json").read_text())
+            index_file = open(self._path(run_id, ".idx"), "rb")
+        except (OSError, ValueError):
+            return None
+
+        with index_file:
+            total = os.fstat(index_file.fileno()).st_size // RECORD.size
+            if start >= total:
+                return meta, total, []
+            with mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+                records = [RECORD.unpack_from(index, i * RECORD.size) for i in range(start, min(total, start + limit))]
+
+        events = []
+        with open(self._path(run_id, ".seg"), "rb") as segment_file:
+            with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                segments: dict[int, bytes] = {}
+                for i, (offset, length, position, size) in enumerate(records, start):
+                    segment = segments.get(offset)
+                    if segment is None:
+                        segment = segments[offset] = gzip.decompress(data[offset:offset + length])
+                    events.append((i, segment[position:position + size].decode("utf-8", errors="replace")))
+        return meta, total, events
+
+
+# Global transcript store instance
+transcripts = TranscriptStore()
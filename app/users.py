@@ -0,0 +1,335 @@
+"""
+Users and API keys, with rate limits and usage counters per key.
+
+Besides AUTH_USER/AUTH_PASSWORD, users and keys can be listed in a JSON file
+(AUTH_USERS_FILE). Passwords are stored as scrypt hashes and API keys as
+SHA-256 hashes, generated with:
+
+    python -m app.users hash-password
+    python -m app.users generate-key --user alice --id ci
+"""
+
+import argparse
+import getpass
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from app.config import get_settings
+from app.models import KeyUsage
+
+logger = logging.getLogger(__name__)
+
+# scrypt cost parameters of password hashes (~50ms, paid once per cache TTL)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+KEY_PREFIX = "cc2a_"
+
+
+def hash_password(password: str) -> str:
+    """Hash a password as scrypt$<salt>$<digest>."""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.scrypt(password.encode("utf-8"), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    return f"scrypt${salt.hex()}${digest.hex()}"
+
+
+def check_password(password: str, stored: str) -> bool:
+    """Check a password against a hash from hash_password."""
+    try:
+        scheme, salt, digest = stored.split("$")
+        if scheme != "scrypt":
+            return False
+        actual = hashlib.scrypt(password.encode("utf-8"), salt=bytes.fromhex(salt), n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+    except ValueError:
+        return False
+    return secrets.compare_digest(actual.hex(), digest)
+
+
+def hash_key(token: str) -> str:
+    """Hash an API key. Keys are random, so a fast hash is enough."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class User:
+    """A user from AUTH_USERS_FILE (or AUTH_USER)."""
+
+    name: str
+    password_hash: str | None = None
+    # Concurrent processes of the user (0 = MAX_CONCURRENT_PER_USER)
+    max_concurrent: int = 0
+    # Defaults of the user's keys and password logins (0 = server default)
+    rate_per_minute: int = 0
+    daily_requests: int = 0
+
+
+@dataclass
+class ApiKey:
+    """An API key, identified by id and stored as a hash."""
+
+    id: str
+    user: str
+    key_hash: str
+    rate_per_minute: int = 0
+    daily_requests: int = 0
+
+
+@dataclass
+class Principal:
+    """An authenticated caller: a user through one of its keys (or its password)."""
+
+    user: str
+    key_id: str
+    rate_per_minute: int
+    daily_requests: int
+
+
+@dataclass
+class Usage:
+    """Request counters and rate limit state of one key."""
+
+    user: str
+    requests: int = 0
+    rejected: int = 0
+    day: str = ""
+    requests_today: int = 0
+    last_used_at: datetime | None = None
+    # Token bucket
+    tokens: float = -1.0
+    updated: float = field(default_factory=time.monotonic)
+
+
+class RateLimited(Exception):
+    """Raised when a key is over its rate limit or daily quota."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _seconds_to_midnight(now: datetime) -> int:
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+class UserStore:
+    """
+    Users and API keys with a cache of verified credentials.
+
+    API keys are looked up by hash in a dict, so the lookup time does not
+    depend on how much of a key matches. Password checks (scrypt) are slow
+    by design; a successful check is cached for AUTH_CACHE_TTL seconds under
+    a hash of the Authorization header, so repeated requests skip it.
+    The users file is reloaded when it changes (checked on cache misses).
+
+    Credentials are verified in FastAPI's threadpool: the cache, the loaded
+    users and the usage counters are only changed under a lock (password
+    checks run outside it).
+    """
+
+    def __init__(self):
+        self._users: dict[str, User] = {}
+        self._keys: dict[str, ApiKey] = {}
+        self._cache: OrderedDict[str, tuple[Principal, float]] = OrderedDict()
+        self._usage: dict[str, Usage] = {}
+        self._loaded_mtime: float | None = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load_if_changed(self) -> None:
+        """Load the users file on first use and whenever its mtime changes (called under the lock)."""
+        path = get_settings().auth_users_file
+        if not path:
+            self._loaded = True
+            return
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if not self._loaded:
+                logger.error(f"Users file {path} not readable: {e}")
+            self._loaded = True
+            return
+        if self._loaded and mtime == self._loaded_mtime:
+            return
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            users = {entry["name"]: User(**entry) for entry in data.get("users", [])}
+            keys = {}
+            for entry in data.get("api_keys", []):
+                key = ApiKey(
+                    id=entry["id"],
+                    user=entry["user"],
+                    key_hash=entry["sha256"],
+                    rate_per_minute=entry.get("rate_per_minute", 0),
+                    daily_requests=entry.get("daily_requests", 0),
+                )
+                keys[key.key_hash] = key
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.error(f"Could not load users file {path}, keeping previous users: {e}")
+            self._loaded = True
+            self._loaded_mtime = mtime
+            return
+
+        self._users = users
+        self._keys = keys
+        self._cache.clear()
+        self._loaded = True
+        self._loaded_mtime = mtime
+        logger.info(f"Loaded {len(users)} users and {len(keys)} API keys from {path}")
+
+    def _principal(self, user: User | None, name: str, key: ApiKey | None = None) -> Principal:
+        settings = get_settings()
+        user_rate = user.rate_per_minute if user else 0
+        user_daily = user.daily_requests if user else 0
+        return Principal(
+            user=name,
+            key_id=key.id if key else f"password:{name}",
+            rate_per_minute=(key.rate_per_minute if key else 0) or user_rate or settings.auth_rate_per_minute,
+            daily_requests=(key.daily_requests if key else 0) or user_daily or settings.auth_daily_requests,
+        )
+
+    def _verify_password(self, username: str, password: str) -> Principal | None:
+        settings = get_settings()
+        # The configured user is compared in plain text, like before users files existed
+        if secrets.compare_digest(username.encode("utf-8"), settings.auth_user.encode("utf-8")):
+            if secrets.compare_digest(password.encode("utf-8"), settings.auth_password.encode("utf-8")):
+                return self._principal(self._users.get(username), username)
+        user = self._users.get(username)
+        if user and user.password_hash and check_password(password, user.password_hash):
+            return self._principal(user, username)
+        return None
+
+    def _verify_key(self, token: str) -> Principal | None:
+        key = self._keys.get(hash_key(token))
+        if key is None:
+            return None
+        return self._principal(self._users.get(key.user), key.user, key)
+
+    def authenticate(self, scheme: str, credential: str) -> Principal | None:
+        """
+        Verify "basic" (user:password) or "bearer" (API key, or user:password)
+        credentials. Returns the principal, or None if they are invalid.
+        """
+        settings = get_settings()
+        cache_key = hashlib.sha256(f"{scheme}\0{credential}".encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                principal, expires = cached
+                if time.monotonic() < expires:
+                    return principal
+                del self._cache[cache_key]
+            self._load_if_changed()
+
+        principal = None
+        if scheme == "bearer":
+            principal = self._verify_key(credential)
+        if principal is None:
+            username, sep, password = credential.partition(":")
+            if sep:
+                principal = self._verify_password(username, password)
+
+        if principal is not None and settings.auth_cache_ttl > 0:
+            with self._lock:
+                self._cache[cache_key] = (principal, time.monotonic() + settings.auth_cache_ttl)
+                while len(self._cache) > settings.auth_cache_size:
+                    self._cache.popitem(last=False)
+        return principal
+
+    def admit(self, principal: Principal) -> None:
+        """
+        Count a request of the principal's key.
+        Raises RateLimited if the key is over its rate limit or daily quota.
+        """
+        with self._lock:
+            self._admit(principal)
+
+    def _admit(self, principal: Principal) -> None:
+        usage = self._usage.get(principal.key_id)
+        if usage is None:
+            usage = self._usage[principal.key_id] = Usage(user=principal.user)
+
+        now = datetime.now(timezone.utc)
+        today = now.date().isoformat()
+        if usage.day != today:
+            usage.day = today
+            usage.requests_today = 0
+
+        if principal.daily_requests and usage.requests_today >= principal.daily_requests:
+            usage.rejected += 1
+            raise RateLimited("Daily request quota exceeded", retry_after=_seconds_to_midnight(now))
+
+        if principal.rate_per_minute:
+            rate = principal.rate_per_minute / 60
+            clock = time.monotonic()
+            if usage.tokens < 0:
+                usage.tokens = principal.rate_per_minute
+            else:
+                usage.tokens = min(principal.rate_per_minute, usage.tokens + (clock - usage.updated) * rate)
+            usage.updated = clock
+            if usage.tokens < 1:
+                usage.rejected += 1
+                raise RateLimited("Rate limit exceeded", retry_after=max(1, int((1 - usage.tokens) / rate + 0.999)))
+            usage.tokens -= 1
+
+        usage.requests += 1
+        usage.requests_today += 1
+        usage.last_used_at = now
+
+    def max_concurrent(self, username: str) -> int:
+        """Get the user's concurrency limit (0 = not set)."""
+        user = self._users.get(username)
+        return user.max_concurrent if user else 0
+
+    def usage(self, username: str | None = None) -> list[KeyUsage]:
+        """Get usage counters of all keys, or of one user's keys."""
+        with self._lock:
+            items = sorted(self._usage.items())
+        return [
+            KeyUsage(
+                key_id=key_id,
+                user=usage.user,
+                requests=usage.requests,
+                requests_today=usage.requests_today,
+                rejected=usage.rejected,
+                last_used_at=usage.last_used_at,
+            )
+            for key_id, usage in items
+            if username is None or usage.user == username
+        ]
+
+
+# Global user store instance
+users = UserStore()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create entries for AUTH_USERS_FILE")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("hash-password", help="Hash a password for a users entry")
+    generate = commands.add_parser("generate-key", help="Generate an API key and its api_keys entry")
+    generate.add_argument("--user", required=True)
+    generate.add_argument("--id", required=True, help="Key name shown in usage counters")
+    args = parser.parse_args()
+
+    if args.command == "hash-password":
+        print(hash_password(getpass.getpass("Password: ")))
+        return
+
+    token = KEY_PREFIX + secrets.token_urlsafe(32)
+    print(f"API key (shown once): {token}")
+    print(json.dumps({"id": args.id, "user": args.user, "sha256": hash_key(token)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Warm pool of pre-spawned Claude Code processes."""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from app.claude import build_base_command, build_warm_command, spawn_claude, terminate_process
+from app.config import get_settings
+from app.models import ChatRequest, PoolStats
+
+logger = logging.getLogger(__name__)
+
+# Pool key: (user, cwd, base command without prompt)
+PoolKey = tuple[str, str, tuple[str, ...]]
+
+# Seconds between idle TTL checks
+REAP_INTERVAL = 5.0
+
+
+@dataclass
+class WarmProcess:
+    """Claude Code process started in stream-json input mode, waiting for a prompt."""
+
+    key: PoolKey
+    process: asyncio.subprocess.Process
+    created_at: float
+    last_used: float
+    uses: int = 0
+    # Session whose next turn this process is kept for (hot session)
+    session_id: str | None = None
+    stderr_task: asyncio.Task | None = field(default=None, repr=False)
+
+    @property
+    def alive(self) -> bool:
+        """Check if the subprocess is still running."""
+        return self.process.returncode is None
+
+
+class WarmPool:
+    """
+    Pool of idle Claude Code processes keyed by (user, cwd, command).
+    A process is only reused by the user it was started for.
+    Processes are spawned on demand after the first request for a key,
+    handed out to matching requests and retired after max uses or idle TTL.
+
+    With session affinity (SESSION_IDLE_WINDOW > 0), the process of a
+    finished turn is kept for its session instead, and the next turn of that
+    session is written to it without --resume. A session turn without such
+    a hot process runs in a new stdin process started with --resume, so it
+    can be kept for the turn after.
+    """
+
+    def __init__(self):
+        self._idle: dict[PoolKey, list[WarmProcess]] = {}
+        self._hot: dict[str, WarmProcess] = {}
+        self._commands: dict[PoolKey, list[str]] = {}
+        self._spawning: dict[PoolKey, int] = {}
+        self._lock = asyncio.Lock()
+        self._reaper: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self.retired = 0
+        self.session_hits = 0
+        self.session_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Check if the warm pool is enabled in settings."""
+        return get_settings().warm_pool_size > 0
+
+    @property
+    def sessions_enabled(self) -> bool:
+        """Check if processes are kept for the next turn of their session."""
+        return get_settings().session_idle_window > 0
+
+    @staticmethod
+    def make_key(request: ChatRequest, user: str) -> PoolKey | None:
+        """
+        Get pool key for a request of user.
+        Requests resuming a session are not pooled (resume is bound at spawn time).
+        """
+        if request.session_id:
+            return None
+        return user, request.cwd, tuple(build_base_command(request))
+
+    @property
+    def idle_count(self) -> int:
+        """Get count of idle processes across all keys."""
+        return sum(len(procs) for procs in self._idle.values())
+
+    async def acquire(self, request: ChatRequest, user: str) -> WarmProcess | None:
+        """
+        Take an idle process of user matching the request.
+        Returns None on a miss; a replacement is spawned in the background either way.
+        Requests resuming a session get their hot process (see acquire_session).
+        """
+        if request.session_id:
+            return await self.acquire_session(request, user)
+        if not self.enabled:
+            return None
+
+        key = self.make_key(request, user)
+        if key is None:
+            return None
+
+        warm = None
+        async with self._lock:
+            self._commands.setdefault(key, build_warm_command(request))
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate = idle.pop()
+                if candidate.alive:
+                    warm = candidate
+                    break
+                self.retired += 1
+
+            if warm:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        self._schedule_refill(key)
+
+        if warm:
+            warm.uses += 1
+            warm.last_used = time.monotonic()
+            logger.debug(f"Warm pool hit for {key[1]} (PID {warm.process.pid})")
+        else:
+            logger.debug(f"Warm pool miss for {key[1]}")
+        return warm
+
+    async def acquire_session(self, request: ChatRequest, user: str) -> WarmProcess | None:
+        """
+        Take the hot process of the request's session, or start a stdin process
+        resuming the session. Returns None if session affinity is disabled.
+        """
+        if not self.sessions_enabled:
+            return None
+
+        key = self.make_key(request.model_copy(update={"session_id": None, "fork_session": None}), user)
+        async with self._lock:
+            # A forked session has to start from the transcript. A hot process started
+            # for another user or other options is left alone for its own next turn.
+            hot = None if request.fork_session else self._hot.get(request.session_id)
+            if hot and hot.key == key:
+                del self._hot[request.session_id]
+            else:
+                hot = None
+
+        if hot and hot.alive:
+            self.session_hits += 1
+            hot.uses += 1
+            hot.last_used = time.monotonic()
+            logger.debug(f"Hot process PID {hot.process.pid} for session {request.session_id}")
+            return hot
+        if hot:
+            await self.retire(hot)
+
+        self.session_misses += 1
+        try:
+            process = await spawn_claude(build_warm_command(request), request.cwd, stdin=True)
+        except Exception as e:
+            logger.error(f"Failed to spawn session process in {request.cwd}: {e}")
+            return None
+
+        now = time.monotonic()
+        warm = WarmProcess(key=key, process=process, created_at=now, last_used=now, uses=1, session_id=request.session_id)
+        warm.stderr_task = asyncio.create_task(self._drain_stderr(warm))
+        self.spawned += 1
+        return warm
+
+    async def release(self, warm: WarmProcess, session_id: str | None = None) -> None:
+        """
+        Return a process to the pool after use, or retire it if it is used up.
+        With session affinity, a process that completed a turn of session_id
+        is kept for that session's next turn instead.
+        """
+        settings = get_settings()
+        if session_id and self.sessions_enabled and warm.alive:
+            await self._park_session(warm, session_id)
+            return
+
+        # A process holding a session's context never goes back to the shared pool
+        if warm.session_id or not warm.alive or warm.uses >= settings.warm_pool_max_uses:
+            await self.retire(warm)
+            return
+
+        async with self._lock:
+            if self.idle_count >= settings.warm_pool_max_total:
+                park = False
+            else:
+                self._idle.setdefault(warm.key, []).append(warm)
+                park = True
+
+        if park:
+            warm.last_used = time.monotonic()
+            logger.debug(f"Warm process PID {warm.process.pid} parked ({warm.uses} uses)")
+        else:
+            await self.retire(warm)
+
+    async def _park_session(self, warm: WarmProcess, session_id: str) -> None:
+        """
+        Keep a process for its session, evicting the least recently used over SESSION_HOT_MAX.
+        A hot process of the session kept for another user or other options stays;
+        the new one is retired instead.
+        """
+        evicted = []
+        async with self._lock:
+            previous = self._hot.get(session_id)
+            if previous is not None and previous is not warm and previous.key != warm.key:
+                evicted.append(warm)
+            else:
+                if previous is not None and previous is not warm:
+                    evicted.append(previous)
+                warm.session_id = session_id
+                warm.last_used = time.monotonic()
+                self._hot[session_id] = warm
+                while len(self._hot) > get_settings().session_hot_max:
+                    oldest = min(self._hot, key=lambda sid: self._hot[sid].last_used)
+                    evicted.append(self._hot.pop(oldest))
+                logger.debug(f"Process PID {warm.process.pid} kept for session {session_id}")
+
+        for process in evicted:
+            await self.retire(process)
+
+    def is_hot(self, session_id: str) -> bool:
+        """Check if a process is kept for the session."""
+        return session_id in self._hot
+
+    async def retire(self, warm: WarmProcess) -> None:
+        """Stop a warm process by closing its stdin."""
+        self.retired += 1
+        logger.debug(f"Retiring warm process PID {warm.process.pid} after {warm.uses} uses")
+        if warm.alive and warm.process.stdin:
+            warm.process.stdin.close()
+            try:
+                await asyncio.wait_for(warm.process.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                await terminate_process(warm.process)
+        if warm.stderr_task:
+            warm.stderr_task.cancel()
+
+    def _schedule_refill(self, key: PoolKey) -> None:
+        """Spawn processes in the background until the key has warm_pool_size idle."""
+        settings = get_settings()
+        idle = len(self._idle.get(key, []))
+        pending = self._spawning.get(key, 0)
+        missing = settings.warm_pool_size - idle - pending
+        room = settings.warm_pool_max_total - self.idle_count - sum(self._spawning.values())
+        for _ in range(max(0, min(missing, room))):
+            self._spawning[key] = self._spawning.get(key, 0) + 1
+            asyncio.create_task(self._spawn(key))
+
+    async def _spawn(self, key: PoolKey) -> None:
+        """Spawn one warm process for the key and park it."""
+        cwd = key[1]
+        try:
+            process = await spawn_claude(self._commands[key], cwd, stdin=True)
+        except Exception as e:
+            logger.error(f"Failed to spawn warm process in {cwd}: {e}")
+            return
+        finally:
+            self._spawning[key] -= 1
+
+        now = time.monotonic()
+        warm = WarmProcess(key=key, process=process, created_at=now, last_used=now)
+        warm.stderr_task = asyncio.create_task(self._drain_stderr(warm))
+        self.spawned += 1
+
+        async with self._lock:
+            self._idle.setdefault(key, []).append(warm)
+
+        logger.info(f"Warm process PID {process.pid} ready in {cwd}")
+
+    async def _drain_stderr(self, warm: WarmProcess) -> None:
+        """Log stderr of a long-lived process so the pipe never fills up."""
+        try:
+            while True:
+                line = await warm.process.stderr.readline()
+                if not line:
+                    break
+                logger.warning(f"Claude stderr (PID {warm.process.pid}): {line.decode('utf-8', errors='ignore').rstrip()[:500]}")
+        except asyncio.CancelledError:
+            pass
+
+    async def _reap_loop(self) -> None:
+        """Periodically retire idle processes older than the idle TTL (or the session idle window)."""
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            settings = get_settings()
+            ttl = settings.warm_pool_idle_ttl
+            now = time.monotonic()
+            expired = []
+            async with self._lock:
+                for key, idle in self._idle.items():
+                    keep = []
+                    for warm in idle:
+                        if warm.alive and now - warm.last_used < ttl:
+                            keep.append(warm)
+                        else:
+                            expired.append(warm)
+                    self._idle[key] = keep
+                for session_id, warm in list(self._hot.items()):
+                    if not warm.alive or now - warm.last_used >= settings.session_idle_window:
+                        expired.append(self._hot.pop(session_id))
+            for warm in expired:
+                await self.retire(warm)
+
+    def start(self) -> None:
+        """Start background idle reaper."""
+        if (self.enabled or self.sessions_enabled) and self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop(self) -> None:
+        """Stop reaper and retire all idle processes."""
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+        async with self._lock:
+            idle = [warm for procs in self._idle.values() for warm in procs]
+            idle.extend(self._hot.values())
+            self._idle.clear()
+            self._hot.clear()
+        for warm in idle:
+            await self.retire(warm)
+
+    def stats(self) -> PoolStats:
+        """Get pool hit/miss counters."""
+        lookups = self.hits + self.misses
+        return PoolStats(
+            enabled=self.enabled,
+            idle=self.idle_count,
+            keys=len(self._commands),
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / lookups if lookups else 0.0,
+            spawned=self.spawned,
+            retired=self.retired,
+            hot_sessions=len(self._hot),
+            session_hits=self.session_hits,
+            session_misses=self.session_misses,
+        )
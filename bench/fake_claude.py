@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Claude Code CLI that emits realistic stream-json without calling the API.
+
+Point the gateway at it with CLAUDE_PATH=/path/to/bench/fake_claude.py. It accepts
+the flags the gateway passes (-p, --resume, --input-format stream-json,
+--include-partial-messages, --json-schema, ...) and answers every prompt with
+a scripted turn: system init, then for each tool round an assistant tool_use
+and a user tool_result, then the final assistant text and the result event.
+
+Tuning (environment, inherited from the gateway):
+    FAKE_CLAUDE_STARTUP            seconds before the first event (process start cost), default 0.2
+    FAKE_CLAUDE_LATENCY            seconds between events, default 0.02
+    FAKE_CLAUDE_TOOL_ROUNDS        tool_use/tool_result rounds per turn, default 3
+    FAKE_CLAUDE_TEXT_SIZE          bytes of assistant text, default 400
+    FAKE_CLAUDE_TOOL_RESULT_SIZE   bytes of each tool_result, default 4000
+    FAKE_CLAUDE_LARGE_RESULT_SIZE  bytes of a large tool_result, default 1000000
+    FAKE_CLAUDE_LARGE_RESULT_EVERY every Nth tool_result is large (0 = never), default 0
+    FAKE_CLAUDE_DELTA_SIZE         bytes per text_delta with --include-partial-messages, default 20
+    FAKE_CLAUDE_CPU_SECONDS        CPU seconds burnt per turn, default 0
+    FAKE_CLAUDE_ERROR_RATE         fraction of turns ending with an error result, default 0
+    FAKE_CLAUDE_SEED               random seed (per process), default none
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+VERSION = "2.0.0 (Fake Claude Code)"
+MODEL = "claude-sonnet-4-5-20250929"
+TOOLS = ["Task", "Bash", "Glob", "Grep", "Read", "Edit", "Write", "WebFetch", "TodoWrite", "WebSearch"]
+
+STARTUP = float(os.environ.get("FAKE_CLAUDE_STARTUP", "0.2"))
+LATENCY = float(os.environ.get("FAKE_CLAUDE_LATENCY", "0.02"))
+TOOL_ROUNDS = int(os.environ.get("FAKE_CLAUDE_TOOL_ROUNDS", "3"))
+TEXT_SIZE = int(os.environ.get("FAKE_CLAUDE_TEXT_SIZE", "400"))
+TOOL_RESULT_SIZE = int(os.environ.get("FAKE_CLAUDE_TOOL_RESULT_SIZE", "4000"))
+LARGE_RESULT_SIZE = int(os.environ.get("FAKE_CLAUDE_LARGE_RESULT_SIZE", "1000000"))
+LARGE_RESULT_EVERY = int(os.environ.get("FAKE_CLAUDE_LARGE_RESULT_EVERY", "0"))
+DELTA_SIZE = max(1, int(os.environ.get("FAKE_CLAUDE_DELTA_SIZE", "20")))
+CPU_SECONDS = float(os.environ.get("FAKE_CLAUDE_CPU_SECONDS", "0"))
+ERROR_RATE = float(os.environ.get("FAKE_CLAUDE_ERROR_RATE", "0"))
+
+WORDS = (
+    "the gateway streams stream-json events from the cli to the client while the "
+    "process reads files runs commands and edits code in the working directory"
+).split()
+
+out = sys.stdout.buffer
+tool_results = 0
+
+
+def flag(args: list[str], name: str) -> str | None:
+    """Get the value of a CLI flag."""
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def emit(event: dict) -> None:
+    """Write one stream-json line (compact, type first like the real CLI)."""
+    out.write(json.dumps(event, separators=(",", ":")).encode("utf-8") + b"\n")
+    out.flush()
+
+
+def text(size: int) -> str:
+    """Generate prose of about size bytes."""
+    words = []
+    length = 0
+    while length < size:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def usage(input_tokens: int, output_tokens: int) -> dict:
+    return {
+        "input_tokens": input_tokens,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 12000,
+        "output_tokens": output_tokens,
+        "service_tier": "standard",
+    }
+
+
+def assistant(session_id: str, content: list[dict]) -> dict:
+    return {
+        "type": "assistant",
+        "message": {
+            "model": MODEL,
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "content": content,
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": usage(4, 60),
+        },
+        "parent_tool_use_id": None,
+        "session_id": session_id,
+        "uuid": str(uuid.uuid4()),
+    }
+
+
+def stream_text(session_id: str, reply: str) -> None:
+    """Emit partial message events for the reply text (--include-partial-messages)."""
+    base = {"parent_tool_use_id": None, "session_id": session_id}
+    emit({"type": "stream_event", "event": {"type": "message_start", "message": {"model": MODEL}}, **base})
+    emit({"type": "stream_event", "event": {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, **base})
+    for i in range(0, len(reply), DELTA_SIZE):
+        delta = {"type": "text_delta", "text": reply[i:i + DELTA_SIZE]}
+        emit({"type": "stream_event", "event": {"type": "content_block_delta", "index": 0, "delta": delta}, **base})
+    emit({"type": "stream_event", "event": {"type": "content_block_stop", "index": 0}, **base})
+    emit({"type": "stream_event", "event": {"type": "message_stop"}, **base})
+
+
+def burn(seconds: float) -> None:
+    """Use CPU for the given number of seconds."""
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def turn(args: list[str], session_id: str, prompt: str) -> None:
+    """Answer one prompt."""
+    global tool_results
+    started = time.monotonic()
+    partial = "--include-partial-messages" in args
+
+    emit({
+        "type": "system",
+        "subtype": "init",
+        "cwd": os.getcwd(),
+        "session_id": session_id,
+        "tools": TOOLS,
+        "mcp_servers": [],
+        "model": flag(args, "--model") or MODEL,
+        "permissionMode": "bypassPermissions" if "--dangerously-skip-permissions" in args else "default",
+        "slash_commands": ["compact", "context", "cost", "init", "review"],
+        "apiKeySource": "none",
+        "claude_code_version": VERSION.split()[0],
+        "output_style": "default",
+        "agents": ["general-purpose"],
+        "uuid": str(uuid.uuid4()),
+    })
+
+    for round_ in range(TOOL_ROUNDS):
+        time.sleep(LATENCY)
+        tool_id = f"toolu_{uuid.uuid4().hex[:24]}"
+        path = os.path.join(os.getcwd(), f"src/module_{round_}.py")
+        emit(assistant(session_id, [{"type": "tool_use", "id": tool_id, "name": "Read", "input": {"file_path": path}}]))
+
+        time.sleep(LATENCY)
+        tool_results += 1
+        large = LARGE_RESULT_EVERY and tool_results % LARGE_RESULT_EVERY == 0
+        content = text(LARGE_RESULT_SIZE if large else TOOL_RESULT_SIZE)
+        emit({
+            "type": "user",
+            "message": {
+                "role": "user",
+                "content": [{"tool_use_id": tool_id, "type": "tool_result", "content": content, "is_error": False}],
+            },
+            "parent_tool_use_id": None,
+            "session_id": session_id,
+            "uuid": str(uuid.uuid4()),
+            "tool_use_result": {"type": "text", "file": {"filePath": path, "numLines": content.count(" ") // 10 + 1}},
+        })
+
+    burn(CPU_SECONDS)
+    time.sleep(LATENCY)
+    reply = f"Done: {prompt[:80]} " + text(TEXT_SIZE)
+    if partial:
+        stream_text(session_id, reply)
+    emit(assistant(session_id, [{"type": "text", "text": reply}]))
+
+    duration_ms = int((time.monotonic() - started) * 1000)
+    is_error = random.random() < ERROR_RATE
+    result = {
+        "type": "result",
+        "subtype": "error_during_execution" if is_error else "success",
+        "is_error": is_error,
+        "duration_ms": duration_ms,
+        "duration_api_ms": duration_ms,
+        "num_turns": TOOL_ROUNDS + 1,
+        "result": "" if is_error else reply,
+        "session_id": session_id,
+        "total_cost_usd": round(0.003 * (TOOL_ROUNDS + 1), 6),
+        "usage": usage(4 * (TOOL_ROUNDS + 1), 60 * (TOOL_ROUNDS + 1)),
+        "permission_denials": [],
+        "uuid": str(uuid.uuid4()),
+    }
+    if flag(args, "--json-schema") and not is_error:
+        result["structured_output"] = {"answer": reply[:80]}
+    emit(result)
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if "--version" in args:
+        print(VERSION)
+        return 0
+
+    seed = os.environ.get("FAKE_CLAUDE_SEED")
+    if seed is not None:
+        random.seed(seed)
+
+    time.sleep(STARTUP)
+    resume = flag(args, "--resume")
+    session_id = str(uuid.uuid4()) if resume is None or "--fork-session" in args else resume
+
+    if flag(args, "--input-format") == "stream-json":
+        # Warm process: one turn per user message on stdin, until stdin is closed
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            content = json.loads(line)["message"]["content"]
+            if isinstance(content, list):
+                content = "".join(block.get("text", "") for block in content)
+            turn(args, session_id, content)
+        return 0
+
+    turn(args, session_id, args[-1] if "-p" in args else "")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except (BrokenPipeError, KeyboardInterrupt):
+        sys.exit(1)
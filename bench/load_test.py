@@ -0,0 +1,523 @@
+"""
+Load test of the gateway against the fake Claude CLI (bench/fake_claude.py).
+
+Starts the gateway with CLAUDE_PATH pointing at the fake CLI (or targets a
+running one with --url), then ramps through concurrency levels. At each level
+N clients stream POST /chat requests back to back, a share of them is
+cancelled with DELETE /chat/{id} after the first event, and GET /processes is
+polled alongside. Reported per level:
+
+    ttfb        time from request to the first message event (p50/p99, ms)
+    events/s    SSE events received per second over all streams
+    cpu/stream  gateway CPU time per completed stream (ms)
+    rss/stream  gateway peak RSS growth over idle, divided by the concurrency
+    processes   GET /processes latency under load (p50/p99, ms)
+
+The highest level without errors and with p99 TTFB within --ttfb-slo is
+reported as the max sustainable concurrency. Results are saved as JSON;
+--compare prints the change against an earlier result and exits with 1 if a
+metric regressed by more than --tolerance.
+
+The fake CLI is tuned with FAKE_CLAUDE_* variables (see bench/fake_claude.py),
+gateway settings with --env, e.g.:
+
+    FAKE_CLAUDE_TOOL_RESULT_SIZE=20000 python bench/load_test.py \\
+        --concurrency 1,10,50,100,200 --env WARM_POOL_SIZE=4 --output results.json
+    python bench/load_test.py --compare results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+FAKE_CLI = Path(__file__).resolve().parent / "fake_claude.py"
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Metrics compared by --compare: (name, True if higher is better)
+COMPARED = [
+    ("ttfb_p50_ms", False),
+    ("ttfb_p99_ms", False),
+    ("events_per_second", True),
+    ("cpu_ms_per_stream", False),
+    ("rss_bytes_per_stream", False),
+    ("processes_p99_ms", False),
+]
+
+
+def percentile(values: list[float], p: float) -> float | None:
+    """Get the p-th percentile (nearest rank) of values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def ms(seconds: float | None) -> float | None:
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+@dataclass
+class StreamResult:
+    """Outcome of one POST /chat stream."""
+
+    ok: bool
+    ttfb: float | None = None
+    duration: float = 0.0
+    events: int = 0
+    bytes: int = 0
+    cancelled: bool = False
+    error: str | None = None
+
+
+@dataclass
+class LevelResult:
+    """Measurements of one concurrency level."""
+
+    concurrency: int
+    streams: int
+    errors: int
+    cancelled: int
+    wall_seconds: float
+    ttfb_p50_ms: float | None
+    ttfb_p99_ms: float | None
+    duration_p50_ms: float | None
+    duration_p99_ms: float | None
+    events_per_second: float
+    mb_per_second: float
+    cpu_ms_per_stream: float | None
+    rss_bytes_per_stream: int | None
+    peak_rss_bytes: int | None
+    processes_p50_ms: float | None
+    processes_p99_ms: float | None
+    sustainable: bool
+    error_samples: list[str] = field(default_factory=list)
+
+
+class SSEScanner:
+    """Finds event names in an SSE byte stream without splitting it into lines."""
+
+    def __init__(self):
+        self._tail = b""
+
+    def feed(self, data: bytes) -> list[str]:
+        buf = self._tail + data
+        names = []
+        pos = 0
+        while True:
+            i = buf.find(b"event:", pos)
+            if i < 0:
+                self._tail = buf[max(pos, len(buf) - 6):]
+                return names
+            if i > 0 and buf[i - 1] not in b"\r\n":
+                pos = i + 6
+                continue
+            end = buf.find(b"\n", i)
+            if end < 0:
+                self._tail = buf[max(i - 1, 0):]
+                return names
+            names.append(buf[i + 6:end].strip().decode())
+            pos = end
+
+
+class Client:
+    """Minimal HTTP/1.1 client (one connection per request) so the harness needs no extra packages."""
+
+    def __init__(self, url: str, user: str, password: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.auth = "Basic " + b64encode(f"{user}:{password}".encode()).decode()
+
+    async def open(self, method: str, path: str, body: dict | None = None):
+        """Send a request, return (status, headers, reader, writer) once headers are read."""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = (
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            f"Authorization: {self.auth}\r\nConnection: close\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n"
+        )
+        writer.write(head.encode() + payload)
+        await writer.drain()
+
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers, reader, writer
+
+    @staticmethod
+    async def body(reader: asyncio.StreamReader, headers: dict):
+        """Yield body chunks (chunked transfer encoding, Content-Length or until EOF)."""
+        if headers.get("transfer-encoding") == "chunked":
+            while True:
+                line = await reader.readline()
+                # Empty line: the connection was closed mid-body
+                if not line.strip():
+                    return
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    return
+                yield await reader.readexactly(size)
+                await reader.readexactly(2)
+        elif "content-length" in headers:
+            yield await reader.readexactly(int(headers["content-length"]))
+        else:
+            while chunk := await reader.read(65536):
+                yield chunk
+
+    async def request(self, method: str, path: str, body: dict | None = None) -> tuple[int, bytes]:
+        """Send a request and read the whole response."""
+        status, headers, reader, writer = await self.open(method, path, body)
+        try:
+            return status, b"".join([chunk async for chunk in self.body(reader, headers)])
+        finally:
+            writer.close()
+
+
+class GatewaySampler:
+    """Samples CPU time and RSS of the gateway process from /proc."""
+
+    def __init__(self, pid: int | None):
+        self.pid = pid
+        self.peak_rss = 0
+
+    def cpu(self) -> float | None:
+        if self.pid is None:
+            return None
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def rss(self) -> int | None:
+        if self.pid is None:
+            return None
+        with open(f"/proc/{self.pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+
+    async def watch(self, stop: asyncio.Event, interval: float = 0.1) -> None:
+        """Track peak RSS until stop is set."""
+        self.peak_rss = self.rss() or 0
+        while not stop.is_set():
+            self.peak_rss = max(self.peak_rss, self.rss() or 0)
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_stream(client: Client, args, cancel: bool) -> StreamResult:
+    """Run one POST /chat request and read its SSE stream to the end."""
+    started = time.perf_counter()
+    result = StreamResult(ok=False)
+    body = {"prompt": "Summarize the project layout", "cwd": args.cwd}
+    query = "?raw=true" if args.raw else ""
+    writer = None
+
+    async def exchange() -> None:
+        nonlocal writer
+        status, headers, reader, writer = await client.open("POST", f"/chat{query}", body)
+        if status != 200:
+            result.error = f"HTTP {status}"
+            return
+
+        scanner = SSEScanner()
+        cancel_task = None
+        last = None
+        async for chunk in client.body(reader, headers):
+            result.bytes += len(chunk)
+            for name in scanner.feed(chunk):
+                last = name
+                if name == "message":
+                    result.events += 1
+                    if result.ttfb is None:
+                        result.ttfb = time.perf_counter() - started
+                        if cancel:
+                            path = f"/chat/{headers.get('x-process-id')}"
+                            cancel_task = asyncio.create_task(client.request("DELETE", path))
+        if cancel_task:
+            status, _ = await cancel_task
+            # 404 if the process finished before the cancel arrived
+            result.cancelled = status == 200
+
+        if last == "error":
+            result.error = "error event"
+        elif last != "done" and not result.cancelled:
+            result.error = f"stream ended after {last!r}"
+        else:
+            result.ok = True
+
+    try:
+        await asyncio.wait_for(exchange(), args.timeout)
+    except asyncio.TimeoutError:
+        result.error = "timeout"
+    except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        if writer:
+            writer.close()
+        result.duration = time.perf_counter() - started
+    return result
+
+
+async def poll_processes(client: Client, stop: asyncio.Event, latencies: list[float]) -> None:
+    """Poll GET /processes until stop is set, recording latency."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            status, _ = await client.request("GET", "/processes")
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+
+
+async def run_level(client: Client, sampler: GatewaySampler, args, concurrency: int) -> LevelResult:
+    """Run concurrency clients with args.requests streams each."""
+    cancel_every = round(1 / args.cancel_ratio) if args.cancel_ratio > 0 else 0
+    counter = iter(range(1, 1 << 30))
+    results: list[StreamResult] = []
+
+    async def worker() -> None:
+        for _ in range(args.requests):
+            n = next(counter)
+            results.append(await run_stream(client, args, cancel=bool(cancel_every) and n % cancel_every == 0))
+
+    base_rss = sampler.rss()
+    stop = asyncio.Event()
+    latencies: list[float] = []
+    watcher = asyncio.create_task(sampler.watch(stop))
+    poller = asyncio.create_task(poll_processes(client, stop, latencies))
+
+    cpu = sampler.cpu()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    cpu = sampler.cpu() - cpu if cpu is not None else None
+
+    stop.set()
+    await asyncio.gather(watcher, poller)
+
+    ttfbs = [r.ttfb for r in results if r.ttfb is not None]
+    completed = [r for r in results if r.ok]
+    errors = [r for r in results if not r.ok]
+    ttfb_p99 = percentile(ttfbs, 99)
+    return LevelResult(
+        concurrency=concurrency,
+        streams=len(results),
+        errors=len(errors),
+        cancelled=sum(r.cancelled for r in results),
+        wall_seconds=round(wall, 3),
+        ttfb_p50_ms=ms(percentile(ttfbs, 50)),
+        ttfb_p99_ms=ms(ttfb_p99),
+        duration_p50_ms=ms(percentile([r.duration for r in completed], 50)),
+        duration_p99_ms=ms(percentile([r.duration for r in completed], 99)),
+        events_per_second=round(sum(r.events for r in results) / wall, 1),
+        mb_per_second=round(sum(r.bytes for r in results) / wall / 1024 / 1024, 2),
+        cpu_ms_per_stream=round(cpu / len(completed) * 1000, 2) if cpu is not None and completed else None,
+        rss_bytes_per_stream=(sampler.peak_rss - base_rss) // concurrency if base_rss is not None else None,
+        peak_rss_bytes=sampler.peak_rss or None,
+        processes_p50_ms=ms(percentile(latencies, 50)),
+        processes_p99_ms=ms(percentile(latencies, 99)),
+        sustainable=not errors and ttfb_p99 is not None and ttfb_p99 * 1000 <= args.ttfb_slo,
+        error_samples=sorted({r.error for r in errors if r.error})[:5],
+    )
+
+
+def start_gateway(args, tmp: Path) -> subprocess.Popen:
+    """Start the gateway with the fake CLI on a free port."""
+    # Run the fake CLI with this interpreter, not whatever python3 is first on PATH
+    cli = tmp / "claude"
+    cli.write_text(f'#!/bin/sh\nexec {sys.executable} {FAKE_CLI} "$@"\n')
+    cli.chmod(0o755)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    env = {
+        **os.environ,
+        "CLAUDE_PATH": str(cli),
+        "AUTH_USER": args.user,
+        "AUTH_PASSWORD": args.password,
+        "LOG_LEVEL": "WARNING",
+    }
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=(tmp / "gateway.log").open("wb"),
+        stderr=subprocess.STDOUT,
+    )
+    args.url = f"http://127.0.0.1:{port}"
+    return process
+
+
+async def wait_ready(client: Client, process: subprocess.Popen | None, log_path: Path) -> None:
+    """Wait until /health answers."""
+    for _ in range(100):
+        if process and process.poll() is not None:
+            sys.exit(f"Gateway exited:\n{log_path.read_text()[-3000:]}")
+        try:
+            status, _ = await client.request("GET", "/health")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+    sys.exit(f"Gateway did not start:\n{log_path.read_text()[-3000:]}" if process else f"No gateway at {client.host}:{client.port}")
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> bool:
+    """Print changes against a baseline result, return True if a metric regressed."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressed = False
+    print(f"\nCompared with {baseline['started_at']} ({baseline.get('git_commit') or 'unknown commit'}):")
+    for level in current["levels"]:
+        before = previous.get(level["concurrency"])
+        if not before:
+            continue
+        changes = []
+        for name, higher_is_better in COMPARED:
+            old, new = before.get(name), level.get(name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            mark = ""
+            if worse > tolerance:
+                mark = " REGRESSION"
+                regressed = True
+            changes.append(f"{name} {change:+.0%}{mark}")
+        print(f"  c={level['concurrency']:<4} " + ", ".join(changes))
+    print(f"  max sustainable concurrency: {baseline['max_sustainable_concurrency']} -> {current['max_sustainable_concurrency']}")
+    return regressed
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Target a running gateway instead of starting one")
+    parser.add_argument("--gateway-pid", type=int, help="PID of the gateway given by --url, for CPU/RSS")
+    parser.add_argument("--user", default="bench")
+    parser.add_argument("--password", default="bench")
+    parser.add_argument("--concurrency", default="1,10,50,100,200", help="Comma separated levels")
+    parser.add_argument("--requests", type=int, default=3, help="Streams per client at each level")
+    parser.add_argument("--cancel-ratio", type=float, default=0.1, help="Share of streams cancelled after the first event")
+    parser.add_argument("--raw", action="store_true", help="Use raw passthrough mode (POST /chat?raw=true)")
+    parser.add_argument("--ttfb-slo", type=float, default=1000, help="Max p99 TTFB (ms) of a sustainable level")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds per stream")
+    parser.add_argument("--keep-going", action="store_true", help="Run all levels even after one is not sustainable")
+    parser.add_argument("--cwd", help="Working directory sent with requests (temp dir if not set)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Gateway setting")
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="JSON", help="Compare with an earlier result")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative change counted as regression")
+    args = parser.parse_args()
+
+    # Each stream holds a few sockets and pipes on both sides
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    with tempfile.TemporaryDirectory() as tmp:
+        args.cwd = args.cwd or tmp
+        log_path = Path(tmp) / "gateway.log"
+        gateway = None
+        pid = args.gateway_pid
+        if not args.url:
+            args.env.insert(0, f"REGISTRY_PATH={Path(tmp) / 'registry.db'}")
+            gateway = start_gateway(args, Path(tmp))
+            pid = gateway.pid
+
+        client = Client(args.url, args.user, args.password)
+        sampler = GatewaySampler(pid)
+        try:
+            await wait_ready(client, gateway, log_path)
+            await run_stream(client, args, cancel=False)
+
+            report = {
+                "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "git_commit": git_commit(),
+                "config": {
+                    "url": args.url if gateway is None else None,
+                    "requests_per_client": args.requests,
+                    "cancel_ratio": args.cancel_ratio,
+                    "raw": args.raw,
+                    "ttfb_slo_ms": args.ttfb_slo,
+                    "gateway_env": args.env[1:] if gateway else args.env,
+                    "fake_cli": {k: v for k, v in os.environ.items() if k.startswith("FAKE_CLAUDE_")},
+                    "cpu_count": os.cpu_count(),
+                },
+                "levels": [],
+                "max_sustainable_concurrency": 0,
+            }
+
+            print(f"{'conc':>5} {'streams':>7} {'err':>4} {'ttfb p50':>9} {'p99':>8} {'ev/s':>9} {'MB/s':>7} "
+                  f"{'cpu/str':>8} {'rss/str':>9} {'/proc p99':>9}")
+            for concurrency in levels:
+                level = await run_level(client, sampler, args, concurrency)
+                report["levels"].append(asdict(level))
+                rss = f"{level.rss_bytes_per_stream / 1024:.0f}K" if level.rss_bytes_per_stream is not None else "-"
+                print(
+                    f"{concurrency:>5} {level.streams:>7} {level.errors:>4} {level.ttfb_p50_ms or 0:>7.1f}ms "
+                    f"{level.ttfb_p99_ms or 0:>6.1f}ms {level.events_per_second:>9.1f} {level.mb_per_second:>7.2f} "
+                    f"{level.cpu_ms_per_stream if level.cpu_ms_per_stream is not None else '-':>6}ms {rss:>9} "
+                    f"{level.processes_p99_ms or 0:>7.1f}ms"
+                )
+                for sample in level.error_samples:
+                    print(f"      error: {sample}")
+                if level.sustainable:
+                    report["max_sustainable_concurrency"] = concurrency
+                elif not args.keep_going:
+                    break
+        finally:
+            if gateway:
+                gateway.terminate()
+                gateway.wait(timeout=30)
+
+    print(f"max sustainable concurrency: {report['max_sustainable_concurrency']}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"saved {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,96 @@
+"""
+Benchmark SSE encoding path: default (decode + sse-starlette) vs raw passthrough.
+
+Runs a stand-in CLI that prints stream-json lines as fast as possible and
+measures throughput (MB/s) and gateway CPU time per MB for both paths.
+
+Usage:
+    python bench/sse_passthrough.py [--lines 20000] [--line-size 2000] [--big-every 100] [--big-size 1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("AUTH_USER", "bench")
+os.environ.setdefault("AUTH_PASSWORD", "bench")
+
+from sse_starlette.sse import ensure_bytes  # noqa: E402
+
+from app import config  # noqa: E402
+from app.models import ChatRequest  # noqa: E402
+from app.process_manager import process_manager  # noqa: E402
+from app.routes.chat import generate_raw_sse, generate_sse  # noqa: E402
+
+FAKE_CLI = """#!/usr/bin/env python3
+import json, sys
+lines, size, big_every, big_size = map(int, sys.argv[1:5])
+out = sys.stdout.buffer
+out.write(b'{"type":"system","subtype":"init","session_id":"bench"}\\n')
+for i in range(lines):
+    n = big_size if big_every and i % big_every == 0 else size
+    out.write(b'{"type":"user","message":{"content":[{"type":"tool_result","content":"' + b"x" * n + b'"}]}}\\n')
+out.write(b'{"type":"result","subtype":"success","result":"ok","session_id":"bench"}\\n')
+"""
+
+
+async def run_path(raw: bool) -> tuple[int, float, float]:
+    """Run one stream through the selected path, return (bytes, wall seconds, cpu seconds)."""
+    request = ChatRequest(prompt="bench", cwd=os.getcwd())
+    total = 0
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    process_id, stream = await process_manager.start_process(request, user="bench", raw=raw)
+    if raw:
+        async for chunk in generate_raw_sse(stream, process_id):
+            total += len(chunk)
+    else:
+        async for event in generate_sse(stream, process_id):
+            total += len(ensure_bytes(event, "\r\n"))
+
+    return total, time.perf_counter() - wall, time.process_time() - cpu
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--line-size", type=int, default=2000)
+    parser.add_argument("--big-every", type=int, default=100, help="Emit a big tool_result every N lines (0 = never)")
+    parser.add_argument("--big-size", type=int, default=1_000_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cli = Path(tmp) / "claude"
+        cli.write_text(FAKE_CLI)
+        cli.chmod(0o755)
+
+        # Stand-in CLI ignores gateway flags, parameters come first
+        wrapper = Path(tmp) / "claude-bench"
+        wrapper.write_text(
+            f"#!/bin/sh\nexec {sys.executable} {cli} {args.lines} {args.line_size} {args.big_every} {args.big_size}\n"
+        )
+        wrapper.chmod(0o755)
+        config._claude_info["path"] = str(wrapper)
+
+        for raw in (False, True):
+            name = "raw" if raw else "default"
+            results = [await run_path(raw) for _ in range(args.rounds)]
+            total = results[0][0]
+            wall = min(r[1] for r in results)
+            cpu = min(r[2] for r in results)
+            mb = total / 1024 / 1024
+            print(f"{name:8s} {mb:8.1f} MB  {mb / wall:8.1f} MB/s  {cpu / mb * 1000:7.2f} ms CPU/MB")
+
+
+if __name__ == "__main__":
+    import logging
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main())
@@ -263,6 +263,9 @@ Environment="PATH=$HOME/.local/bin:/usr/local/bin:/usr/bin:/bin"
 ExecStart=$INSTALL_DIR/venv/bin/uvicorn app.main:app --host 0.0.0.0 --port 9876
 Restart=always
 RestartSec=5
+# SIGTERM only the gateway, which drains running Claude processes (DRAIN_TIMEOUT) before exiting
+KillMode=mixed
+TimeoutStopSec=330
 
 [Install]
 WantedBy=multi-user.target
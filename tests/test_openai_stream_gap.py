@@ -0,0 +1,100 @@
+"""Slow OpenAI streaming clients under SLOW_CLIENT_POLICY=drop still get the full completion text."""
+
+import asyncio
+import json
+import os
+
+os.environ.setdefault("AUTH_USER", "test")
+os.environ.setdefault("AUTH_PASSWORD", "test")
+
+from app.backpressure import StreamBuffer  # noqa: E402
+from app.openai_compat import CompletionTranslator  # noqa: E402
+from app.routes.openai import generate_chunks  # noqa: E402
+
+SESSION = "11111111-2222-3333-4444-555555555555"
+WORDS = [f"word{i} " for i in range(12)]
+TEXT = "The quick " + "".join(WORDS) + "lazy dog"
+
+
+def line(data: dict) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def delta(text: str) -> str:
+    event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}
+    return line({"type": "stream_event", "event": event, "session_id": SESSION})
+
+
+def assistant(text: str) -> str:
+    return line({"type": "assistant", "message": {"content": [{"type": "text", "text": text}]}, "session_id": SESSION})
+
+
+def content_of(chunks: list[bytes]) -> str:
+    text = []
+    for chunk in chunks:
+        data = chunk.decode("utf-8").removeprefix("data: ").strip()
+        if data == "[DONE]" or data.startswith(":"):
+            continue
+        for choice in json.loads(data)["choices"]:
+            text.append(choice["delta"].get("content") or "")
+    return "".join(text)
+
+
+def test_translator_fills_in_text_missed_in_a_gap():
+    translator = CompletionTranslator("chatcmpl-test", "claude")
+    sent = [translator.feed(delta("The quick "))]
+    translator.gap()
+    # Deltas after the hole are skipped, the assistant message supplies the rest
+    sent.append(translator.feed(delta("lazy dog")))
+    sent.append(translator.feed(assistant(TEXT)))
+    assert "".join(text for text in sent if text) == TEXT
+
+
+def test_deltas_dropped_mid_stream_keep_full_content():
+    async def run() -> tuple[list[bytes], StreamBuffer]:
+        lines: asyncio.Queue = asyncio.Queue()
+
+        async def source():
+            while (item := await lines.get()) is not None:
+                yield item
+
+        async def settle():
+            for _ in range(50):
+                await asyncio.sleep(0)
+
+        buffer = StreamBuffer(source(), policy="drop", max_bytes=400)
+        translator = CompletionTranslator("chatcmpl-test", "claude")
+        chunks: list[bytes] = []
+        reading = asyncio.Event()
+        reading.set()
+
+        async def consume():
+            async for chunk in generate_chunks(buffer.stream(), translator, "test", "/tmp", [("user", "hi")], False):
+                chunks.append(chunk)
+                await reading.wait()
+
+        consumer = asyncio.create_task(consume())
+        lines.put_nowait(line({"type": "system", "subtype": "init", "session_id": SESSION}))
+        lines.put_nowait(line({"type": "stream_event", "event": {"type": "message_start"}, "session_id": SESSION}))
+        lines.put_nowait(delta("The quick "))
+        await settle()
+
+        # The client stalls: deltas beyond the buffer are dropped
+        reading.clear()
+        for word in WORDS:
+            lines.put_nowait(delta(word))
+            await settle()
+
+        # It catches up and receives deltas again before the message ends
+        reading.set()
+        await settle()
+        lines.put_nowait(delta("lazy dog"))
+        lines.put_nowait(assistant(TEXT))
+        lines.put_nowait(line({"type": "result", "subtype": "success", "result": TEXT, "session_id": SESSION}))
+        lines.put_nowait(None)
+        await consumer
+        return chunks, buffer
+
+    chunks, buffer = asyncio.run(run())
+    assert buffer.overflowed
+    assert content_of(chunks) == TEXT